@@ -0,0 +1,219 @@
+'''
+End-to-end load benchmark of main.main() against the Instagram stand-in.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Starts instagram_standin.py in-process, points the bot at it through
+INSTAGRAM_WWW_URL / INSTAGRAM_UPLOAD_URL and runs main.main() from an empty
+account until it has posted --posts digits. Everything the bot writes
+(login_details.json, caption_facts.json, rate_governor.json) goes to a
+scratch directory; the images are linked in from the repo.
+
+With --accounts N the stand-in serves N accounts and fleet.py posts --posts
+digits with each, one worker process per account (the stages are then timed
+in the workers' own logs).
+
+The rate governor is lifted (PI_RATE_SCALE) so the loop runs at full speed,
+--governed keeps the real limits. Reported: posts/sec, p50/p99 of every
+pipeline stage, the readiness delay, bytes on the wire, retries, 429s,
+cut-off uploads and double posts.
+
+EX USAGE:
+python bench_standin.py --posts 200
+python bench_standin.py --posts 100 --latency 0.05 --error-rate 0.02 --rate-limit 0.01 --transcode-delay 0.3
+python bench_standin.py --posts 50 --accounts 4 --latency 0.05
+python bench_standin.py --posts 50 --digits-per-post 10
+python bench_standin.py --posts 50 --drop-rate 0.2
+python bench_standin.py --posts 50 --error-rate 0.05 --count-lag 2
+
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from instagram_standin import StandinServer, account_username, add_config_arguments, config_from_arguments
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# PI_RATE_SCALE that lifts the rate governor's limits
+UNGOVERNED_SCALE = 1e7
+
+PASSWORD = '#PWD_INSTAGRAM_BROWSER:0:0:standin'
+
+
+def prepare_environment(server, args, workdir):
+    """Point the bot at the stand-in and run it from `workdir`"""
+    os.environ['INSTAGRAM_WWW_URL'] = server.url
+    os.environ['INSTAGRAM_UPLOAD_URL'] = server.url
+    os.environ['INSTAGRAM_USERNAME'] = args.username
+    os.environ['INSTAGRAM_ENCRYPTED_PASSWORD'] = PASSWORD
+    os.environ.setdefault('PI_DIGIT_FILE', os.path.join(REPO_DIR, 'pi.txt'))
+    if not args.governed:
+        os.environ['PI_RATE_SCALE'] = str(UNGOVERNED_SCALE)
+    images = os.path.join(workdir, 'images')
+    if not os.path.exists(images):
+        os.symlink(os.path.join(REPO_DIR, 'images'), images)
+    os.chdir(workdir)
+
+
+def target_index(args):
+    """Last index to post: --posts posts after the account's --media-count"""
+    # main posts indices IDX .. TARGET, from -1 on an empty account
+    return args.media_count + args.posts * args.digits_per_post - 2
+
+
+def write_manifest(args, workdir):
+    """accounts.json and credential files for the stand-in's accounts, logged in already"""
+    from get_credentials import get_login_session
+
+    entries = []
+    for number in range(args.accounts):
+        username = account_username(args.username, number)
+        name = f"account{number}"
+        credentials = os.path.join('accounts', f"{name}.env")
+        os.makedirs(os.path.join(workdir, 'accounts', name), exist_ok=True)
+        with open(os.path.join(workdir, credentials), 'w') as f:
+            f.write(f"INSTAGRAM_USERNAME={username}\nINSTAGRAM_ENCRYPTED_PASSWORD={PASSWORD}\n")
+        entries.append({'name': name, 'credentials': credentials, 'target': target_index(args),
+                        'digits_per_post': args.digits_per_post})
+
+        # Log in up front, the login page wait is no part of posting
+        os.chdir(os.path.join(workdir, 'accounts', name))
+        os.environ['INSTAGRAM_USERNAME'] = username
+        get_login_session()
+        os.chdir(workdir)
+
+    with open(os.path.join(workdir, 'accounts.json'), 'w') as f:
+        json.dump({'accounts': entries}, f, indent=2)
+    return os.path.join(workdir, 'accounts.json')
+
+
+def run_fleet(args, workdir):
+    """Post with every account through fleet.py, one worker process each"""
+    from fleet import Fleet, load_manifest
+
+    accounts = load_manifest(write_manifest(args, workdir))
+    Fleet(accounts, restart_delay=args.restart_delay, max_restarts=0).run()
+
+
+def run_main(args):
+    """Post with one account through main.main(), returns its pipeline"""
+    import main
+    from get_credentials import get_login_session
+
+    main.RESTART_DELAY = args.restart_delay
+    main.DIGITS_PER_POST = args.digits_per_post
+    main.TARGET = target_index(args)
+    get_login_session()
+    return main
+
+
+def run(args, workdir):
+    server = StandinServer(config_from_arguments(args)).start()
+    print(f"🧪 Instagram stand-in on {server.url}, working in {workdir}")
+    # The bot reads the URLs and rate scale when it is imported
+    prepare_environment(server, args, workdir)
+    from retry_policy import get_policy
+
+    if args.accounts > 1:
+        main = None
+        start_stats = server.stats.to_dict()
+        started = time.monotonic()
+        run_fleet(args, workdir)
+    else:
+        main = run_main(args)
+        start_stats = server.stats.to_dict()
+        started = time.monotonic()
+        main.main()
+    elapsed = time.monotonic() - started
+    stats = server.stats.to_dict()
+    with server.state.lock:
+        counts = {account.username: account.media_count for account in server.state.accounts.values()}
+    server.stop()
+
+    posts = stats['posts'] - start_stats['posts']
+    bytes_in = stats['bytes_in'] - start_stats['bytes_in']
+    bytes_out = stats['bytes_out'] - start_stats['bytes_out']
+    report = {
+        'accounts': counts,
+        'posts': posts,
+        'digits': stats['images'] - start_stats['images'],
+        'seconds': round(elapsed, 3),
+        'posts_per_second': round(posts / elapsed, 2) if elapsed else None,
+        'digits_per_second': round((stats['images'] - start_stats['images']) / elapsed, 2) if elapsed else None,
+        'stages': {},
+        'bytes_to_server': bytes_in,
+        'bytes_from_server': bytes_out,
+        'bytes_per_post': round((bytes_in + bytes_out) / posts) if posts else None,
+        'requests': stats['requests'],
+        'statuses': stats['statuses'],
+        # The workers of a fleet keep their own policies
+        'retries': get_policy().retries if main is not None else None,
+        'injected_errors': stats['injected_errors'],
+        'rate_limited': stats['injected_rate_limits'],
+        'dropped': stats['dropped'] - start_stats['dropped'],
+        'double_posts': stats['double_posts'],
+    }
+    if main is not None and main.PIPELINE is not None:
+        for name, stage in main.PIPELINE.stats.items():
+            report['stages'][name] = {
+                'count': stage.count,
+                'mean_ms': round(stage.mean * 1e3, 2),
+                'p50_ms': round(stage.percentile(0.5) * 1e3, 2),
+                'p99_ms': round(stage.percentile(0.99) * 1e3, 2),
+            }
+        report['readiness_delay'] = round(main.PIPELINE.readiness.metrics()['delay'], 3)
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📊 STAND-IN BENCHMARK")
+    print("=" * 60)
+    print(f"📮 {report['posts']} posts in {report['seconds']:.1f}s: {report['posts_per_second']} posts/sec")
+    if report['digits'] != report['posts']:
+        print(f"🎠 {report['digits']} digits: {report['digits_per_second']} digits/sec")
+    if len(report['accounts']) > 1:
+        print(f"👥 {json.dumps(report['accounts'])}")
+    for name, stage in report['stages'].items():
+        print(f"⏱️  {name:<9} p50 {stage['p50_ms']:>8.2f}ms  p99 {stage['p99_ms']:>8.2f}ms  "
+              f"avg {stage['mean_ms']:>8.2f}ms")
+    if 'readiness_delay' in report:
+        print(f"⏱️  readiness delay {report['readiness_delay']:.3f}s")
+    print(f"📡 {report['bytes_to_server']} bytes sent, {report['bytes_from_server']} received, "
+          f"{report['bytes_per_post']} per post")
+    print(f"📡 requests: {json.dumps(report['requests'])}")
+    retries = 'unknown' if report['retries'] is None else report['retries']
+    print(f"🔁 {retries} retries, {report['injected_errors']} injected errors, "
+          f"{report['rate_limited']} rate limited, {report['dropped']} uploads cut off, "
+          f"{report['double_posts']} double posts")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark main.main() against the Instagram stand-in")
+    parser.add_argument('--posts', type=int, default=100, help="posts to make with each account")
+    parser.add_argument('--digits-per-post', type=int, default=1, help="digits of one post, carousels above 1")
+    parser.add_argument('--governed', action='store_true', help="keep the rate governor's limits")
+    parser.add_argument('--restart-delay', type=float, default=1.0,
+                        help="seconds main waits before starting over after a failure")
+    parser.add_argument('--workdir', default=None, help="scratch directory (default: a new temporary one)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='pi_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    report = run(args, workdir)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    sys.exit(0 if report['posts'] >= args.posts * args.accounts else 1)
+
+
+# ENDOF FILE bench_standin.py
@@ -0,0 +1,206 @@
+'''
+Incremental facts about the posted digits, for richer captions.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+CaptionFacts is a small state machine over the digits posted so far: per
+digit counts and last positions, the current run and the longest run. Each
+posted digit is ingested in O(1) and the state is saved to
+caption_facts.json between runs. When the saved state does not line up with
+the next index (first run, deleted posts, a different file) it is rebuilt in
+bulk from the digit store, chunk by chunk.
+
+Indices follow get_pi_digit(): -1 is the leading "3", 0 is the decimal
+point (which breaks runs) and 1 is the first digit after it.
+
+'''
+import json
+import os
+
+from get_pi_digit import PREFIX_LENGTH, get_store
+
+STATE_FILE = 'caption_facts.json'
+
+DIGIT_NAMES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine"]
+
+# Characters processed per step while bootstrapping
+BOOTSTRAP_CHUNK_SIZE = 1 << 22
+
+# Only mention the gap since the last time a digit appeared past this many posts
+NOTABLE_GAP = 20
+
+
+def ordinal(n):
+    """
+    Format n as an ordinal with thousands separators (1st, 2nd, 100,012th).
+    """
+    if 10 <= n % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n:,}{suffix}"
+
+
+class CaptionFacts:
+    """Running statistics over the digits at indices -1 .. next_index - 1"""
+
+    def __init__(self, prefix_length=PREFIX_LENGTH):
+        self.prefix_length = prefix_length
+        self.reset()
+
+    def reset(self):
+        self.next_index = -self.prefix_length
+        self.counts = [0] * 10
+        self.last_seen = [None] * 10
+        self.run_digit = None
+        self.run_length = 0
+        self.run_start = None
+        self.longest_run = (0, None, None)
+
+    def to_dict(self):
+        return {
+            'next_index': self.next_index,
+            'counts': self.counts,
+            'last_seen': self.last_seen,
+            'run': [self.run_digit, self.run_length, self.run_start],
+            'longest_run': list(self.longest_run),
+            'prefix_length': self.prefix_length,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        facts = cls(data.get('prefix_length', PREFIX_LENGTH))
+        facts.next_index = data['next_index']
+        facts.counts = list(data['counts'])
+        facts.last_seen = list(data['last_seen'])
+        facts.run_digit, facts.run_length, facts.run_start = data['run']
+        facts.longest_run = tuple(data['longest_run'])
+        return facts
+
+    def facts_for(self, index, digit):
+        """
+        Facts about posting `digit` at `index` right after the current state,
+        without changing the state.
+        """
+        if index != self.next_index:
+            raise ValueError(f"Expected index {self.next_index}, got {index}")
+        first = index == -self.prefix_length
+        if digit == -1:
+            return {'index': index, 'digit': -1, 'first': first}
+
+        digit = int(digit)
+        run_length = self.run_length + 1 if self.run_digit == digit else 1
+        return {
+            'index': index,
+            'digit': digit,
+            'first': first,
+            'count': self.counts[digit] + 1,
+            'previous_index': self.last_seen[digit],
+            'gap': None if self.last_seen[digit] is None else index - self.last_seen[digit],
+            'run_length': run_length,
+            'longest_run': self.longest_run[0],
+            'new_longest_run': run_length > self.longest_run[0],
+        }
+
+    def ingest(self, index, digit):
+        """Add the digit posted at `index` (-1 for the decimal point) in O(1)"""
+        if index != self.next_index:
+            raise ValueError(f"Expected index {self.next_index}, got {index}")
+        self.next_index += 1
+        if digit == -1:
+            self.run_digit, self.run_length, self.run_start = None, 0, None
+            return
+
+        digit = int(digit)
+        self.counts[digit] += 1
+        self.last_seen[digit] = index
+        if self.run_digit == digit:
+            self.run_length += 1
+        else:
+            self.run_digit, self.run_length, self.run_start = digit, 1, index
+        if self.run_length > self.longest_run[0]:
+            self.longest_run = (self.run_length, digit, self.run_start)
+
+    def bootstrap(self, index, store=None):
+        """
+        Rebuild the state for indices -1 .. index - 1 from the digit store with
+        bulk bytes operations instead of ingesting digit by digit.
+        """
+        from pi_scan import LongestRunReducer
+
+        store = store if store is not None else get_store()
+        self.prefix_length = store.prefix_length
+        self.reset()
+        runs = LongestRunReducer()
+        summary = None
+        start = -store.prefix_length
+        while start < index:
+            chunk = bytes(store.get_pi_digits(start, min(BOOTSTRAP_CHUNK_SIZE, index - start)))
+            if not chunk:
+                break
+            for digit in range(10):
+                needle = str(digit).encode('ascii')
+                self.counts[digit] += chunk.count(needle)
+                last = chunk.rfind(needle)
+                if last != -1:
+                    self.last_seen[digit] = start + last
+            partial = runs.map(chunk, start, len(chunk))
+            summary = partial if summary is None else runs.merge(summary, partial)
+            start += len(chunk)
+
+        self.next_index = start
+        if summary is not None:
+            length, digit, position = summary['best']
+            if length:
+                self.longest_run = (length, int(digit), position)
+            tail_char, tail_length = summary['tail']
+            if tail_char.isdigit():
+                self.run_digit = int(tail_char)
+                self.run_length = tail_length
+                self.run_start = start - tail_length
+
+
+def load_facts(filename=STATE_FILE):
+    """Load the saved state, or a fresh one if there is none"""
+    try:
+        with open(filename, 'r') as f:
+            return CaptionFacts.from_dict(json.load(f))
+    except FileNotFoundError:
+        return CaptionFacts()
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        print(f"⚠️  Invalid state in {filename}, rebuilding caption facts")
+        return CaptionFacts()
+
+
+def save_facts(facts, filename=STATE_FILE):
+    """Save the state atomically"""
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(facts.to_dict(), f)
+    os.replace(temporary, filename)
+
+
+def render_caption(facts):
+    """
+    Turn the facts for one post into caption sentences, most notable first.
+    """
+    index, digit = facts['index'], facts['digit']
+    if facts.get('first'):
+        return "Hello World!"
+    if digit == -1:
+        return "The only dot in this number."
+
+    name = DIGIT_NAMES[digit]
+    sentences = [f"The digit at index {index} is {digit}."]
+    if facts['new_longest_run'] and facts['run_length'] > 1:
+        sentences.append(f"Longest run so far: {facts['run_length']} {name}s in a row!")
+    elif facts['run_length'] > 1:
+        sentences.append(f"The {ordinal(facts['run_length'])} {name} in a row.")
+    if facts['previous_index'] is not None and facts['gap'] > NOTABLE_GAP:
+        sentences.append(f"The first {name} since index {facts['previous_index']}.")
+    sentences.append(f"This is the {ordinal(facts['count'])} {name} so far.")
+    return " ".join(sentences)
+
+
+# ENDOF FILE caption_facts.py
\ No newline at end of file
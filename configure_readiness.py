@@ -0,0 +1,204 @@
+'''
+Adaptive wait between uploading an image and configuring the post.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Instagram needs a moment after the upload before the configure call is
+accepted, and answers "Transcode not finished yet." when it comes too
+early. Instead of a fixed sleep, ReadinessController tries the configure
+after the delay it has learned so far and backs off on "not ready".
+
+The learned delay is a quantile of a rolling histogram of readiness delays,
+the time from the end of the upload to the configure that was accepted.
+When the first try is accepted the post was ready earlier than that, so the
+sample is shrunk a little (PROBE_FACTOR) and the delay keeps probing down;
+when a retry is accepted the sample is the retry's delay.
+
+The histogram is exposed through ReadinessController.metrics() and
+get_readiness_metrics().
+
+EX USAGE:
+from configure_readiness import get_readiness
+for delay in get_readiness().schedule():
+    ...
+
+'''
+import bisect
+import collections
+import threading
+
+# Delay of the first try before anything has been learned
+INITIAL_DELAY = 0.5
+
+# Quantile of the histogram used as the delay of the first try
+READY_QUANTILE = 0.75
+
+# Accepted first tries are recorded at this fraction of their delay
+PROBE_FACTOR = 0.8
+
+# Retry delays after a "not ready" grow by RETRY_BACKOFF, from MIN_RETRY
+MIN_RETRY = 0.25
+RETRY_BACKOFF = 2.0
+
+# Seconds after the upload when configure is given up
+MAX_WAIT = 30.0
+
+# Samples kept in the rolling histogram
+WINDOW = 500
+
+# Upper bounds of the histogram buckets, in seconds: 50ms growing by 25%
+BUCKETS = tuple(round(0.05 * 1.25 ** i, 3) for i in range(29)) + (MAX_WAIT,)
+
+NOT_READY_MESSAGES = ('transcode not finished', 'not ready')
+
+
+def is_not_ready(response_json, status_code=None):
+    """Check whether a configure response means the upload is not ready yet"""
+    if status_code == 202:
+        return True
+    message = str(response_json.get('message', '')).lower()
+    return response_json.get('status') != 'ok' and any(text in message for text in NOT_READY_MESSAGES)
+
+
+class LatencyHistogram:
+    """
+    Bucketed histogram over the last `window` samples. Quantiles are
+    interpolated inside the bucket they fall in.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=WINDOW):
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self._samples = collections.deque()
+
+    def _bucket(self, seconds):
+        return bisect.bisect_left(self.buckets, seconds)
+
+    def observe(self, seconds):
+        self._samples.append(seconds)
+        self.counts[self._bucket(seconds)] += 1
+        self.total += 1
+        if len(self._samples) > self.window:
+            self.counts[self._bucket(self._samples.popleft())] -= 1
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        """Value below which a fraction `q` of the samples fall, None when empty"""
+        if not self._samples:
+            return None
+        rank = q * len(self._samples)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else max(self._samples)
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return max(self._samples)
+
+    def snapshot(self):
+        """The histogram as a dict, cumulative counts keyed by upper bound"""
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            cumulative[bound] = running
+        return {
+            'buckets': cumulative,
+            'count': len(self._samples),
+            'total': self.total,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+class ReadinessController:
+    """
+    Learns how long after an upload configure is accepted. schedule() gives
+    the delays (seconds after the upload) to try configure at, record()
+    feeds back the accepted one.
+    """
+
+    def __init__(self, histogram=None, quantile=READY_QUANTILE, initial_delay=INITIAL_DELAY,
+                 max_wait=MAX_WAIT):
+        self.histogram = histogram if histogram is not None else LatencyHistogram()
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.max_wait = max_wait
+        self.attempts = 0
+        self.not_ready = 0
+        self._lock = threading.Lock()
+
+    def first_delay(self):
+        with self._lock:
+            learned = self.histogram.quantile(self.quantile)
+        return self.initial_delay if learned is None else min(learned, self.max_wait)
+
+    def schedule(self):
+        """Delays after the upload to try configure at, until max_wait"""
+        delay = self.first_delay()
+        step = MIN_RETRY
+        while True:
+            yield delay
+            if delay >= self.max_wait:
+                return
+            delay = min(delay + step, self.max_wait)
+            step *= RETRY_BACKOFF
+
+    def record(self, elapsed, tries):
+        """Feed back the delay at which configure was accepted after `tries` tries"""
+        with self._lock:
+            self.attempts += tries
+            self.not_ready += tries - 1
+            self.histogram.observe(elapsed * PROBE_FACTOR if tries == 1 else elapsed)
+
+    def record_not_ready(self, tries):
+        """Feed back `tries` tries that all came too early"""
+        with self._lock:
+            self.attempts += tries
+            self.not_ready += tries
+
+    def metrics(self):
+        with self._lock:
+            snapshot = self.histogram.snapshot()
+            snapshot['delay'] = self.histogram.quantile(self.quantile)
+            snapshot['attempts'] = self.attempts
+            snapshot['not_ready'] = self.not_ready
+        if snapshot['delay'] is None:
+            snapshot['delay'] = self.initial_delay
+        return snapshot
+
+    def __str__(self):
+        m = self.metrics()
+        if not m['count']:
+            return f"readiness: no samples, delay {m['delay']:.2f}s"
+        return (f"readiness delay {m['delay']:.2f}s (p50 {m['p50']:.2f}s / p90 {m['p90']:.2f}s), "
+                f"{m['not_ready']} not ready in {m['attempts']} tries")
+
+
+_readiness = None
+_readiness_lock = threading.Lock()
+
+
+def get_readiness():
+    """Get the ReadinessController shared by every poster in the process"""
+    global _readiness
+    if _readiness is None:
+        with _readiness_lock:
+            if _readiness is None:
+                _readiness = ReadinessController()
+    return _readiness
+
+
+def get_readiness_metrics():
+    """Metrics of the shared ReadinessController"""
+    return get_readiness().metrics()
+
+
+# ENDOF FILE configure_readiness.py
@@ -0,0 +1,229 @@
+'''
+Registry of digit sources (pi, e, sqrt(2), phi, ...) and the shared cache of
+their open mappings.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Each source describes where its digits live and how the file is laid out:
+the number of digits before the decimal point, the file offset of the point
+and the file format ('auto' detects text, packed and .ycd like
+open_digit_store()). Positions follow get_pi_digit() for every constant:
+-1 is the last integer digit, 0 the point, 1 the first digit after it.
+
+Open stores are kept in one process-wide MappingCache. Once more than
+MAX_OPEN_STORES stores or MAX_MAPPED_BYTES of mappings are open, the least
+recently used stores are closed, so a process serving several 1 GB constants
+stays within its file handle and address space limits. A store that still
+has slices in use is skipped by the eviction and closed later, and so is a
+store pinned by an object that holds on to it (an index or a detector)
+until it is unpinned. The 'pi' store stays pinned while get_store() hands
+it out straight away, without the cache's lock; re-register 'pi' to switch
+it to another file.
+
+EX USAGE:
+E_DIGIT_FILE=e.txt python digit_sources.py e 100
+
+'''
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import get_pi_digit
+from get_pi_digit import FORMATS, PI_FILE, PREFIX_LENGTH, open_digit_store
+
+# Stores kept open at once, and the address space they may map together
+MAX_OPEN_STORES = int(os.getenv('DIGIT_MAX_OPEN_STORES', '8'))
+MAX_MAPPED_BYTES = int(os.getenv('DIGIT_MAX_MAPPED_BYTES', str(16 << 30)))
+
+
+class DigitSource:
+    """Where the digits of one constant live and how the file is laid out"""
+
+    def __init__(self, name, path, prefix_length=PREFIX_LENGTH, point_position=None,
+                 file_format='auto', env=None):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown digit file format: {file_format}")
+        self.name = name
+        self.default_path = path
+        self.prefix_length = prefix_length
+        self.point_position = point_position
+        self.file_format = file_format
+        self.env = env
+
+    @property
+    def path(self):
+        """The file to read, $<env> when that is set"""
+        if self.env:
+            return os.getenv(self.env, self.default_path)
+        return self.default_path
+
+    def cache_key(self):
+        return (self.path, self.file_format, self.prefix_length, self.point_position)
+
+    def open(self):
+        return open_digit_store(self.path, file_format=self.file_format,
+                                prefix_length=self.prefix_length, point_position=self.point_position)
+
+    def __repr__(self):
+        return f"DigitSource({self.name!r}, {self.path!r}, format={self.file_format!r})"
+
+
+SOURCES = {}
+
+
+def register_source(name, path, prefix_length=PREFIX_LENGTH, point_position=None, file_format='auto',
+                    env=None):
+    """Add (or replace) a digit source and return it"""
+    source = DigitSource(name, path, prefix_length, point_position, file_format, env)
+    SOURCES[name] = source
+    if name == 'pi' and get_pi_digit._pi_store is not None:
+        _set_pi_store(None)
+    return source
+
+
+def get_source(name):
+    try:
+        return SOURCES[name]
+    except KeyError:
+        raise KeyError(f"Unknown digit source: {name} (known: {', '.join(SOURCES)})") from None
+
+
+register_source('pi', PI_FILE, env='PI_DIGIT_FILE')
+register_source('e', 'e.txt', env='E_DIGIT_FILE')
+register_source('sqrt2', 'sqrt2.txt', env='SQRT2_DIGIT_FILE')
+register_source('phi', 'phi.txt', env='PHI_DIGIT_FILE')
+
+
+class MappingCache:
+    """
+    LRU cache of open digit stores, bounded by the number of stores and the
+    total size of their mappings.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_STORES, max_bytes=MAX_MAPPED_BYTES):
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        self._stores = OrderedDict()
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stores)
+
+    @property
+    def mapped_bytes(self):
+        return sum(store.mapped_bytes for store in self._stores.values())
+
+    def get(self, source):
+        """Get the open store for `source`, opening it (and evicting others) if needed"""
+        key = source.cache_key()
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None and not store.closed:
+                self._stores.move_to_end(key)
+                return store
+            self._stores.pop(key, None)
+            store = source.open()
+            self._stores[key] = store
+            self._evict(keep=key)
+            return store
+
+    def pin(self, store):
+        """Keep `store` open through evictions until it is unpinned as often"""
+        with self._lock:
+            self._pins[store] = self._pins.get(store, 0) + 1
+
+    def unpin(self, store):
+        with self._lock:
+            pins = self._pins.get(store, 0) - 1
+            if pins > 0:
+                self._pins[store] = pins
+            else:
+                self._pins.pop(store, None)
+
+    def _evict(self, keep):
+        """Close least recently used stores until the limits are met"""
+        for key in list(self._stores):
+            if len(self._stores) <= self.max_open and self.mapped_bytes <= self.max_bytes:
+                return
+            store = self._stores[key]
+            if key == keep or store in self._pins:
+                continue
+            try:
+                store.close()
+            except BufferError:
+                continue
+            del self._stores[key]
+
+    def close(self):
+        """Close every store that is not in use"""
+        with self._lock:
+            for key, store in list(self._stores.items()):
+                if store in self._pins:
+                    continue
+                try:
+                    store.close()
+                except BufferError:
+                    continue
+                del self._stores[key]
+
+
+_cache = MappingCache()
+_pi_store_lock = threading.Lock()
+
+
+def get_mapping_cache():
+    return _cache
+
+
+def pin_store(store):
+    """Keep a store of the shared cache open while an object holds it"""
+    _cache.pin(store)
+
+
+def unpin_store(store):
+    _cache.unpin(store)
+
+
+def get_source_store(name):
+    """Get the open store of a registered source from the shared cache"""
+    store = _cache.get(get_source(name))
+    if name == 'pi':
+        _set_pi_store(store)
+    return store
+
+
+def _set_pi_store(store):
+    """Hand `store` out from get_store() without the cache, pinned until it is replaced"""
+    with _pi_store_lock:
+        previous = get_pi_digit._pi_store
+        if previous is store:
+            return
+        if store is not None:
+            _cache.pin(store)
+        get_pi_digit._pi_store = store
+        if previous is not None:
+            _cache.unpin(previous)
+
+
+def get_store_for_path(path, file_format='auto', prefix_length=PREFIX_LENGTH, point_position=None):
+    """Get the open store for an unregistered file from the shared cache"""
+    return _cache.get(DigitSource(path, path, prefix_length, point_position, file_format))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"Usage: python digit_sources.py <{'|'.join(SOURCES)}> <position>")
+        sys.exit(1)
+
+    name, position = sys.argv[1], int(sys.argv[2])
+    digit = get_source_store(name).get_pi_digit(position)
+    if digit is not None:
+        print(f"The digit of {name} at position {position} is: {digit}")
+    else:
+        print(f"No digit found at position {position}.")
+
+
+# ENDOF FILE digit_sources.py
\ No newline at end of file
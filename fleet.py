@@ -0,0 +1,356 @@
+'''
+Run a fleet of accounts from one manifest, one worker process per account.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The manifest (PI_ACCOUNTS, default accounts.json) lists the accounts:
+{
+  "accounts": [
+    {"name": "pi", "credentials": "accounts/pi.env"},
+    {"name": "pi-upper", "credentials": "accounts/pi-upper.env", "first": 5000000, "target": 9999999},
+    {"name": "e", "credentials": "accounts/e.env", "constant": "e", "digits_per_post": 10}
+  ]
+}
+- credentials: .env file with the account's INSTAGRAM_USERNAME and
+  INSTAGRAM_ENCRYPTED_PASSWORD
+- constant: digit source to post (see digit_sources.py), default pi
+- first: index of the account's first post, default -1 (the leading digit)
+- target: last index to post, default main.TARGET
+- digits_per_post: digits of one post, more than one posts carousels,
+  default main.DIGITS_PER_POST
+- state_dir: the account's login_details.json, caption_facts.json,
+  post_layout.json and rate_governor.json, default accounts/<name>
+Relative paths are relative to the manifest.
+
+Each account runs main.main() in its own spawned process, started in its
+state_dir, so it has its own session, rate governor, retry policy,
+readiness and caption checkpoint. The digit files and the image pack are
+memory-mapped by every worker from the same absolute paths and share one
+copy in the page cache (pi accounts also share the digit daemon when it
+runs). Nothing is shared that would throttle the accounts against each
+other, so posts per hour grow with the number of accounts.
+
+With --node i/n (or PI_FLEET_NODE=i/n) a node only runs accounts i, i + n,
+i + 2n, ... of the manifest, so n nodes with the same manifest split the
+fleet. A worker that stops before its target is restarted after
+RESTART_DELAY, at most MAX_RESTARTS times.
+
+EX USAGE:
+python fleet.py                  # every account of accounts.json
+python fleet.py --node 0/2       # the other node runs --node 1/2
+python fleet.py --list
+
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from dotenv import dotenv_values
+
+from post_layout import MAX_DIGITS_PER_POST
+
+MANIFEST_PATH = os.getenv('PI_ACCOUNTS', 'accounts.json')
+
+CREDENTIAL_KEYS = ('INSTAGRAM_USERNAME', 'INSTAGRAM_ENCRYPTED_PASSWORD')
+
+# Seconds before a stopped worker is started again, and how often
+RESTART_DELAY = 300
+MAX_RESTARTS = 10
+
+# Seconds between checks of the workers
+POLL_INTERVAL = 1.0
+
+# Exit code of a worker that must not be restarted (bad credentials or manifest entry)
+FATAL_EXIT = 2
+
+_NAME = re.compile(r'^[\w.-]+$')
+
+
+class ManifestError(ValueError):
+    """Raised when the account manifest is invalid"""
+
+
+class Account:
+    """One account of the manifest, with absolute paths"""
+
+    def __init__(self, name, credentials, constant='pi', first=-1, target=None, state_dir=None,
+                 digits_per_post=None):
+        self.name = name
+        self.credentials = credentials
+        self.constant = constant
+        self.first = first
+        self.target = target
+        self.state_dir = state_dir
+        self.digits_per_post = digits_per_post
+
+    @classmethod
+    def from_dict(cls, entry, base_dir='.'):
+        if not isinstance(entry, dict):
+            raise ManifestError(f"Account entries must be objects, got {entry!r}")
+        unknown = set(entry) - {'name', 'credentials', 'constant', 'first', 'target', 'state_dir', 'digits_per_post'}
+        if unknown:
+            raise ManifestError(f"Unknown account fields: {', '.join(sorted(unknown))}")
+        name = entry.get('name')
+        if not isinstance(name, str) or not _NAME.match(name):
+            raise ManifestError(f"Invalid account name: {name!r}")
+        if not entry.get('credentials'):
+            raise ManifestError(f"Account {name} has no credentials file")
+        first = entry.get('first', -1)
+        target = entry.get('target')
+        if not isinstance(first, int) or first < -1:
+            raise ManifestError(f"Account {name}: first must be an index of -1 or more")
+        if target is not None and (not isinstance(target, int) or target < first):
+            raise ManifestError(f"Account {name}: target must be an index of at least {first}")
+        digits_per_post = entry.get('digits_per_post')
+        if digits_per_post is not None and (not isinstance(digits_per_post, int)
+                                            or not 1 <= digits_per_post <= MAX_DIGITS_PER_POST):
+            raise ManifestError(f"Account {name}: digits_per_post must be between 1 and {MAX_DIGITS_PER_POST}")
+        return cls(
+            name,
+            os.path.abspath(os.path.join(base_dir, entry['credentials'])),
+            entry.get('constant', 'pi'),
+            first,
+            target,
+            os.path.abspath(os.path.join(base_dir, entry.get('state_dir', os.path.join('accounts', name)))),
+            digits_per_post,
+        )
+
+    def __repr__(self):
+        last = '' if self.target is None else self.target
+        return f"Account({self.name!r}, {self.constant} {self.first}..{last}, {self.state_dir})"
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Read and check the accounts of a manifest"""
+    from digit_sources import SOURCES
+
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ManifestError(f"Invalid JSON in {path}: {e}") from None
+    entries = manifest.get('accounts') if isinstance(manifest, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ManifestError(f"{path} has no \"accounts\" list")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    accounts = [Account.from_dict(entry, base_dir) for entry in entries]
+    for field in ('name', 'credentials', 'state_dir'):
+        values = [getattr(account, field) for account in accounts]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ManifestError(f"Accounts share a {field}: {', '.join(duplicates)}")
+    for account in accounts:
+        if account.constant not in SOURCES:
+            raise ManifestError(f"Account {account.name}: unknown constant {account.constant} "
+                                f"(known: {', '.join(SOURCES)})")
+    return accounts
+
+
+def parse_node(value):
+    """Turn "i/n" into (i, n)"""
+    match = re.match(r'^(\d+)/(\d+)$', value or '')
+    if not match or not int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"Invalid node {value!r}, expected i/n with 0 <= i < n")
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard(accounts, node=0, nodes=1):
+    """The accounts node `node` of `nodes` runs"""
+    return accounts[node::nodes]
+
+
+def shared_environment():
+    """Environment pointing every worker at the same digit files, images and daemon"""
+    import image_info
+    import image_pack
+    import pi_daemon
+    from digit_sources import SOURCES
+
+    environment = {
+        'PI_IMAGE_DIR': os.path.abspath(image_pack.IMAGE_DIR),
+        'PI_IMAGE_PACK': os.path.abspath(image_pack.PACK_PATH),
+        'PI_IMAGE_JPEG_DIR': os.path.abspath(image_info.TRANSCODE_DIR),
+    }
+    if pi_daemon.SOCKET_PATH not in ('', 'off'):
+        environment['PI_DAEMON_SOCKET'] = os.path.abspath(pi_daemon.SOCKET_PATH)
+    for source in SOURCES.values():
+        if source.env:
+            environment[source.env] = os.path.abspath(source.path)
+    return environment
+
+
+class PrefixedStream:
+    """
+    Text stream that starts every line with `prefix`. Whole lines are
+    written at once, so the lines of several workers do not interleave.
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self._pending = ''
+
+    def write(self, text):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        if lines:
+            self.stream.write(''.join(f"{self.prefix}{line}\n" for line in lines))
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def run_account(account, environment, restart_delay=RESTART_DELAY):
+    """
+    Worker process of one account: post from its state_dir until its
+    target. Exits 0 once the target is reached, FATAL_EXIT when it cannot
+    start and 1 otherwise.
+    """
+    sys.stdout = PrefixedStream(sys.stdout, f"[{account.name}] ")
+    sys.stderr = PrefixedStream(sys.stderr, f"[{account.name}] ")
+    os.environ.update(environment)
+    if account.constant != 'pi':
+        # The daemon only serves pi
+        os.environ['PI_DAEMON_SOCKET'] = 'off'
+
+    credentials = dotenv_values(account.credentials) if os.path.exists(account.credentials) else {}
+    missing = [key for key in CREDENTIAL_KEYS if not credentials.get(key)]
+    if missing:
+        print(f"❌ {account.credentials} does not set {', '.join(missing)}")
+        sys.exit(FATAL_EXIT)
+    for key in CREDENTIAL_KEYS:
+        os.environ[key] = credentials[key]
+
+    os.makedirs(account.state_dir, exist_ok=True)
+    os.chdir(account.state_dir)
+
+    # The bot reads its paths and credentials when it is imported
+    from digit_sources import get_source, register_source
+    source = get_source(account.constant)
+    if account.constant != 'pi':
+        # The posting code reads the 'pi' source, make it this account's constant
+        register_source('pi', source.path, source.prefix_length, source.point_position, source.file_format)
+
+    import main
+    main.FIRST = account.first
+    main.RESTART_DELAY = restart_delay
+    if account.target is not None:
+        main.TARGET = account.target
+    if account.digits_per_post is not None:
+        main.DIGITS_PER_POST = account.digits_per_post
+    print(f"🚀 Posting {account.constant} from index {max(account.first, main.IDX)} to {main.TARGET} "
+          f"as @{credentials['INSTAGRAM_USERNAME']}")
+    main.main()
+    # main only moves IDX past TARGET once the post count shows TARGET is posted
+    sys.exit(0 if main.IDX > main.TARGET else 1)
+
+
+class Fleet:
+    """Keeps one worker process running per account until it reaches its target"""
+
+    def __init__(self, accounts, restart_delay=RESTART_DELAY, max_restarts=MAX_RESTARTS):
+        self.accounts = accounts
+        self.restart_delay = restart_delay
+        self.max_restarts = max_restarts
+        self.restarts = {account.name: 0 for account in accounts}
+        self.results = {}
+        self._context = multiprocessing.get_context('spawn')
+        self._environment = None
+
+    def _start(self, account):
+        process = self._context.Process(target=run_account, name=f"fleet-{account.name}",
+                                        args=(account, self._environment, self.restart_delay))
+        process.start()
+        return process
+
+    def run(self):
+        """
+        Run every account to its target. Returns the result of each account:
+        'done', 'failed' (gave up restarting) or 'fatal'.
+        """
+        from image_pack import get_image_pack
+
+        self._environment = shared_environment()
+        # Build the pack once instead of in every worker
+        get_image_pack()
+
+        workers = {account.name: self._start(account) for account in self.accounts}
+        by_name = {account.name: account for account in self.accounts}
+        restart_at = {}
+        print(f"🚀 Fleet of {len(workers)} accounts: {', '.join(workers)}")
+        try:
+            while workers or restart_at:
+                time.sleep(POLL_INTERVAL)
+                for name, process in list(workers.items()):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    del workers[name]
+                    if process.exitcode == 0:
+                        self.results[name] = 'done'
+                        print(f"🏁 {name} reached its target")
+                    elif process.exitcode == FATAL_EXIT:
+                        self.results[name] = 'fatal'
+                        print(f"❌ {name} cannot run, not restarting it")
+                    elif self.restarts[name] >= self.max_restarts:
+                        self.results[name] = 'failed'
+                        print(f"❌ {name} stopped {self.restarts[name] + 1} times, giving up")
+                    else:
+                        self.restarts[name] += 1
+                        restart_at[name] = time.monotonic() + self.restart_delay
+                        print(f"⏸️  {name} stopped (exit code {process.exitcode}), "
+                              f"restarting in {self.restart_delay:.0f}s")
+                for name, when in list(restart_at.items()):
+                    if time.monotonic() >= when:
+                        del restart_at[name]
+                        workers[name] = self._start(by_name[name])
+        except KeyboardInterrupt:
+            for process in workers.values():
+                process.terminate()
+            for process in workers.values():
+                process.join()
+            raise
+        return self.results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post with every account of a manifest")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help=f"account manifest (default: {MANIFEST_PATH})")
+    parser.add_argument('--node', default=os.getenv('PI_FLEET_NODE', '0/1'),
+                        help="run the accounts of node i of n (i/n)")
+    parser.add_argument('--restart-delay', type=float, default=RESTART_DELAY)
+    parser.add_argument('--max-restarts', type=int, default=MAX_RESTARTS)
+    parser.add_argument('--list', action='store_true', help="show the accounts of this node and exit")
+    args = parser.parse_args()
+
+    try:
+        node, nodes = parse_node(args.node)
+        accounts = shard(load_manifest(args.manifest), node, nodes)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(FATAL_EXIT)
+
+    if args.list:
+        for account in accounts:
+            print(account)
+        sys.exit(0)
+    if not accounts:
+        print(f"No accounts for node {node}/{nodes}")
+        sys.exit(0)
+
+    results = Fleet(accounts, args.restart_delay, args.max_restarts).run()
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result == 'done' for result in results.values()) else 1)
+
+
+# ENDOF FILE fleet.py
@@ -6,11 +6,11 @@ Date: 2025-06-06
 
 '''
 import os
-import requests
 import json
 import time
 from datetime import datetime
 from dotenv import load_dotenv
+from instagram_client import LOGIN_HEADERS, PAGE_HEADERS, REQUEST_TIMEOUT, WWW_URL, ajax_headers, get_client
 
 # load override for testing purposes
 load_dotenv()
@@ -83,22 +83,12 @@ def load_from_login_details(filename="login_details.json"):
 
 def create_session_from_saved_data(session_data):
     """
-    Recreate a requests session from saved session data
+    Load saved session data into the shared client and return its session
     """
     try:
-        session = requests.Session()
-        
-        # Restore cookies
-        cookies = session_data.get('cookies', {})
-        for name, value in cookies.items():
-            session.cookies.set(name, value, domain='.instagram.com')
-        
-        # Set common headers
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-            "X-CSRFToken": session_data.get('csrf_token'),
-            "X-IG-App-ID": "936619743392459",
-        })
+        client = get_client()
+        client.load_session_info(session_data)
+        session = client.session
         
         print("🔄 Session recreated from saved data")
         return session
@@ -129,6 +119,71 @@ def display_session_summary(session_data):
     
     print("=" * 60)
 
+def build_login_request(username, encrypted_password, csrf_token):
+    """
+    Build the URL, headers and form data of the login request
+    """
+    login_data = {
+        'enc_password': encrypted_password,
+        'caaF2DebugGroup': '0',
+        'isPrivacyPortalReq': 'false',
+        'loginAttemptSubmissionCount': '0',
+        'optIntoOneTap': 'false',
+        'queryParams': '{"flo":"true"}',
+        'trustedDeviceRecords': '{}',
+        'username': username,
+        'jazoest': '22733'
+    }
+    login_headers = ajax_headers(csrf_token, LOGIN_HEADERS)
+    return f"{WWW_URL}/api/v1/web/accounts/login/ajax/", login_headers, login_data
+
+def parse_login_response(response_json, session, cookies, csrf_token):
+    """
+    Turn the login response into the login result, given the session and
+    its cookies after the request
+    """
+    # Handle different response types
+    if response_json.get('authenticated'):
+        print("🎉 LOGIN SUCCESSFUL!")
+        print(f"👤 User ID: {response_json.get('userId')}")
+        
+        # Get session token
+        sessionid = cookies.get('sessionid')
+        if sessionid:
+            print(f"🔑 Session Token: {sessionid}")
+            
+            return {
+                'success': True,
+                'session': session,
+                'sessionid': sessionid,
+                'user_id': response_json.get('userId'),
+                'csrf_token': csrf_token,
+                'cookies': cookies
+            }
+        else:
+            print("❌ No session token found in cookies")
+            
+    elif response_json.get('message') == 'checkpoint_required':
+        checkpoint_url = response_json.get('checkpoint_url')
+        print("⚠️  CHECKPOINT REQUIRED")
+        print(f"🔗 Checkpoint URL: {checkpoint_url}")
+        
+        return {
+            'success': False,
+            'checkpoint_required': True,
+            'checkpoint_url': checkpoint_url,
+            'session': session
+        }
+        
+    else:
+        print("❌ LOGIN FAILED")
+        print(f"📄 Response: {json.dumps(response_json, indent=2)}")
+        
+        return {
+            'success': False,
+            'response': response_json
+        }
+
 def instagram_login_with_env_encryption():
     """
     Instagram login using encrypted password from environment variable
@@ -153,37 +208,23 @@ def instagram_login_with_env_encryption():
     print(f"🔐 Logging into Instagram as: {username}")
     print(f"🔑 Using encrypted password from environment (length: {len(encrypted_password)} chars)")
     
-    # ... rest of your login code stays the same ...
-    session = requests.Session()
+    # Start from a clean cookie jar on the shared client
+    client = get_client()
+    client.reset()
+    session = client.session
     
     # Step 1: Get login page with exact headers
     print("📄 Getting login page...")
-    initial_headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.6",
-        "Accept-Encoding": "gzip, deflate, br",
-        "sec-ch-ua": '"Chromium";v="136", "Brave";v="136", "Not.A/Brand";v="99"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"macOS"',
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Upgrade-Insecure-Requests": "1"
-    }
-    
-    session.headers.update(initial_headers)
     
     # Visit homepage first (like a real browser)
-    home_response = session.get("https://www.instagram.com/")
+    home_response = session.get(f"{WWW_URL}/", headers=PAGE_HEADERS)
     print(f"📄 Homepage status: {home_response.status_code}")
     
     # Small delay
     time.sleep(2)
     
     # Get login page
-    login_page = session.get("https://www.instagram.com/?flo=true")
+    login_page = session.get(f"{WWW_URL}/?flo=true", headers=PAGE_HEADERS)
     print(f"📄 Login page status: {login_page.status_code}")
     
     if login_page.status_code != 200:
@@ -198,108 +239,24 @@ def instagram_login_with_env_encryption():
     print(f"🔑 MID: {mid}")
     print(f"🔑 IG_DID: {ig_did}")
     
-    # Step 2: Prepare login data
-    login_data = {
-        'enc_password': encrypted_password,
-        'caaF2DebugGroup': '0',
-        'isPrivacyPortalReq': 'false',
-        'loginAttemptSubmissionCount': '0',
-        'optIntoOneTap': 'false',
-        'queryParams': '{"flo":"true"}',
-        'trustedDeviceRecords': '{}',
-        'username': username,
-        'jazoest': '22733'
-    }
-    
-    # Step 3: Set exact headers from working request
-    login_headers = {
-        "Host": "www.instagram.com",
-        "Connection": "keep-alive",
-        "sec-ch-ua-full-version-list": '"Chromium";v="136.0.0.0", "Brave";v="136.0.0.0", "Not.A/Brand";v="99.0.0.0"',
-        "sec-ch-ua-platform": '"macOS"',
-        "sec-ch-ua": '"Chromium";v="136", "Brave";v="136", "Not.A/Brand";v="99"',
-        "sec-ch-ua-model": '""',
-        "sec-ch-ua-mobile": "?0",
-        "X-IG-App-ID": "936619743392459",
-        "X-Requested-With": "XMLHttpRequest",
-        "Accept": "*/*",
-        "X-Instagram-AJAX": "1023570583",
-        "X-CSRFToken": csrf_token,
-        "X-Web-Session-ID": "yt8jxi:yj4zmk:pzaeuk",
-        "X-ASBD-ID": "359341",
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-        "X-IG-WWW-Claim": "hmac.AR1NQWcvrEmK3axZth3zzILQerkEFzY7y9fS5kgMjy7Nle_s",
-        "sec-ch-ua-platform-version": '"15.5.0"',
-        "Sec-GPC": "1",
-        "Accept-Language": "en-US,en;q=0.6",
-        "Origin": "https://www.instagram.com",
-        "Sec-Fetch-Site": "same-origin",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Dest": "empty",
-        "Referer": "https://www.instagram.com/?flo=true",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    
-    session.headers.clear()
-    session.headers.update(login_headers)
+    # Step 2 and 3: Prepare login data and exact headers from working request
+    login_url, login_headers, login_data = build_login_request(username, encrypted_password, csrf_token)
     
     # Step 4: Make login request
     print("🚀 Making login request...")
     
     try:
         response = session.post(
-            "https://www.instagram.com/api/v1/web/accounts/login/ajax/",
+            login_url,
+            headers=login_headers,
             data=login_data,
-            timeout=30
+            timeout=REQUEST_TIMEOUT
         )
         
         print(f"📡 Response Status: {response.status_code}")
         
         try:
-            response_json = response.json()
-            
-            # Handle different response types
-            if response_json.get('authenticated'):
-                print("🎉 LOGIN SUCCESSFUL!")
-                print(f"👤 User ID: {response_json.get('userId')}")
-                
-                # Get session token
-                sessionid = session.cookies.get('sessionid')
-                if sessionid:
-                    print(f"🔑 Session Token: {sessionid}")
-                    
-                    return {
-                        'success': True,
-                        'session': session,
-                        'sessionid': sessionid,
-                        'user_id': response_json.get('userId'),
-                        'csrf_token': csrf_token,
-                        'cookies': dict(session.cookies)
-                    }
-                else:
-                    print("❌ No session token found in cookies")
-                    
-            elif response_json.get('message') == 'checkpoint_required':
-                checkpoint_url = response_json.get('checkpoint_url')
-                print("⚠️  CHECKPOINT REQUIRED")
-                print(f"🔗 Checkpoint URL: {checkpoint_url}")
-                
-                return {
-                    'success': False,
-                    'checkpoint_required': True,
-                    'checkpoint_url': checkpoint_url,
-                    'session': session
-                }
-                
-            else:
-                print("❌ LOGIN FAILED")
-                print(f"📄 Response: {json.dumps(response_json, indent=2)}")
-                
-                return {
-                    'success': False,
-                    'response': response_json
-                }
-                
+            return parse_login_response(response.json(), session, dict(session.cookies), csrf_token)
         except json.JSONDecodeError:
             print(f"❌ Invalid JSON response: {response.text}")
             return {'success': False, 'error': 'Invalid JSON response'}
@@ -14,47 +14,404 @@ IDX > output
 3 > 1
 4 > 5
 5 > 9
-... 
+...
 
 . is ignored
 
+The file is mapped once per process by PiDigitStore and reused by every
+call to get_pi_digit(), so long running jobs do not pay for an
+open/mmap/munmap on each lookup. Open stores live in the shared cache of
+digit_sources.py, which also registers e, sqrt(2) and phi next to pi.
+
+Set PI_DIGIT_FILE to read from another file. Packed files written by
+pi_packed.py are detected from their header and directories of y-cruncher
+.ycd files are read through pi_ycd.py, both with the same indexing.
+Files with a pi_checksum.py sidecar are verified chunk by chunk on first read.
+A Git LFS pointer in place of pi.txt is rejected instead of being read as
+digits, or served from $PI_REMOTE_URL by pi_remote.py when that is set.
+The module level functions ask the pi_daemon.py server first when its
+socket ($PI_DAEMON_SOCKET) exists.
+
 '''
 import mmap
+import os
+
+PI_FILE = 'pi.txt'
+
+# Number of characters before index 0 (the leading "3")
+PREFIX_LENGTH = 1
+
+# Default size of the chunks handed out by PiDigitStore.iter_chunks()
+CHUNK_SIZE = 1 << 20
+
+# A checkout without `git lfs pull` holds this pointer instead of the digits
+LFS_POINTER_PREFIX = b'version https://git-lfs.github.com/spec/'
+
+# Characters checked when a digit file is opened
+VALIDATE_LENGTH = 64
+
+
+class InvalidDigitFileError(ValueError):
+    """Raised when a digit file holds something other than digits"""
+
+
+def read_lfs_pointer(path):
+    """
+    Parse a Git LFS pointer file. Returns a dict with 'oid' and 'size', or
+    None if `path` is not a pointer.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(1024)
+    if not head.startswith(LFS_POINTER_PREFIX):
+        return None
+    pointer = {}
+    for line in head.decode('ascii', errors='replace').splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'oid':
+            pointer['oid'] = value.split(':', 1)[-1]
+        elif key == 'size' and value.isdigit():
+            pointer['size'] = int(value)
+    return pointer
+
+
+class PiDigitStore:
+    """
+    Long-lived, read-only view of a pi digit file.
+
+    The file is opened and memory-mapped once. Single lookups index into the
+    mapping directly, range lookups return zero-copy memoryview slices of it.
+    Positions use the same indexing as get_pi_digit(): -1 is the leading "3",
+    0 is the decimal point and 1 is the first digit after it.
+
+    `prefix_length` is the number of digits before the decimal point and
+    `point_position` the file offset of the point (by default right after
+    them; anything before the integer digits is skipped).
+    """
+
+    def __init__(self, path=PI_FILE, prefix_length=PREFIX_LENGTH, point_position=None):
+        self.path = path
+        self.prefix_length = prefix_length
+        self.point_position = prefix_length if point_position is None else point_position
+        if self.point_position < prefix_length:
+            raise ValueError("point_position must not be before the integer digits")
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._mm)
+        self.verifier = None
+        try:
+            self._validate()
+        except Exception:
+            self.close()
+            raise
+
+    def _validate(self):
+        """
+        Check that the file starts like "3.1415..." so a Git LFS pointer or
+        another stray file is never read as digits.
+        """
+        if bytes(self._mm[:len(LFS_POINTER_PREFIX)]) == LFS_POINTER_PREFIX:
+            raise InvalidDigitFileError(
+                f"{self.path} is a Git LFS pointer, run 'git lfs pull' or set PI_REMOTE_URL")
+        head = bytes(self._mm[self._first_offset:self.point_position + VALIDATE_LENGTH]).rstrip(b'\r\n')
+        digits = head[:self.prefix_length] + head[self.prefix_length + 1:]
+        if head[self.prefix_length:self.prefix_length + 1] != b'.' or not digits.isdigit():
+            raise InvalidDigitFileError(f"{self.path} does not look like a digit file")
+
+    def __len__(self):
+        """Number of positions available from index 0 onwards"""
+        return max(len(self._mm) - self.point_position, 0)
+
+    @property
+    def _first_offset(self):
+        """File offset of the first integer digit (index -prefix_length)"""
+        return self.point_position - self.prefix_length
+
+    @property
+    def mapped_bytes(self):
+        """Size of the address space held by the store's mappings"""
+        return 0 if self.closed else len(self._mm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the mapping and the file handle.
+        Slices returned by get_pi_digits() must be released before this.
+        """
+        if self._mm is None:
+            return
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # Slices handed out by get_pi_digits() are still alive, stay open
+            self._view = memoryview(self._mm)
+            raise
+        self._file.close()
+        self._mm = None
+
+    @property
+    def closed(self):
+        return self._mm is None
+
+    def get_pi_digit(self, position):
+        """
+        Get the digit of pi at the specified position (0-indexed).
+        Returns -1 if the character at the position is a decimal point and
+        None if the position is outside the file.
+        """
+        file_position = position + self.point_position
+        if file_position < self._first_offset or file_position >= len(self._mm):
+            return None
+        if self.verifier:
+            self.verifier.check_range(file_position, file_position + 1)
+        char = chr(self._mm[file_position])
+        if char == '.':
+            return -1
+        return char
+
+    def get_pi_digits(self, start, count):
+        """
+        Get up to `count` raw characters starting at `start` as a zero-copy
+        memoryview. The slice is shorter than `count` near the end of the file.
+        """
+        if count < 0:
+            raise ValueError("count must not be negative")
+        file_start = max(start + self.point_position, self._first_offset)
+        file_end = min(start + self.point_position + count, len(self._mm))
+        if file_end <= file_start:
+            return self._view[0:0]
+        if self.verifier:
+            self.verifier.check_range(file_start, file_end)
+        return self._view[file_start:file_end]
+
+    def enable_verification(self, mode='lazy'):
+        """
+        Check the file against its pi_checksum.py sidecar: 'lazy' verifies each
+        chunk the first time it is read, 'full' verifies the whole file now.
+        """
+        from pi_checksum import ChecksumError, LazyVerifier, verify_file
+
+        if mode not in ('lazy', 'full'):
+            raise ValueError(f"Unknown verification mode: {mode}")
+        if mode == 'full':
+            bad_chunks = verify_file(self.path)
+            if bad_chunks:
+                raise ChecksumError(f"Corrupted chunks in {self.path}: {bad_chunks}")
+        self.verifier = LazyVerifier(self.path, self._mm, verified=mode == 'full')
+
+    def readahead(self, start, count):
+        """
+        Hint the kernel that the given range will be read soon so the page
+        cache is populated before it is needed. No-op where madvise is missing.
+        """
+        if not hasattr(self._mm, 'madvise') or not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        file_start = max(start + self.point_position, self._first_offset)
+        file_end = min(start + self.point_position + count, len(self._mm))
+        if file_end <= file_start:
+            return
+        # madvise() wants a page aligned start
+        aligned_start = file_start - (file_start % mmap.PAGESIZE)
+        self._mm.madvise(mmap.MADV_WILLNEED, aligned_start, file_end - aligned_start)
+
+    def advise_sequential(self):
+        """Tell the kernel the mapping is about to be read front to back"""
+        if hasattr(self._mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+
+    def iter_chunks(self, start=0, stop=None, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over [start, stop) as zero-copy memoryview chunks, reading the
+        next chunk ahead while the current one is being consumed.
+        """
+        if stop is None or stop > len(self):
+            stop = len(self)
+        self.advise_sequential()
+        position = start
+        while position < stop:
+            count = min(chunk_size, stop - position)
+            self.readahead(position + count, min(chunk_size, stop - position - count))
+            yield position, self.get_pi_digits(position, count)
+            position += count
+
+    def iter_digits(self, start=0, stop=None, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over the digits in [start, stop) with the same values as
+        get_pi_digit(), reading the file chunk by chunk.
+        """
+        for _, chunk in self.iter_chunks(start, stop, chunk_size):
+            for char in bytes(chunk).decode('ascii'):
+                yield -1 if char == '.' else char
+
+
+FORMATS = ('auto', 'text', 'packed', 'ycd')
+
+
+def open_digit_store(path, verify=None, file_format='auto', prefix_length=PREFIX_LENGTH,
+                     point_position=None):
+    """
+    Open the right digit store for `path`: a directory of y-cruncher .ycd
+    files, a packed file (detected from its header) or plain text.
+    `file_format` skips the detection; `prefix_length` and `point_position`
+    describe the layout of text files (packed and .ycd files carry their own).
+
+    Files with a pi_checksum.py sidecar are verified lazily unless `verify`
+    (default $PI_VERIFY) is 'off'; 'full' checks the whole file on open.
+
+    A Git LFS pointer is read through pi_remote.py when $PI_REMOTE_URL is
+    set, otherwise it is rejected with InvalidDigitFileError.
+    """
+    from pi_checksum import sidecar_path
+    from pi_packed import PackedDigitStore, is_packed_file
+    from pi_ycd import YcdDigitStore, is_ycd_directory
+
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown digit file format: {file_format}")
+    if file_format == 'ycd' or (file_format == 'auto' and is_ycd_directory(path)):
+        return YcdDigitStore(path)
+    pointer = read_lfs_pointer(path)
+    if pointer is not None and os.getenv('PI_REMOTE_URL'):
+        from pi_remote import RemoteDigitStore
+        return RemoteDigitStore(os.getenv('PI_REMOTE_URL'), path + '.cache', pointer.get('size'),
+                                prefix_length=prefix_length, point_position=point_position)
+    if file_format == 'packed' or (file_format == 'auto' and is_packed_file(path)):
+        store = PackedDigitStore(path)
+    else:
+        store = PiDigitStore(path, prefix_length, point_position)
+
+    if verify is None:
+        verify = os.getenv('PI_VERIFY', 'lazy')
+    if verify != 'off' and os.path.exists(sidecar_path(path)):
+        try:
+            store.enable_verification(verify)
+        except Exception:
+            store.close()
+            raise
+    return store
+
+
+# The 'pi' store handed out last, kept open by digit_sources.py so lookups skip the cache lock
+_pi_store = None
+
+
+def get_store(path=None):
+    """
+    Get the digit store for `path` from the process-wide mapping cache of
+    digit_sources.py, opening it on first use.
+    Defaults to the 'pi' source ($PI_DIGIT_FILE or 'pi.txt').
+    """
+    if path is None:
+        store = _pi_store
+        if store is not None and not store.closed:
+            return store
+
+    from digit_sources import get_source_store, get_store_for_path
+
+    if path is None:
+        return get_source_store('pi')
+    return get_store_for_path(path)
+
+
+# pi_daemon.py, imported on the first lookup (it imports this module)
+_daemon = None
+
+
+def _daemon_call(method, *args):
+    """
+    Run `method` on the pi_daemon.py client when the daemon is running.
+    Returns (True, result), or (False, None) to read the file directly.
+    """
+    global _daemon
+    if _daemon is None:
+        import pi_daemon
+        _daemon = pi_daemon
+
+    client = _daemon.get_client()
+    if client is None:
+        return False, None
+    try:
+        return True, getattr(client, method)(*args)
+    except (OSError, _daemon.DaemonError) as e:
+        print(f"⚠️  Digit daemon failed ({e}), reading the file directly")
+        _daemon.drop_client()
+        return False, None
+
 
 def get_pi_digit(position):
     """
-    Get the digit of pi at the specified position (0-indexed) using mmap.
+    Get the digit of pi at the specified position (0-indexed), from the
+    digit daemon when it is running and the memory-mapped file otherwise.
     Returns -1 if the character at the position is a decimal point.
     """
+    answered, digit = _daemon_call('get_pi_digit', position)
+    if answered:
+        return digit
     try:
-        # Adjust position to account for the "3." at the beginning
-        file_position = position + 1
-        
-        with open('pi.txt', 'rb') as f:
-            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-                if file_position < len(mm):
-                    char = chr(mm[file_position])
-                    if char == '.':
-                        return -1
-                    else:
-                        return char
-                else:
-                    return None
-                    
-    except FileNotFoundError:
-        print("File 'pi.txt' not found.")
+        return get_store().get_pi_digit(position)
+    except FileNotFoundError as e:
+        print(f"File '{e.filename}' not found.")
         return None
     except Exception as e:
         print(f"Error reading file: {e}")
         return None
 
 
+def get_pi_digits(start, count):
+    """
+    Get `count` characters of the pi file starting at `start` as a bytes-like
+    object. Returns None if the file cannot be read.
+    """
+    answered, digits = _daemon_call('get_pi_digits', start, count)
+    if answered:
+        return digits
+    try:
+        return get_store().get_pi_digits(start, count)
+    except FileNotFoundError as e:
+        print(f"File '{e.filename}' not found.")
+        return None
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return None
+
+
+def find_in_pi(pattern):
+    """
+    Get the first position (same indexing as get_pi_digit) where the digit
+    string `pattern` starts after the decimal point, or None if it is not
+    found. Uses the pi_search.py k-mer index when one has been built.
+    """
+    from pi_search import find_in_pi as find
+
+    answered, position = _daemon_call('find', pattern)
+    if answered:
+        return position
+    try:
+        return find(pattern)
+    except FileNotFoundError as e:
+        print(f"File '{e.filename}' not found.")
+        return None
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Error searching file: {e}")
+        return None
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) != 2:
         print("Usage: python get_pi_digit.py <position>")
         sys.exit(1)
-    
+
     try:
         position = int(sys.argv[1])
         digit = get_pi_digit(position)
@@ -67,4 +424,4 @@ if __name__ == "__main__":
         sys.exit(1)
 
 
-# ENDOF FILE get_pi_digit.py 
\ No newline at end of file
+# ENDOF FILE get_pi_digit.py
\ No newline at end of file
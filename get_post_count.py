@@ -10,6 +10,9 @@ import requests
 import json
 import sys
 import re
+from instagram_client import PAGE_HEADERS, REQUEST_TIMEOUT, WWW_URL, ajax_headers, get_client
+from rate_governor import get_governor
+from retry_policy import EndpointError, classify_response, get_policy
 
 def load_login_details():
     """Load login details from login_details.json"""
@@ -23,140 +26,104 @@ def load_login_details():
         print("Error: Invalid JSON in login_details.json")
         sys.exit(1)
 
-def get_user_id_from_username(username, login_data):
+def get_session(login_data):
     """
-    Get Instagram user ID from username by fetching the profile page
+    Get the shared client session with the saved cookies loaded
     """
-    session_info = login_data['session_info']
-    cookies = session_info['cookies']
-    
-    # Method 1: Try the profile page approach
-    profile_url = f"https://www.instagram.com/{username}/"
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
-    
-    try:
-        response = requests.get(profile_url, headers=headers, cookies=cookies)
-        response.raise_for_status()
-        
-        # Look for the user ID in the page content
-        # Instagram embeds user data in JSON within script tags
-        content = response.text
-        
-        # Pattern to find user ID in the page source
-        patterns = [
-            r'"profilePage_(\d+)"',
-            r'"id":"(\d+)".*?"username":"' + re.escape(username) + '"',
-            r'"owner":{"id":"(\d+)"',
-            r'"user_id":"(\d+)"',
-            r'"pk":(\d+).*?"username":"' + re.escape(username) + '"'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, content)
-            if match:
-                user_id = match.group(1)
-                # print(f"Found user ID for @{username}: {user_id}")
-                return user_id
-        
-        # If regex fails, try to find it in the JSON data
-        # Look for window._sharedData or similar
-        json_match = re.search(r'window\._sharedData\s*=\s*({.*?});', content)
-        if json_match:
-            try:
-                shared_data = json.loads(json_match.group(1))
-                # Navigate through the JSON structure to find user ID
-                entry_data = shared_data.get('entry_data', {})
-                profile_page = entry_data.get('ProfilePage', [])
-                if profile_page:
-                    user_data = profile_page[0].get('graphql', {}).get('user', {})
-                    user_id = user_data.get('id')
-                    if user_id:
-                        # print(f"Found user ID for @{username}: {user_id}")
-                        return user_id
-            except json.JSONDecodeError:
-                pass
-        
-        # print(f"Could not find user ID for @{username} in profile page")
-        return None
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching profile page: {e}")
-        return None
+    client = get_client()
+    client.load_session_info(login_data['session_info'])
+    return client.session
 
-def get_user_id_via_search(username, login_data):
+def build_profile_request(username):
     """
-    Alternative method: Use Instagram's search API
+    Build the URL and headers of a user's profile page
+    """
+    return f"{WWW_URL}/{username}/", PAGE_HEADERS
+
+def find_user_id_in_profile(username, content):
     """
-    session_info = login_data['session_info']
-    cookies = session_info['cookies']
+    Find the user ID in the HTML of a profile page
+    """
+    # Look for the user ID in the page content
+    # Instagram embeds user data in JSON within script tags
+    
+    # Pattern to find user ID in the page source
+    patterns = [
+        r'"profilePage_(\d+)"',
+        r'"id":"(\d+)".*?"username":"' + re.escape(username) + '"',
+        r'"owner":{"id":"(\d+)"',
+        r'"user_id":"(\d+)"',
+        r'"pk":(\d+).*?"username":"' + re.escape(username) + '"'
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, content)
+        if match:
+            user_id = match.group(1)
+            # print(f"Found user ID for @{username}: {user_id}")
+            return user_id
+    
+    # If regex fails, try to find it in the JSON data
+    # Look for window._sharedData or similar
+    json_match = re.search(r'window\._sharedData\s*=\s*({.*?});', content)
+    if json_match:
+        try:
+            shared_data = json.loads(json_match.group(1))
+            # Navigate through the JSON structure to find user ID
+            entry_data = shared_data.get('entry_data', {})
+            profile_page = entry_data.get('ProfilePage', [])
+            if profile_page:
+                user_data = profile_page[0].get('graphql', {}).get('user', {})
+                user_id = user_data.get('id')
+                if user_id:
+                    # print(f"Found user ID for @{username}: {user_id}")
+                    return user_id
+        except json.JSONDecodeError:
+            pass
     
-    search_url = "https://www.instagram.com/web/search/topsearch/"
+    # print(f"Could not find user ID for @{username} in profile page")
+    return None
+
+def build_search_request(username, csrf_token):
+    """
+    Build the URL, headers and query of a search for username
+    """
+    search_url = f"{WWW_URL}/web/search/topsearch/"
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-        'X-CSRFToken': session_info['csrf_token'],
-        'X-IG-App-ID': '936619743392459',
-        'X-Requested-With': 'XMLHttpRequest',
-        'Referer': 'https://www.instagram.com/',
-    }
+    headers = ajax_headers(csrf_token)
     
     params = {
         'query': username,
         'context': 'blended'
     }
+    return search_url, headers, params
+
+def find_user_id_in_search(username, data):
+    """
+    Find the user ID of username in search results
+    """
+    users = data.get('users', [])
     
-    try:
-        response = requests.get(search_url, headers=headers, cookies=cookies, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        users = data.get('users', [])
-        
-        for user in users:
-            if user.get('user', {}).get('username') == username:
-                user_id = user.get('user', {}).get('pk')
-                if user_id:
-                    # print(f"Found user ID via search for @{username}: {user_id}")
-                    return str(user_id)
-        
-        # print(f"User @{username} not found in search results")
-        return None
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error with search API: {e}")
-        return None
+    for user in users:
+        if user.get('user', {}).get('username') == username:
+            user_id = user.get('user', {}).get('pk')
+            if user_id:
+                # print(f"Found user ID via search for @{username}: {user_id}")
+                return str(user_id)
+    
+    # print(f"User @{username} not found in search results")
+    return None
 
-def make_instagram_request(username, target_user_id, login_data):
-    """Make the Instagram GraphQL request"""
-    
-    session_info = login_data['session_info']
-    cookies = session_info['cookies']
-    
-    url = "https://www.instagram.com/graphql/query"
-    
-    headers = {
-        'Accept': '*/*',
-        'Accept-Language': 'en-US,en;q=0.6',
-        'Connection': 'keep-alive',
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'Origin': 'https://www.instagram.com',
-        'Referer': f'https://www.instagram.com/{username}/',
-        'Sec-Fetch-Dest': 'empty',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Site': 'same-origin',
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-        'X-CSRFToken': session_info['csrf_token'],
+def build_graphql_request(username, target_user_id, csrf_token):
+    """
+    Build the URL, headers and form data of the profile GraphQL query
+    """
+    url = f"{WWW_URL}/graphql/query"
+    
+    headers = ajax_headers(csrf_token, {
+        'Referer': f'{WWW_URL}/{username}/',
         'X-FB-Friendly-Name': 'PolarisProfilePageContentQuery',
-        'X-IG-App-ID': '936619743392459',
-    }
+    })
     
     # Prepare the variables for the GraphQL query
     variables = {
@@ -168,14 +135,68 @@ def make_instagram_request(username, target_user_id, login_data):
         'variables': json.dumps(variables),
         'doc_id': '9916454141777118'
     }
+    return url, headers, data
+
+def media_count_from_response(result):
+    """
+    Get the media count from the GraphQL response
+    """
+    # only get the media_count under data['data']['user']['media_count']
+    return result.get('data', {}).get('user', {}).get('media_count', 0)
+
+def request_user_id(username, login_data):
+    """
+    Get Instagram user ID from username by fetching the profile page, or
+    through the search API when the page does not have it. Raises on errors.
+    """
+    session = get_session(login_data)
+    governor = get_governor()
+    
+    # Method 1: Try the profile page approach
+    profile_url, headers = build_profile_request(username)
     
+    governor.acquire('profile')
     try:
-        response = requests.post(url, headers=headers, cookies=cookies, data=data)
+        response = session.get(profile_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        governor.observe_response('profile', response)
         response.raise_for_status()
-        return response.json()
+        user_id = find_user_id_in_profile(username, response.text)
+        if user_id:
+            return user_id
     except requests.exceptions.RequestException as e:
-        print(f"GraphQL request failed: {e}")
-        return None
+        print(f"Error fetching profile page: {e}")
+    
+    # Method 2: Use Instagram's search API
+    search_url, headers, params = build_search_request(username, login_data['session_info']['csrf_token'])
+    
+    governor.acquire('profile')
+    response = session.get(search_url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+    governor.observe_response('profile', response)
+    response.raise_for_status()
+    user_id = find_user_id_in_search(username, response.json())
+    if not user_id:
+        raise EndpointError('profile', f"User @{username} not found in search results")
+    return user_id
+
+def request_media_count(username, target_user_id, login_data):
+    """Make the Instagram GraphQL request and return the media count. Raises on errors."""
+    
+    session = get_session(login_data)
+    
+    url, headers, data = build_graphql_request(username, target_user_id, login_data['session_info']['csrf_token'])
+    
+    governor = get_governor()
+    governor.acquire('graphql')
+    response = session.post(url, headers=headers, data=data, timeout=REQUEST_TIMEOUT)
+    governor.observe_response('graphql', response)
+    response.raise_for_status()
+    result = response.json()
+    
+    # A missing count must not read as 0 posts, that would restart from the dot
+    if not isinstance(result.get('data', {}).get('user', {}).get('media_count'), int):
+        raise EndpointError('graphql', f"No media count in response: {str(result)[:200]}",
+                            classify_response(response.status_code, result), response.status_code, result)
+    return media_count_from_response(result)
 
 def get_media_count_of_user(username):
     """Get the media count of a user by username"""
@@ -185,46 +206,22 @@ def get_media_count_of_user(username):
     
     # Load login details
     login_data = load_login_details()
+    policy = get_policy()
     
-    # print(f"Loaded login details for user ID: {login_data['session_info']['user_id']}")
-    # print(f"Resolving user ID for: @{username}")
-    
-    # Try to get user ID from username
-    target_user_id = get_user_id_from_username(username, login_data)
-    
-    # If first method fails, try search API
-    if not target_user_id:
-        # print("Trying search API method...")
-        target_user_id = get_user_id_via_search(username, login_data)
-    
-    if not target_user_id:
-        print(f"Failed to resolve user ID for @{username}")
-        sys.exit(1)
-    
-    # print(f"Making GraphQL request for user ID: {target_user_id}")
+    # Resolve the user ID, retrying transient errors
+    try:
+        target_user_id = policy.call('profile', request_user_id, username, login_data)
+    except EndpointError as e:
+        # Callers wait out the failure (or the governor's block) and ask again
+        print(f"Failed to resolve user ID for @{username}: {e}")
+        return None
     
     # Make the request
-    result = make_instagram_request(username, target_user_id, login_data)
-    
-    if result:
-        # print("\n" + "="*50)
-        # print("RESPONSE:")
-        # print("="*50)
-        # print(json.dumps(result, indent=2))
-        
-        # Save to file
-        if False:
-            output_filename = f"{username}_profile_data.json"
-            with open(output_filename, 'w') as f:
-                json.dump(result, f, indent=2)
-            print(f"\nData saved to: {output_filename}")
-
-         # only get the media_count under data['data']['user']['media_count']
-        media_count = result.get('data', {}).get('user', {}).get('media_count', 0)
-        # print(f"User @{username} has {media_count} posts.")
-        return media_count
-    else:
-        print("Failed to get profile data")
+    try:
+        return policy.call('graphql', request_media_count, username, target_user_id, login_data)
+    except EndpointError as e:
+        print(f"Failed to get profile data: {e}")
+        return None
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
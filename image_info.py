@@ -0,0 +1,226 @@
+'''
+Image type and dimensions from the file header, and optional JPEG transcoding.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+sniff_image() reads the MIME type, width and height of a PNG, JPEG or WebP
+from its first bytes without decoding it, so the upload headers describe
+the file that is actually sent. image_info() does the same for a file and
+caches the result until the file changes.
+
+transcode_to_jpeg() re-encodes an image once into a JPEG kept under
+TRANSCODE_DIR and named after the source bytes, so it is reused until the
+source changes. It needs Pillow, which is imported only there; without it
+(or when the JPEG would not be smaller) the original file is used.
+Set PI_IMAGE_JPEG=1 to upload the transcoded images.
+
+EX USAGE:
+python image_info.py <image> [<image> ...]
+
+'''
+import hashlib
+import io
+import os
+import struct
+import sys
+import threading
+
+# Bytes read from a file before giving up on finding the size in the header
+HEAD_BYTES = 64 << 10
+
+TRANSCODE = os.getenv('PI_IMAGE_JPEG', '0') == '1'
+TRANSCODE_DIR = os.getenv('PI_IMAGE_JPEG_DIR', 'images/jpeg')
+JPEG_QUALITY = int(os.getenv('PI_IMAGE_JPEG_QUALITY', '90'))
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG start-of-frame markers (every SOFn but DHT, JPG and DAC)
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class UnknownImageError(ValueError):
+    """Raised when the header is not a PNG, JPEG or WebP with a size"""
+
+
+class ImageInfo:
+    """MIME type and pixel size of an image"""
+
+    __slots__ = ('mime_type', 'width', 'height')
+
+    def __init__(self, mime_type, width, height):
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+
+    def __eq__(self, other):
+        return isinstance(other, ImageInfo) and (self.mime_type, self.width, self.height) == (
+            other.mime_type, other.width, other.height)
+
+    def __repr__(self):
+        return f"ImageInfo({self.mime_type!r}, {self.width}, {self.height})"
+
+
+def _png_info(data):
+    if len(data) < 24 or data[12:16] != b'IHDR':
+        raise UnknownImageError("PNG without an IHDR chunk")
+    width, height = struct.unpack_from('>II', data, 16)
+    return ImageInfo('image/png', width, height)
+
+
+def _jpeg_info(data):
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise UnknownImageError(f"JPEG marker expected at byte {position}")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # Markers without a length
+            position += 2
+            continue
+        (length,) = struct.unpack_from('>H', data, position + 2)
+        if marker in _JPEG_SOF:
+            if position + 9 > len(data):
+                break
+            height, width = struct.unpack_from('>HH', data, position + 5)
+            return ImageInfo('image/jpeg', width, height)
+        position += 2 + length
+    raise UnknownImageError("JPEG frame header not found")
+
+
+def _webp_info(data):
+    if len(data) < 30:
+        raise UnknownImageError("WebP header is too short")
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        if data[23:26] != b'\x9d\x01\x2a':
+            raise UnknownImageError("WebP VP8 frame without a start code")
+        width, height = struct.unpack_from('<HH', data, 26)
+        return ImageInfo('image/webp', width & 0x3FFF, height & 0x3FFF)
+    if chunk == b'VP8L':
+        if data[20] != 0x2F:
+            raise UnknownImageError("WebP VP8L frame without a signature")
+        (bits,) = struct.unpack_from('<I', data, 21)
+        return ImageInfo('image/webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b'VP8X':
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return ImageInfo('image/webp', width, height)
+    raise UnknownImageError(f"Unknown WebP chunk {chunk!r}")
+
+
+def sniff_image(data):
+    """
+    Get the ImageInfo of a PNG, JPEG or WebP from its first bytes. Raises
+    UnknownImageError when the type is unknown or the size is not within
+    `data`.
+    """
+    data = memoryview(data).cast('B')
+    if data[:8] == _PNG_SIGNATURE:
+        return _png_info(data)
+    if data[:2] == b'\xff\xd8':
+        return _jpeg_info(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _webp_info(data)
+    raise UnknownImageError("Not a PNG, JPEG or WebP image")
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def image_info(path):
+    """ImageInfo of the file at `path`, cached until the file changes"""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+        try:
+            info = sniff_image(head)
+        except UnknownImageError:
+            # A JPEG can carry large metadata segments before its frame header
+            if head[:2] != b'\xff\xd8' or len(head) < HEAD_BYTES:
+                raise
+            info = sniff_image(head + f.read())
+    with _cache_lock:
+        _cache[key] = (stamp, info)
+    return info
+
+
+def transcode_to_jpeg(path, quality=JPEG_QUALITY, directory=TRANSCODE_DIR):
+    """
+    Path of a JPEG version of the image at `path`, encoded on first use.
+    Returns `path` itself when it already is a JPEG, when the JPEG would not
+    be smaller or when Pillow is not installed.
+    """
+    if image_info(path).mime_type == 'image/jpeg':
+        return path
+    with open(path, 'rb') as f:
+        source = f.read()
+    name = f"{hashlib.sha256(source).hexdigest()[:16]}-q{quality}"
+    jpeg_path = os.path.join(directory, f"{name}.jpg")
+    if os.path.exists(jpeg_path):
+        return jpeg_path
+    # Recorded when the JPEG was not smaller, so the work is not repeated
+    keep_path = os.path.join(directory, f"{name}.keep")
+    if os.path.exists(keep_path):
+        return path
+
+    try:
+        from PIL import Image
+    except ImportError:
+        print("⚠️  Pillow is not installed, uploading the original images")
+        return path
+
+    with Image.open(io.BytesIO(source)) as image:
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (0, 0, 0))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True)
+
+    os.makedirs(directory, exist_ok=True)
+    if output.tell() >= len(source):
+        open(keep_path, 'wb').close()
+        return path
+    temporary = f"{jpeg_path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(output.getvalue())
+    os.replace(temporary, jpeg_path)
+    return jpeg_path
+
+
+def upload_path(path, transcode=None):
+    """The file to upload for `path`, its JPEG version when transcoding"""
+    if TRANSCODE if transcode is None else transcode:
+        return transcode_to_jpeg(path)
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python image_info.py <image> [<image> ...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        info = image_info(path)
+        print(f"{path}: {info.width}x{info.height} {info.mime_type} {os.path.getsize(path)} bytes")
+        jpeg_path = transcode_to_jpeg(path)
+        if jpeg_path != path:
+            print(f"  -> {jpeg_path}: {os.path.getsize(jpeg_path)} bytes")
+
+
+# ENDOF FILE image_info.py
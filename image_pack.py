@@ -0,0 +1,199 @@
+'''
+Memory-mapped pack of the eleven images that get posted (the dot and 0-9).
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The pack is built once from the files in PI_IMAGE_PATHS and holds every
+payload together with its width, height, MIME type and length, so posting
+a digit is a table index into one mapping: no per-post open()/read() and
+no copy, the uploader sends the mapped bytes as they are.
+
+FILE LAYOUT:
+0   8  magic b'PIIMG\\x00\\x00\\x01'
+8   4  number of entries
+12  4  flags (FLAG_JPEG: built from the transcoded JPEGs)
+16  .. one 40 byte entry per image: number (signed), offset, length,
+       width, height, MIME type (NUL padded)
+..  .. payloads, each starting on a PAYLOAD_ALIGNMENT boundary
+
+The images are read from PI_IMAGE_DIR (default images/). With
+PI_IMAGE_JPEG=1 the pack holds the JPEG versions of the images (see
+image_info.py). The pack is rebuilt on first use when it is missing, older
+than one of the images or built with the other setting.
+
+EX USAGE:
+python image_pack.py [<pack>]
+
+'''
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from image_info import TRANSCODE, image_info, upload_path
+
+MAGIC = b'PIIMG\x00\x00\x01'
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<b3xQIII16s')
+PAYLOAD_ALIGNMENT = 64
+
+FLAG_JPEG = 1
+
+# Directory of the digit images, the pack is kept next to them by default
+IMAGE_DIR = os.getenv('PI_IMAGE_DIR', 'images')
+PACK_PATH = os.getenv('PI_IMAGE_PACK', os.path.join(IMAGE_DIR, 'pi_images.pack'))
+
+# Image of each number, indexed by number + 1 (the dot, -1, comes first)
+PI_IMAGE_PATHS = (os.path.join(IMAGE_DIR, "starwars_cosmic_dot/starwars_decimal_dot.png"),) + tuple(
+    os.path.join(IMAGE_DIR, f"starwars_cosmic_digits/{digit}.png") for digit in range(10))
+
+
+class InvalidImagePackError(Exception):
+    """Raised when a pack file is not a valid image pack"""
+
+
+def image_path_for(number):
+    """Path of the image posted for `number` (-1 for the decimal point)"""
+    if not -1 <= number <= 9:
+        raise ValueError(f"Invalid pi digit number: {number}. Must be between -1 and 9.")
+    return PI_IMAGE_PATHS[number + 1]
+
+
+class PackedImage:
+    """One image of the pack, `data` is a memoryview into the mapping"""
+
+    __slots__ = ('number', 'data', 'width', 'height', 'mime_type')
+
+    def __init__(self, number, data, width, height, mime_type):
+        self.number = number
+        self.data = data
+        self.width = width
+        self.height = height
+        self.mime_type = mime_type
+
+    @property
+    def length(self):
+        return len(self.data)
+
+
+def build_image_pack(destination=PACK_PATH, paths=PI_IMAGE_PATHS, transcode=TRANSCODE):
+    """
+    Write the pack for `paths` (indexed by number + 1) to `destination`,
+    from their JPEG versions when `transcode` is set
+    """
+    entries = []
+    payloads = []
+    offset = HEADER.size + ENTRY.size * len(paths)
+    for index, path in enumerate(paths):
+        path = upload_path(path, transcode)
+        info = image_info(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset += -offset % PAYLOAD_ALIGNMENT
+        entries.append(ENTRY.pack(index - 1, offset, len(data), info.width, info.height,
+                                  info.mime_type.encode('ascii')))
+        payloads.append((offset, data))
+        offset += len(data)
+
+    temporary = f"{destination}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries), FLAG_JPEG if transcode else 0))
+        f.write(b''.join(entries))
+        for payload_offset, data in payloads:
+            f.write(b'\x00' * (payload_offset - f.tell()))
+            f.write(data)
+    os.replace(temporary, destination)
+    return destination
+
+
+def is_stale(pack_path=PACK_PATH, paths=PI_IMAGE_PATHS, transcode=TRANSCODE):
+    """
+    Check whether the pack is missing, older than one of the images or
+    built with a different `transcode` setting
+    """
+    try:
+        built = os.path.getmtime(pack_path)
+        with open(pack_path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return True
+    if len(header) < HEADER.size or bool(HEADER.unpack(header)[2] & FLAG_JPEG) != transcode:
+        return True
+    return any(os.path.getmtime(path) > built for path in paths)
+
+
+class ImagePack:
+    """
+    Read-only mapping of a pack file. pack[number] returns the PackedImage
+    of a number from -1 (the dot) to 9.
+    """
+
+    def __init__(self, path=PACK_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self._images = self._read_table()
+
+    def _read_table(self):
+        if len(self._mm) < HEADER.size:
+            raise InvalidImagePackError(f"{self.path} is too small to be an image pack")
+        magic, count, self.flags = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise InvalidImagePackError(f"{self.path} is not an image pack")
+        images = []
+        for index in range(count):
+            number, offset, length, width, height, mime_type = ENTRY.unpack_from(
+                self._mm, HEADER.size + index * ENTRY.size)
+            if offset + length > len(self._mm):
+                raise InvalidImagePackError(f"{self.path} is truncated")
+            if number != index - 1:
+                raise InvalidImagePackError(f"{self.path} has entry {number} in slot {index}")
+            images.append(PackedImage(number, self._view[offset:offset + length], width, height,
+                                      mime_type.rstrip(b'\x00').decode('ascii')))
+        return images
+
+    def __len__(self):
+        return len(self._images)
+
+    def __getitem__(self, number):
+        if not -1 <= number < len(self._images) - 1:
+            raise ValueError(f"Invalid pi digit number: {number}. Must be between -1 and {len(self._images) - 2}.")
+        return self._images[number + 1]
+
+
+_pack = None
+_pack_lock = threading.Lock()
+
+
+def get_image_pack():
+    """Get the shared ImagePack, building the pack file first if needed"""
+    global _pack
+    if _pack is None:
+        with _pack_lock:
+            if _pack is None:
+                if is_stale():
+                    print(f"📦 Building image pack: {PACK_PATH}")
+                    build_image_pack()
+                _pack = ImagePack()
+    return _pack
+
+
+def get_pi_image(number):
+    """Get the PackedImage posted for `number` (-1 for the decimal point)"""
+    return get_image_pack()[number]
+
+
+if __name__ == "__main__":
+    destination = sys.argv[1] if len(sys.argv) > 1 else PACK_PATH
+    build_image_pack(destination)
+    pack = ImagePack(destination)
+    for number in range(-1, len(pack) - 1):
+        image = pack[number]
+        print(f"{number:>2}: {image.width}x{image.height} {image.mime_type} {image.length} bytes")
+    print(f"✅ Wrote {len(pack)} images to {destination}")
+
+
+# ENDOF FILE image_pack.py
@@ -0,0 +1,290 @@
+'''
+asyncio versions of login, post count and posting.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The requests are built and their responses parsed by the same helpers the
+blocking modules use (instagram_poster, get_post_count, get_credentials), so
+only the transport differs. AsyncInstagramClient keeps one aiohttp session
+with a keep-alive pool per host and a cookie jar shared by every call, and
+one event loop can drive several accounts (one client each) with their
+requests overlapping.
+
+aiohttp is imported on first use, the blocking modules do not need it.
+
+EX USAGE:
+python instagram_async.py <username> [<username> ...]
+
+'''
+import asyncio
+import json
+import os
+import sys
+from http.cookies import SimpleCookie
+
+from get_credentials import build_login_request, parse_login_response
+from get_post_count import (build_graphql_request, build_profile_request, build_search_request,
+                            find_user_id_in_profile, find_user_id_in_search, load_login_details,
+                            media_count_from_response)
+from image_info import upload_path
+from configure_readiness import get_readiness
+from instagram_client import COOKIE_DOMAIN, PAGE_HEADERS, POOL_SIZE, REQUEST_TIMEOUT, SESSION_HEADERS, WWW_URL
+from instagram_poster import build_configure_request, build_upload_request, new_upload_id, parse_configure_response
+
+# Seconds between the home page and the login page, like a browser
+LOGIN_PAGE_DELAY = 2
+
+
+class AsyncInstagramClient:
+    """
+    aiohttp counterpart of instagram_client.InstagramClient. The session is
+    created on first use so the client can be built outside the event loop.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = pool_size
+        self.csrf_token = None
+        self._session = None
+        self._pending_cookies = {}
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                headers=SESSION_HEADERS,
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size),
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+            if self._pending_cookies:
+                self._set_cookies(self._pending_cookies)
+                self._pending_cookies = {}
+        return self._session
+
+    def _set_cookies(self, cookies):
+        jar = SimpleCookie()
+        for name, value in cookies.items():
+            jar[name] = value
+            jar[name]['domain'] = COOKIE_DOMAIN
+            jar[name]['path'] = '/'
+        self._session.cookie_jar.update_cookies(jar)
+
+    @property
+    def cookies(self):
+        """Current cookies as a name -> value dict"""
+        if self._session is None:
+            return dict(self._pending_cookies)
+        return {cookie.key: cookie.value for cookie in self._session.cookie_jar}
+
+    def load_session_info(self, session_info):
+        """Restore the cookies and CSRF token saved by get_credentials.py"""
+        cookies = session_info.get('cookies', {})
+        if self._session is None:
+            self._pending_cookies.update(cookies)
+        else:
+            self._set_cookies(cookies)
+        self.csrf_token = session_info.get('csrf_token') or cookies.get('csrftoken')
+
+    def reset(self):
+        """Forget every cookie, before a fresh login"""
+        self._pending_cookies = {}
+        if self._session is not None:
+            self._session.cookie_jar.clear()
+        self.csrf_token = None
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def _read_file(path):
+    with open(upload_path(path), 'rb') as f:
+        return f.read()
+
+
+async def async_upload_image_to_instagram(client, image_path, upload_id):
+    """
+    Upload image file to Instagram's servers
+    """
+    image_data = await asyncio.to_thread(_read_file, image_path)
+    upload_url, headers = build_upload_request(upload_id, image_data)
+    try:
+        async with client.session.post(upload_url, headers=headers, data=image_data) as response:
+            if response.status == 200:
+                return True
+            print(f"❌ Upload failed: {await response.text()}")
+            return False
+    except Exception as e:
+        print(f"❌ Upload error: {e}")
+        return False
+
+
+async def async_configure_instagram_post(client, upload_id, caption="", csrf_token=None):
+    """
+    Configure and publish the Instagram post
+    """
+    csrf_token = csrf_token or client.csrf_token or client.cookies.get('csrftoken')
+    configure_url, headers, post_data = build_configure_request(upload_id, caption, csrf_token)
+    try:
+        async with client.session.post(configure_url, headers=headers, data=post_data) as response:
+            text = await response.text()
+            status = response.status
+        try:
+            return parse_configure_response(json.loads(text), status)
+        except json.JSONDecodeError:
+            print(f"❌ Invalid JSON response: {text}")
+            return {'success': False, 'error': 'Invalid JSON response'}
+    except Exception as e:
+        print(f"❌ Configure error: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+async def async_configure_when_ready(client, upload_id, caption="", csrf_token=None, uploaded_at=None,
+                                     readiness=None):
+    """
+    Configure the post as soon as Instagram accepts it, like
+    instagram_poster.configure_when_ready()
+    """
+    readiness = readiness or get_readiness()
+    loop = asyncio.get_running_loop()
+    if uploaded_at is None:
+        uploaded_at = loop.time()
+
+    tries = 0
+    for delay in readiness.schedule():
+        remaining = uploaded_at + delay - loop.time()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        tries += 1
+        sent_at = loop.time()
+        result = await async_configure_instagram_post(client, upload_id, caption, csrf_token)
+        if not result.get('not_ready'):
+            if result.get('success'):
+                readiness.record(sent_at - uploaded_at, tries)
+            return result
+
+    readiness.record_not_ready(tries)
+    print(f"❌ Upload {upload_id} was still not ready after {tries} tries")
+    return result
+
+
+async def async_post_to_instagram(client, image_path, caption="", csrf_token=None):
+    """
+    Complete Instagram posting function
+    """
+    upload_id = new_upload_id()
+    if not await async_upload_image_to_instagram(client, image_path, upload_id):
+        return {'success': False, 'error': 'Image upload failed'}
+    return await async_configure_when_ready(client, upload_id, caption, csrf_token)
+
+
+async def async_get_media_count_of_user(client, username, login_data=None):
+    """
+    Get the media count of a user by username, or None if it could not be
+    retrieved
+    """
+    if not username:
+        raise ValueError("Username cannot be empty")
+    if login_data is None:
+        login_data = await asyncio.to_thread(load_login_details)
+    client.load_session_info(login_data['session_info'])
+    csrf_token = login_data['session_info']['csrf_token']
+
+    target_user_id = None
+    profile_url, headers = build_profile_request(username)
+    try:
+        async with client.session.get(profile_url, headers=headers) as response:
+            response.raise_for_status()
+            target_user_id = find_user_id_in_profile(username, await response.text())
+    except Exception as e:
+        print(f"Error fetching profile page: {e}")
+
+    if not target_user_id:
+        search_url, headers, params = build_search_request(username, csrf_token)
+        try:
+            async with client.session.get(search_url, headers=headers, params=params) as response:
+                response.raise_for_status()
+                target_user_id = find_user_id_in_search(username, await response.json(content_type=None))
+        except Exception as e:
+            print(f"Error with search API: {e}")
+
+    if not target_user_id:
+        print(f"Failed to resolve user ID for @{username}")
+        return None
+
+    url, headers, data = build_graphql_request(username, target_user_id, csrf_token)
+    try:
+        async with client.session.post(url, headers=headers, data=data) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+    except Exception as e:
+        print(f"GraphQL request failed: {e}")
+        return None
+    return media_count_from_response(result)
+
+
+async def async_login(client, username=None, encrypted_password=None):
+    """
+    Log in with the encrypted browser password, like
+    get_credentials.instagram_login_with_env_encryption(). Returns the same
+    result dict, with the async client as 'session'.
+    """
+    username = username or os.getenv("INSTAGRAM_USERNAME")
+    encrypted_password = encrypted_password or os.getenv("INSTAGRAM_ENCRYPTED_PASSWORD")
+    if not username or not encrypted_password:
+        print("❌ Error: INSTAGRAM_USERNAME and INSTAGRAM_ENCRYPTED_PASSWORD must be set")
+        return None
+
+    client.reset()
+    try:
+        async with client.session.get(f"{WWW_URL}/", headers=PAGE_HEADERS) as response:
+            await response.read()
+        await asyncio.sleep(LOGIN_PAGE_DELAY)
+        async with client.session.get(f"{WWW_URL}/?flo=true", headers=PAGE_HEADERS) as response:
+            await response.read()
+            if response.status != 200:
+                print(f"❌ Failed to load login page: {response.status}")
+                return None
+
+        csrf_token = client.cookies.get('csrftoken')
+        login_url, headers, login_data = build_login_request(username, encrypted_password, csrf_token)
+        async with client.session.post(login_url, headers=headers, data=login_data) as response:
+            text = await response.text()
+    except Exception as e:
+        print(f"❌ Request failed: {e}")
+        return {'success': False, 'error': str(e)}
+
+    try:
+        result = parse_login_response(json.loads(text), client, client.cookies, csrf_token)
+    except json.JSONDecodeError:
+        print(f"❌ Invalid JSON response: {text}")
+        return {'success': False, 'error': 'Invalid JSON response'}
+    if result and result.get('success'):
+        client.csrf_token = csrf_token
+    return result
+
+
+async def _print_media_counts(usernames):
+    async with AsyncInstagramClient() as client:
+        counts = await asyncio.gather(*(async_get_media_count_of_user(client, name) for name in usernames))
+    for name, count in zip(usernames, counts):
+        print(f"User @{name} has {count} posts.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python instagram_async.py <username> [<username> ...]")
+        sys.exit(1)
+    asyncio.run(_print_media_counts([name.lstrip('@') for name in sys.argv[1:]]))
+
+
+# ENDOF FILE instagram_async.py
\ No newline at end of file
@@ -0,0 +1,209 @@
+'''
+Shared HTTP client for every request the bot makes to Instagram.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+One requests.Session is kept per process with a keep-alive connection pool
+mounted for each Instagram host (www.instagram.com for pages, login,
+configure and GraphQL, i.instagram.com for uploads) and one cookie jar
+shared by login, post counting and posting. The browser header templates
+are built once here; requests only add the values that change per call
+(CSRF token, upload id, sizes).
+
+INSTAGRAM_WWW_URL and INSTAGRAM_UPLOAD_URL point the bot at another server,
+such as the local stand-in in instagram_standin.py.
+
+'''
+import json
+import os
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+WWW_URL = os.getenv('INSTAGRAM_WWW_URL', 'https://www.instagram.com').rstrip('/')
+UPLOAD_URL = os.getenv('INSTAGRAM_UPLOAD_URL', 'https://i.instagram.com').rstrip('/')
+
+
+def cookie_domain(url):
+    """Domain saved cookies are set for, shared by every Instagram host"""
+    host = urlsplit(url).hostname or ''
+    return '.instagram.com' if host == 'instagram.com' or host.endswith('.instagram.com') else host
+
+
+COOKIE_DOMAIN = cookie_domain(WWW_URL)
+
+# Connections kept alive per host
+POOL_SIZE = 4
+
+REQUEST_TIMEOUT = 30
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36'
+APP_ID = '936619743392459'
+ASBD_ID = '359341'
+INSTAGRAM_AJAX = '1023572446'
+WEB_SESSION_ID = '9m0l9s:d48dze:k8lyo0'
+# The login request keeps the values it has always been sent with
+LOGIN_INSTAGRAM_AJAX = '1023570583'
+LOGIN_WEB_SESSION_ID = 'yt8jxi:yj4zmk:pzaeuk'
+WWW_CLAIM = 'hmac.AR1NQWcvrEmK3axZth3zzILQerkEFzY7y9fS5kgMjy7Nle_s'
+SEC_CH_UA = '"Chromium";v="136", "Brave";v="136", "Not.A/Brand";v="99"'
+SEC_CH_UA_FULL_VERSION_LIST = '"Chromium";v="136.0.0.0", "Brave";v="136.0.0.0", "Not.A/Brand";v="99.0.0.0"'
+
+# Sent with every request
+SESSION_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'X-IG-App-ID': APP_ID,
+    'Accept-Language': 'en-US,en;q=0.6',
+}
+
+# Top level page loads (home page, login page, profile pages)
+PAGE_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'sec-ch-ua': SEC_CH_UA,
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"macOS"',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# XHR calls on www.instagram.com (login, configure, search, GraphQL)
+AJAX_HEADERS = {
+    'sec-ch-ua-full-version-list': SEC_CH_UA_FULL_VERSION_LIST,
+    'sec-ch-ua-platform': '"macOS"',
+    'sec-ch-ua': SEC_CH_UA,
+    'sec-ch-ua-model': '""',
+    'sec-ch-ua-mobile': '?0',
+    'X-Requested-With': 'XMLHttpRequest',
+    'Accept': '*/*',
+    'X-Instagram-AJAX': INSTAGRAM_AJAX,
+    'X-Web-Session-ID': WEB_SESSION_ID,
+    'X-ASBD-ID': ASBD_ID,
+    'X-IG-WWW-Claim': WWW_CLAIM,
+    'sec-ch-ua-platform-version': '"15.5.0"',
+    'Sec-GPC': '1',
+    'Origin': WWW_URL,
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Dest': 'empty',
+    'Referer': f'{WWW_URL}/',
+    'Content-Type': 'application/x-www-form-urlencoded',
+}
+
+# Overrides of AJAX_HEADERS for the login call
+LOGIN_HEADERS = {
+    'X-Instagram-AJAX': LOGIN_INSTAGRAM_AJAX,
+    'X-Web-Session-ID': LOGIN_WEB_SESSION_ID,
+    'Referer': f'{WWW_URL}/?flo=true',
+}
+
+# Photo uploads to i.instagram.com
+UPLOAD_HEADERS = {
+    'X-Instagram-AJAX': INSTAGRAM_AJAX,
+    'sec-ch-ua-platform': '"macOS"',
+    'X-Web-Session-ID': WEB_SESSION_ID,
+    'Offset': '0',
+    'sec-ch-ua': SEC_CH_UA,
+    'sec-ch-ua-mobile': '?0',
+    'X-ASBD-ID': ASBD_ID,
+    'Accept': '*/*',
+    'Sec-GPC': '1',
+    'Origin': WWW_URL,
+    'Sec-Fetch-Site': 'same-site',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Dest': 'empty',
+    'Referer': f'{WWW_URL}/',
+}
+
+
+def ajax_headers(csrf_token, extra=None):
+    """AJAX_HEADERS with the CSRF token and any per-call headers"""
+    headers = dict(AJAX_HEADERS)
+    headers['X-CSRFToken'] = csrf_token
+    if extra:
+        headers.update(extra)
+    return headers
+
+
+def upload_headers(upload_id, length, width, height, mime_type='image/jpeg', is_sidecar=False):
+    """UPLOAD_HEADERS for one photo of `length` bytes, a carousel child if `is_sidecar`"""
+    params = {
+        "media_type": 1,
+        "upload_id": upload_id,
+        "upload_media_height": height,
+        "upload_media_width": width
+    }
+    if is_sidecar:
+        params["is_sidecar"] = "1"
+    headers = dict(UPLOAD_HEADERS)
+    headers.update({
+        'X-Instagram-Rupload-Params': json.dumps(params),
+        'X-Entity-Length': str(length),
+        'X-Entity-Type': mime_type,
+        'X-Entity-Name': f'fb_uploader_{upload_id}',
+        'Content-Type': mime_type,
+    })
+    return headers
+
+
+class InstagramClient:
+    """
+    One keep-alive session for all Instagram hosts with a shared cookie jar.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self.session = requests.Session()
+        self.session.headers.update(SESSION_HEADERS)
+        for base_url in (WWW_URL, UPLOAD_URL):
+            self.session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.csrf_token = None
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def load_session_info(self, session_info):
+        """Restore the cookies and CSRF token saved by get_credentials.py"""
+        for name, value in session_info.get('cookies', {}).items():
+            self.session.cookies.set(name, value, domain=COOKIE_DOMAIN)
+        self.csrf_token = session_info.get('csrf_token') or self.session.cookies.get('csrftoken')
+
+    def load_login_details(self, filename="login_details.json"):
+        """
+        Load the session saved in `filename`. Returns its session_info, or
+        None if there is no successful login in it.
+        """
+        with open(filename, 'r') as f:
+            login_details = json.load(f)
+        session_info = login_details.get('session_info')
+        if not session_info or not session_info.get('login_successful'):
+            return None
+        self.load_session_info(session_info)
+        return session_info
+
+    def reset(self):
+        """Forget every cookie, before a fresh login"""
+        self.session.cookies.clear()
+        self.csrf_token = None
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+def get_client():
+    """Get the process-wide client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = InstagramClient()
+    return _client
+
+
+# ENDOF FILE instagram_client.py
\ No newline at end of file
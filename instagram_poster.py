@@ -1,93 +1,66 @@
 import os
-import requests
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from dotenv import load_dotenv
+from configure_readiness import get_readiness, is_not_ready
+from image_info import sniff_image, upload_path
+from image_pack import get_pi_image, image_path_for
+from rate_governor import get_governor
+from instagram_client import POOL_SIZE, REQUEST_TIMEOUT, UPLOAD_URL, WWW_URL, ajax_headers, get_client, upload_headers
+from retry_policy import EndpointError, RetryBudget, get_policy
 
 # Load environment variables
 load_dotenv()
 
-def upload_image_to_instagram(session, image_path, upload_id):
+# Carousel children uploaded at once, one per pooled upload connection
+CAROUSEL_UPLOADS = POOL_SIZE
+
+# Bytes sent per rupload request, a connection cut off mid-upload loses at most one chunk
+UPLOAD_CHUNK_SIZE = int(os.getenv('PI_UPLOAD_CHUNK_SIZE', str(64 * 1024)))
+if UPLOAD_CHUNK_SIZE <= 0:
+    raise ValueError(f"PI_UPLOAD_CHUNK_SIZE must be a positive number of bytes, got {UPLOAD_CHUNK_SIZE}")
+
+# Seconds one chunk (or offset query) may take
+UPLOAD_CHUNK_TIMEOUT = 10
+
+# Cut-off chunks resumed within one upload call before it fails
+UPLOAD_RESUMES = 3
+
+# Seconds past its scheduled time a configure try may go out and still time the readiness delay
+ON_TIME_SLACK = 0.1
+
+_last_upload_id = 0
+_upload_id_lock = threading.Lock()
+
+def new_upload_id():
     """
-    Upload image file to Instagram's servers
+    Generate upload ID (timestamp-based like Instagram), unique within the
+    process even for the children of one carousel
     """
-    # print(f"📤 Uploading image: {image_path}")
-    
-    # Read and encode image
-    with open(image_path, 'rb') as f:
-        image_data = f.read()
-    
-    # Get image dimensions (you might want to add proper image dimension detection)
-    # For now, using 512x512 as in your example
-    width, height = 512, 512
-    
-    # Prepare upload headers
-    upload_headers = {
-        'Host': 'i.instagram.com',
-        'Connection': 'keep-alive',
-        'X-Instagram-Rupload-Params': json.dumps({
-            "media_type": 1,
-            "upload_id": upload_id,
-            "upload_media_height": height,
-            "upload_media_width": width
-        }),
-        'X-Instagram-AJAX': '1023572446',
-        'sec-ch-ua-platform': '"macOS"',
-        'X-Web-Session-ID': '9m0l9s:d48dze:k8lyo0',
-        'Offset': '0',
-        'sec-ch-ua': '"Chromium";v="136", "Brave";v="136", "Not.A/Brand";v="99"',
-        'sec-ch-ua-mobile': '?0',
-        'X-Entity-Length': str(len(image_data)),
-        'X-IG-App-ID': '936619743392459',
-        'X-ASBD-ID': '359341',
-        'X-Entity-Type': 'image/jpeg',
-        'X-Entity-Name': f'fb_uploader_{upload_id}',
-        'Accept': '*/*',
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-        'Sec-GPC': '1',
-        'Accept-Language': 'en-US,en;q=0.6',
-        'Origin': 'https://www.instagram.com',
-        'Sec-Fetch-Site': 'same-site',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Dest': 'empty',
-        'Referer': 'https://www.instagram.com/',
-        'Content-Type': 'image/jpeg'
-    }
-    
-    # Upload image
-    upload_url = f'https://i.instagram.com/rupload_igphoto/fb_uploader_{upload_id}'
-    
-    try:
-        response = session.post(
-            upload_url,
-            headers=upload_headers,
-            data=image_data,
-            timeout=30
-        )
-        
-        # print(f"📤 Upload Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            # print("✅ Image uploaded successfully!")
-            return True
-        else:
-            print(f"❌ Upload failed: {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Upload error: {e}")
-        return False
+    global _last_upload_id
+    with _upload_id_lock:
+        _last_upload_id = max(int(time.time() * 1000), _last_upload_id + 1)
+        return str(_last_upload_id)
 
-def configure_instagram_post(session, upload_id, caption="", csrf_token=None):
+def build_upload_request(upload_id, image_data, width=None, height=None, mime_type=None, is_sidecar=False):
     """
-    Configure and publish the Instagram post
+    Build the URL and headers for uploading image_data. The size and MIME
+    type are read from the image header unless given.
+    """
+    if width is None or height is None or mime_type is None:
+        info = sniff_image(image_data)
+        width, height, mime_type = info.width, info.height, info.mime_type
+    headers = upload_headers(upload_id, len(image_data), width, height, mime_type, is_sidecar)
+    upload_url = f'{UPLOAD_URL}/rupload_igphoto/fb_uploader_{upload_id}'
+    return upload_url, headers
+
+def build_configure_request(upload_id, caption, csrf_token):
+    """
+    Build the URL, headers and form data that publish an uploaded image
     """
-    # print(f"📝 Configuring post with caption: '{caption}'")
-    
-    # Get CSRF token from session if not provided
-    if not csrf_token:
-        csrf_token = session.cookies.get('csrftoken')
-    
     # Prepare post data (from your curl command)
     post_data = {
         'archive_only': 'false',
@@ -107,78 +80,295 @@ def configure_instagram_post(session, upload_id, caption="", csrf_token=None):
         'video_subtitles_enabled': '0',
         'jazoest': '22916'
     }
-    
-    # Prepare headers (from your curl command)
-    configure_headers = {
-        'Host': 'www.instagram.com',
-        'Connection': 'keep-alive',
-        'sec-ch-ua-full-version-list': '"Chromium";v="136.0.0.0", "Brave";v="136.0.0.0", "Not.A/Brand";v="99.0.0.0"',
-        'sec-ch-ua-platform': '"macOS"',
-        'sec-ch-ua': '"Chromium";v="136", "Brave";v="136", "Not.A/Brand";v="99"',
-        'sec-ch-ua-model': '""',
-        'sec-ch-ua-mobile': '?0',
-        'X-IG-App-ID': '936619743392459',
-        'X-Requested-With': 'XMLHttpRequest',
-        'Accept': '*/*',
-        'X-Instagram-AJAX': '1023572446',
-        'X-CSRFToken': csrf_token,
-        'X-Web-Session-ID': '9m0l9s:d48dze:k8lyo0',
-        'X-ASBD-ID': '359341',
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-        'X-IG-WWW-Claim': 'hmac.AR1NQWcvrEmK3axZth3zzILQerkEFzY7y9fS5kgMjy7Nle_s',
-        'sec-ch-ua-platform-version': '"15.5.0"',
-        'Sec-GPC': '1',
-        'Accept-Language': 'en-US,en;q=0.6',
-        'Origin': 'https://www.instagram.com',
-        'Sec-Fetch-Site': 'same-origin',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Dest': 'empty',
-        'Referer': 'https://www.instagram.com/',
-        'Content-Type': 'application/x-www-form-urlencoded'
+    configure_url = f'{WWW_URL}/api/v1/media/configure/'
+    return configure_url, ajax_headers(csrf_token), post_data
+
+def build_configure_sidecar_request(upload_ids, caption, csrf_token):
+    """
+    Build the URL, headers and form data that publish uploaded images as one
+    carousel, in the order of upload_ids
+    """
+    post_data = {
+        'archive_only': 'false',
+        'caption': caption,
+        'children_metadata': json.dumps([{'upload_id': upload_id} for upload_id in upload_ids]),
+        'client_sidecar_id': new_upload_id(),
+        'disable_comments': '0',
+        'like_and_view_counts_disabled': '0',
+        'share_to_facebook': '',
+        'share_to_fb_destination_type': 'USER',
+        'source_type': 'library',
+        'jazoest': '22916'
     }
+    configure_url = f'{WWW_URL}/api/v1/media/configure_sidecar/'
+    return configure_url, ajax_headers(csrf_token), post_data
+
+def parse_configure_response(response_json, status_code=None):
+    """
+    Turn the configure response into the result of post_to_instagram().
+    'not_ready' is set when the upload was not processed yet.
+    """
+    if response_json.get('status') == 'ok':
+        # print("🎉 POST PUBLISHED SUCCESSFULLY!")
+        media_info = response_json.get('media', {})
+        # print(f"📱 Media ID: {media_info.get('id')}")
+        # print(f"🔗 Media Code: {media_info.get('code')}")
+        
+        return {
+            'success': True,
+            'media_id': media_info.get('id'),
+            'media_code': media_info.get('code'),
+            'response': response_json
+        }
+    elif is_not_ready(response_json, status_code):
+        return {
+            'success': False,
+            'not_ready': True,
+            'response': response_json
+        }
+    else:
+        print(f"❌ Post configuration failed: {response_json}")
+        return {
+            'success': False,
+            'response': response_json
+        }
+
+def upload_image_to_instagram(session, image_path, upload_id):
+    """
+    Upload image file to Instagram's servers
+    """
+    # print(f"📤 Uploading image: {image_path}")
+    
+    # Read and encode image (its JPEG version when PI_IMAGE_JPEG=1)
+    with open(upload_path(image_path), 'rb') as f:
+        image_data = f.read()
+    
+    return upload_image_data(session, image_data, upload_id)
+
+def upload_pi_image(session, number, upload_id):
+    """
+    Upload the image of a pi digit straight from the image pack
+    """
+    image = get_pi_image(number)
+    return upload_image_data(session, image.data, upload_id, image.width, image.height, image.mime_type)
+
+def _request_error(e):
+    """Result dict of a request that raised, 'sent' is False when nothing left"""
+    return {'success': False, 'error': str(e), 'sent': not isinstance(e, requests.exceptions.ConnectTimeout)}
+
+def query_upload_offset(session, upload_url, headers):
+    """
+    Bytes of an upload the server already has (the GET of the rupload Offset
+    protocol), 0 for an upload it has not seen
+    """
+    response = session.get(upload_url, headers=headers, timeout=UPLOAD_CHUNK_TIMEOUT)
+    response.raise_for_status()
+    return int(response.json().get('offset', 0))
+
+def _send_chunks(session, upload_url, headers, data, offset):
+    """
+    POST data from offset on, UPLOAD_CHUNK_SIZE bytes per request. Returns
+    the last response, a failed one stops the upload, or None when the
+    server had everything already
+    """
+    response = None
+    while offset < len(data):
+        chunk = data[offset:offset + UPLOAD_CHUNK_SIZE]
+        chunk_headers = dict(headers, Offset=str(offset))
+        response = session.post(upload_url, headers=chunk_headers, data=chunk, timeout=UPLOAD_CHUNK_TIMEOUT)
+        if response.status_code != 200:
+            break
+        offset += len(chunk)
+    return response
+
+def upload_image_data(session, image_data, upload_id, width=None, height=None, mime_type=None, is_sidecar=False,
+                      resume=False):
+    """
+    Upload image bytes (or a memoryview of them) that are already in memory
+    to Instagram's servers, in chunks. When a chunk is cut off or answered
+    with a 5xx, the upload goes on from the offset the server reports instead
+    of starting over; with resume=True (a retry of the same upload_id) it
+    starts there too. Returns a result dict like configure_instagram_post()
+    """
+    upload_url, headers = build_upload_request(upload_id, image_data, width, height, mime_type, is_sidecar)
+    data = memoryview(image_data)
+    governor = get_governor()
+    governor.acquire('rupload')
+    
+    resumes = 0
+    while True:
+        try:
+            offset = query_upload_offset(session, upload_url, headers) if resume else 0
+            response = _send_chunks(session, upload_url, headers, data, offset)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if resumes >= UPLOAD_RESUMES:
+                print(f"❌ Upload error: {e}")
+                return _request_error(e)
+            print(f"🔌 Upload {upload_id} cut off, resuming ({e})")
+        else:
+            # A 5xx loses the chunk, not the upload; a Retry-After is the governor's to sit out
+            if (response is None or response.status_code < 500 or 'Retry-After' in response.headers
+                    or resumes >= UPLOAD_RESUMES):
+                break
+            governor.observe_response('rupload', response)
+            print(f"🔌 Upload {upload_id} chunk failed with status {response.status_code}, resuming")
+        resumes += 1
+        resume = True
+    
+    if response is not None:
+        governor.observe_response('rupload', response)
+    
+    # print(f"📤 Upload Status: {response.status_code}")
+    
+    if response is None or response.status_code == 200:
+        # print("✅ Image uploaded successfully!")
+        return {'success': True, 'status_code': 200 if response is None else response.status_code}
+    else:
+        print(f"❌ Upload failed: {response.text}")
+        try:
+            response_json = response.json()
+        except ValueError:
+            response_json = None
+        return {'success': False, 'status_code': response.status_code, 'response': response_json,
+                'error': f"Upload failed with status {response.status_code}"}
+
+def upload_image_resumable(session, image, upload_id, is_sidecar=False, budget=None, policy=None):
+    """
+    Upload a PackedImage retried by the policy, every retry resuming from the
+    bytes the server already has
+    """
+    policy = policy or get_policy()
+    tries = []
     
-    # Configure post
-    configure_url = 'https://www.instagram.com/api/v1/media/configure/'
+    def attempt():
+        tries.append(upload_id)
+        return upload_image_data(session, image.data, upload_id, image.width, image.height, image.mime_type,
+                                 is_sidecar, resume=len(tries) > 1)
+    
+    return policy.call_result('rupload', attempt, budget=budget)
+
+def upload_carousel_images(session, images, upload_ids, budget=None, policy=None, max_workers=CAROUSEL_UPLOADS):
+    """
+    Upload the PackedImages of a carousel as sidecar children, several at a
+    time, each retried by the policy. Raises the EndpointError of the first
+    child that fails for good.
+    """
+    
+    def upload(image, upload_id):
+        return upload_image_resumable(session, image, upload_id, True, budget, policy)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as pool:
+        futures = [pool.submit(upload, image, upload_id) for image, upload_id in zip(images, upload_ids)]
+        return [future.result() for future in futures]
+
+def configure_instagram_post(session, upload_id, caption="", csrf_token=None):
+    """
+    Configure and publish the Instagram post
+    """
+    # print(f"📝 Configuring post with caption: '{caption}'")
+    
+    # Get CSRF token from session if not provided
+    if not csrf_token:
+        csrf_token = session.cookies.get('csrftoken')
+    
+    configure_url, configure_headers, post_data = build_configure_request(upload_id, caption, csrf_token)
+    return _send_configure(session, configure_url, configure_headers, post_data)
+
+def configure_sidecar_post(session, upload_ids, caption="", csrf_token=None):
+    """
+    Publish uploaded carousel children as one Instagram post
+    """
+    if not csrf_token:
+        csrf_token = session.cookies.get('csrftoken')
+    
+    configure_url, configure_headers, post_data = build_configure_sidecar_request(upload_ids, caption, csrf_token)
+    return _send_configure(session, configure_url, configure_headers, post_data)
+
+def _send_configure(session, configure_url, configure_headers, post_data):
+    """
+    Send a configure request under the 'configure' rate class and turn the
+    answer into a result dict. 'sent_at' is when the request went out, after
+    the wait for a token
+    """
+    governor = get_governor()
+    governor.acquire('configure')
+    sent_at = time.monotonic()
     
     try:
         response = session.post(
             configure_url,
             headers=configure_headers,
             data=post_data,
-            timeout=30
+            timeout=REQUEST_TIMEOUT
         )
         
         # print(f"📝 Configure Status: {response.status_code}")
         
         try:
             response_json = response.json()
-            
-            if response_json.get('status') == 'ok':
-                # print("🎉 POST PUBLISHED SUCCESSFULLY!")
-                media_info = response_json.get('media', {})
-                # print(f"📱 Media ID: {media_info.get('id')}")
-                # print(f"🔗 Media Code: {media_info.get('code')}")
-                
-                return {
-                    'success': True,
-                    'media_id': media_info.get('id'),
-                    'media_code': media_info.get('code'),
-                    'response': response_json
-                }
-            else:
-                print(f"❌ Post configuration failed: {response_json}")
-                return {
-                    'success': False,
-                    'response': response_json
-                }
-                
         except json.JSONDecodeError:
+            governor.observe('configure', response.status_code, response.headers)
             print(f"❌ Invalid JSON response: {response.text}")
-            return {'success': False, 'error': 'Invalid JSON response'}
+            result = {'success': False, 'error': 'Invalid JSON response'}
+        else:
+            governor.observe('configure', response.status_code, response.headers, response_json)
+            result = parse_configure_response(response_json, response.status_code)
+        result['status_code'] = response.status_code
             
-    except Exception as e:
+    except requests.exceptions.RequestException as e:
         print(f"❌ Configure error: {e}")
-        return {'success': False, 'error': str(e)}
+        result = _request_error(e)
+    result['sent_at'] = sent_at
+    return result
+
+def configure_when_ready(session, upload_id, caption="", csrf_token=None, uploaded_at=None, readiness=None):
+    """
+    Configure the post as soon as Instagram accepts it, trying at the delays
+    the readiness controller schedules after `uploaded_at` (time.monotonic()
+    at the end of the upload, now if not given)
+    """
+    return _when_ready(lambda: configure_instagram_post(session, upload_id, caption, csrf_token),
+                       upload_id, uploaded_at, readiness)
+
+def configure_sidecar_when_ready(session, upload_ids, caption="", csrf_token=None, uploaded_at=None, readiness=None):
+    """
+    configure_when_ready() for a carousel, once its last child is uploaded
+    """
+    return _when_ready(lambda: configure_sidecar_post(session, upload_ids, caption, csrf_token),
+                       upload_ids[-1], uploaded_at, readiness)
+
+def _when_ready(configure, upload_id, uploaded_at=None, readiness=None):
+    readiness = readiness or get_readiness()
+    if uploaded_at is None:
+        uploaded_at = time.monotonic()
+    
+    delays = list(readiness.schedule())
+    now = time.monotonic()
+    if uploaded_at + delays[-1] <= now:
+        # A retried call after the whole schedule: space the tries out from now instead
+        start = now
+    else:
+        # Tries whose time is past collapse into one right away
+        start = uploaded_at
+        delays = delays[max(sum(1 for delay in delays if uploaded_at + delay <= now) - 1, 0):]
+    
+    tries = 0
+    for delay in delays:
+        remaining = start + delay - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        tries += 1
+        result = configure()
+        sent_at = result.get('sent_at', time.monotonic())
+        if not result.get('not_ready'):
+            # A first try sent late (after a retry's backoff or a token wait) says nothing about the readiness delay
+            if result.get('success') and (tries > 1 or sent_at - (uploaded_at + delay) < ON_TIME_SLACK):
+                readiness.record(sent_at - uploaded_at, tries)
+            return result
+    
+    readiness.record_not_ready(tries)
+    print(f"❌ Upload {upload_id} was still not ready after {tries} tries")
+    return result
 
 def post_to_instagram(session, image_path, caption="", csrf_token=None):
     """
@@ -187,54 +377,42 @@ def post_to_instagram(session, image_path, caption="", csrf_token=None):
     # print("📸 Starting Instagram Post Process")
     # print("=" * 50)
     
-    # Generate upload ID (timestamp-based like Instagram)
-    upload_id = str(int(time.time() * 1000))
+    upload_id = new_upload_id()
     # print(f"🆔 Upload ID: {upload_id}")
+    policy = get_policy()
+    budget = RetryBudget()
     
     # Step 1: Upload image
-    upload_success = upload_image_to_instagram(session, image_path, upload_id)
-    if not upload_success:
-        return {'success': False, 'error': 'Image upload failed'}
-    
-    # Small delay between upload and configure
-    time.sleep(2)
+    try:
+        policy.call_result('rupload', upload_image_to_instagram, session, image_path, upload_id, budget=budget)
+    except EndpointError as e:
+        return {'success': False, 'error': f'Image upload failed: {e}'}
+    uploaded_at = time.monotonic()
     
-    # Step 2: Configure post
-    result = configure_instagram_post(session, upload_id, caption, csrf_token)
+    # Step 2: Configure post once Instagram has processed the upload. There is
+    # no post count here to check a failed try against, so an ambiguous
+    # failure is not retried
+    try:
+        result = policy.call_result('configure', configure_when_ready, session, upload_id, caption, csrf_token,
+                                    uploaded_at, budget=budget, idempotent=False)
+    except EndpointError as e:
+        return {'success': False, 'error': str(e)}
     
     return result
 
 def load_session_from_login_details(filename="login_details.json"):
     """
-    Load session data and recreate session object
+    Load session data into the shared client and return its session
     """
     try:
-        with open(filename, 'r') as f:
-            login_details = json.load(f)
-        
-        session_info = login_details.get('session_info')
-        if not session_info or not session_info.get('login_successful'):
+        client = get_client()
+        session_info = client.load_login_details(filename)
+        if not session_info:
             print("❌ No valid session found in login details")
             return None, None
         
-        # Recreate session
-        session = requests.Session()
-        
-        # Restore cookies
-        cookies = session_info.get('cookies', {})
-        for name, value in cookies.items():
-            session.cookies.set(name, value, domain='.instagram.com')
-        
-        # Set headers
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-            "X-IG-App-ID": "936619743392459",
-        })
-        
-        csrf_token = session_info.get('csrf_token')
-        
         # print("✅ Session loaded from login_details.json")
-        return session, csrf_token
+        return client.session, client.csrf_token
         
     except Exception as e:
         print(f"❌ Failed to load session: {e}")
@@ -244,30 +422,7 @@ def get_path_to_pi_image(number):
     """
     Get the path to the image file for the given pi digit number
     """
-    if number == -1:
-        return "images/starwars_cosmic_dot/starwars_decimal_dot.png"
-    elif number == 0:
-        return "images/starwars_cosmic_digits/0.png"
-    elif number == 1:
-        return "images/starwars_cosmic_digits/1.png"
-    elif number == 2:
-        return "images/starwars_cosmic_digits/2.png"
-    elif number == 3:
-        return "images/starwars_cosmic_digits/3.png"
-    elif number == 4:
-        return "images/starwars_cosmic_digits/4.png"
-    elif number == 5:
-        return "images/starwars_cosmic_digits/5.png"
-    elif number == 6:
-        return "images/starwars_cosmic_digits/6.png"
-    elif number == 7:
-        return "images/starwars_cosmic_digits/7.png"
-    elif number == 8:
-        return "images/starwars_cosmic_digits/8.png"
-    elif number == 9:
-        return "images/starwars_cosmic_digits/9.png"
-    else:
-        raise ValueError(f"Invalid pi digit number: {number}. Must be between -1 and 9.")
+    return image_path_for(number)
 
 def post_pi_number(number, caption=""):
     """
@@ -0,0 +1,489 @@
+'''
+Local stand-in for the Instagram endpoints the bot calls.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Implements just enough of Instagram to run the bot offline: the home and
+login pages (csrftoken cookie), the login ajax call (sessionid cookie),
+rupload_igphoto (chunks sent with an Offset header, and a GET for the
+bytes already received), media/configure and media/configure_sidecar (with a
+transcode delay before an upload can be configured), graphql/query
+(media_count), profile pages and web/search/topsearch. Everything but the home page and login checks for the
+sessionid cookie, which also picks the account a post goes to. With
+--accounts N there are N accounts: USERNAME, USERNAME_1, ... USERNAME_<N-1>.
+
+Latency, 5xx errors and 429s (with Retry-After) can be injected per
+request. A 5xx on configure publishes the post half of the time first, like
+a response lost after the fact. With --drop-rate an upload chunk is cut
+off: part of it is received and the connection closes without an answer.
+With --count-lag a post only shows up in media_count that many seconds after
+it is published, like Instagram's lagging count. StandinStats counts requests, statuses,
+posts and the images in them, configures of an already published upload
+(double posts) and the bytes on the wire both ways.
+
+EX USAGE:
+python instagram_standin.py --port 8765 --latency 0.05 --error-rate 0.01 --rate-limit 0.005
+python instagram_standin.py --port 8765 --drop-rate 0.2
+INSTAGRAM_WWW_URL=http://127.0.0.1:8765 INSTAGRAM_UPLOAD_URL=http://127.0.0.1:8765 python main.py
+
+'''
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+USERNAME = 'pi_standin'
+USER_ID = '1414213562'
+
+# Endpoints that latency, errors and 429s are injected into
+INJECTED_ENDPOINTS = ('rupload', 'rupload_offset', 'configure', 'configure_sidecar', 'graphql', 'profile', 'search')
+
+# Items of one carousel
+MAX_CAROUSEL = 10
+
+_UPLOAD_PATH = re.compile(r'^/rupload_igphoto/fb_uploader_(\w+)$')
+
+
+class StandinConfig:
+    """What the stand-in serves and how badly it behaves"""
+
+    def __init__(self, username=USERNAME, user_id=USER_ID, media_count=0, latency=0.0, jitter=0.5,
+                 error_rate=0.0, rate_limit=0.0, retry_after=1, transcode_delay=0.0, seed=None, accounts=1,
+                 drop_rate=0.0, count_lag=0.0):
+        self.username = username
+        self.user_id = user_id
+        self.media_count = media_count
+        self.accounts = accounts
+        # Mean seconds added to each injected endpoint, +/- jitter of it
+        self.latency = latency
+        self.jitter = jitter
+        # Chance of a 500 and of a 429 per request to an injected endpoint
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # Chance that an upload chunk is cut off partway
+        self.drop_rate = drop_rate
+        # Seconds before a published post counts in media_count
+        self.count_lag = count_lag
+        # Seconds after an upload before configure accepts it
+        self.transcode_delay = transcode_delay
+        self.random = random.Random(seed)
+
+
+class StandinStats:
+    """Counters of one stand-in, safe to read while it serves"""
+
+    def __init__(self):
+        self.requests = {}
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.posts = 0
+        self.images = 0
+        self.double_posts = 0
+        self.injected_errors = 0
+        self.injected_rate_limits = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def count(self, endpoint, status, bytes_in, bytes_out):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            key = f"{endpoint} {status}"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'statuses': dict(self.statuses),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'posts': self.posts,
+                'images': self.images,
+                'double_posts': self.double_posts,
+                'injected_errors': self.injected_errors,
+                'injected_rate_limits': self.injected_rate_limits,
+                'dropped': self.dropped,
+            }
+
+
+def account_username(username, number):
+    """Username of account `number` of the stand-in"""
+    return username if number == 0 else f"{username}_{number}"
+
+
+class StandinAccount:
+    """One account of the stand-in and its posts"""
+
+    def __init__(self, username, user_id, media_count):
+        self.username = username
+        self.user_id = user_id
+        self.media_count = media_count
+        self.published = set()
+        self.published_at = []
+
+    def visible_count(self, lag):
+        """media_count without the posts published in the last `lag` seconds"""
+        cutoff = time.monotonic() - lag
+        recent = 0
+        for published_at in reversed(self.published_at):
+            if published_at <= cutoff:
+                break
+            recent += 1
+        return self.media_count - recent
+
+
+class StandinState:
+    """Accounts, sessions and uploads of the stand-in"""
+
+    def __init__(self, config):
+        self.accounts = {}
+        for number in range(config.accounts):
+            account = StandinAccount(account_username(config.username, number), str(int(config.user_id) + number),
+                                     config.media_count)
+            self.accounts[account.username] = account
+        self.by_id = {account.user_id: account for account in self.accounts.values()}
+        self.uploads = {}
+        # Bytes received of the uploads still in progress
+        self.received = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'InstagramStandin/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _cookies(self):
+        cookies = {}
+        for part in self.headers.get('Cookie', '').split(';'):
+            if '=' in part:
+                name, value = part.strip().split('=', 1)
+                cookies[name] = value
+        return cookies
+
+    def _send(self, status, body, content_type='application/json', headers=None, cookies=()):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        for cookie in cookies:
+            self.send_header('Set-Cookie', f"{cookie}; Path=/")
+        self._bytes_out = sum(len(line) for line in self._headers_buffer) + 2 + len(body)
+        self.end_headers()
+        self.wfile.write(body)
+        self._status = status
+
+    def _account(self):
+        """The account of the request's sessionid, None when not logged in"""
+        return self.state.sessions.get(self._cookies().get('sessionid'))
+
+    def _handle(self, method):
+        self._status = None
+        self._bytes_out = 0
+        url = urlsplit(self.path)
+        endpoint, handler = self._route(method, url.path)
+        if endpoint == 'rupload' and self.config.drop_rate and self.config.random.random() < self.config.drop_rate:
+            return self._drop(url)
+        body = self._read_body() if method == 'POST' else b''
+        bytes_in = len(self.raw_requestline) + len(str(self.headers)) + len(body)
+
+        if endpoint in INJECTED_ENDPOINTS and not self._inject(endpoint, body):
+            pass
+        elif endpoint not in ('home', 'login', 'unknown') and self._account() is None:
+            self._send(403, {'message': 'login_required', 'require_login': True, 'status': 'fail'})
+        else:
+            handler(url, body)
+        self.stats.count(endpoint, self._status, bytes_in, self._bytes_out)
+
+    def _route(self, method, path):
+        if method == 'GET' and path == '/':
+            return 'home', self.home
+        if method == 'POST' and path == '/api/v1/web/accounts/login/ajax/':
+            return 'login', self.login
+        if method == 'POST' and _UPLOAD_PATH.match(path):
+            return 'rupload', self.rupload
+        if method == 'GET' and _UPLOAD_PATH.match(path):
+            return 'rupload_offset', self.rupload_offset
+        if method == 'POST' and path == '/api/v1/media/configure/':
+            return 'configure', self.configure
+        if method == 'POST' and path == '/api/v1/media/configure_sidecar/':
+            return 'configure_sidecar', self.configure_sidecar
+        if method == 'POST' and path.rstrip('/') == '/graphql/query':
+            return 'graphql', self.graphql
+        if method == 'GET' and path == '/web/search/topsearch/':
+            return 'search', self.search
+        if method == 'GET' and re.match(r'^/[\w.]+/$', path):
+            return 'profile', self.profile
+        return 'unknown', self.not_found
+
+    def _inject(self, endpoint, body):
+        """Sleep and maybe fail the request, False when a failure was sent"""
+        config = self.config
+        rng = config.random
+        if config.latency:
+            time.sleep(max(0.0, config.latency * (1 + config.jitter * (2 * rng.random() - 1))))
+        if config.rate_limit and rng.random() < config.rate_limit:
+            with self.stats._lock:
+                self.stats.injected_rate_limits += 1
+            self._send(429, {'message': 'Please wait a few minutes before you try again.', 'status': 'fail'},
+                       headers={'Retry-After': str(config.retry_after)})
+            return False
+        if config.error_rate and rng.random() < config.error_rate:
+            with self.stats._lock:
+                self.stats.injected_errors += 1
+            if endpoint.startswith('configure') and self._account() is not None and rng.random() < 0.5:
+                # The post goes out, the answer does not make it back
+                getattr(self, endpoint)(None, body, send=False)
+            self._send(500, 'Internal Server Error', 'text/html')
+            return False
+        return True
+
+    def _drop(self, url):
+        """Receive part of an upload chunk and close the connection without an answer"""
+        length = int(self.headers.get('Content-Length', 0))
+        part = self.rfile.read(self.config.random.randrange(length)) if length else b''
+        upload_id = _UPLOAD_PATH.match(url.path).group(1)
+        offset = int(self.headers.get('Offset', 0))
+        with self.state.lock:
+            if upload_id not in self.state.uploads and offset <= self.state.received.get(upload_id, 0):
+                self.state.received[upload_id] = offset + len(part)
+        with self.stats._lock:
+            self.stats.dropped += 1
+        self.stats.count('rupload', 'dropped', len(self.raw_requestline) + len(str(self.headers)) + len(part), 0)
+        self.close_connection = True
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    # Endpoints
+
+    def home(self, url, body):
+        self._send(200, '<html><body>Instagram stand-in</body></html>', 'text/html',
+                   cookies=['csrftoken=standin-csrf', 'mid=standin-mid', 'ig_did=standin-did'])
+
+    def login(self, url, body):
+        form = parse_qs(body.decode('utf-8'))
+        account = self.state.accounts.get(form.get('username', [''])[0])
+        if account is None or not form.get('enc_password', [''])[0]:
+            return self._send(200, {'authenticated': False, 'user': account is not None, 'status': 'ok'})
+        session_id = f"standin-{account.user_id}-{time.time_ns()}"
+        with self.state.lock:
+            self.state.sessions[session_id] = account
+        self._send(200, {'authenticated': True, 'userId': account.user_id, 'status': 'ok'},
+                   cookies=[f"sessionid={session_id}", f"ds_user_id={account.user_id}"])
+
+    def rupload(self, url, body):
+        upload_id = _UPLOAD_PATH.match(url.path).group(1)
+        offset = int(self.headers.get('Offset', 0))
+        length = int(self.headers.get('X-Entity-Length', offset + len(body)))
+        with self.state.lock:
+            if upload_id in self.state.uploads:
+                return self._send(200, {'upload_id': upload_id, 'xsharing_nonces': {}, 'status': 'ok'})
+            received = self.state.received.get(upload_id, 0)
+            if offset > received:
+                return self._send(400, {'message': f'Offset {offset} is past the {received} bytes received',
+                                        'status': 'fail'})
+            if offset + len(body) > length:
+                return self._send(400, {'message': f'Expected {length} bytes, got {offset + len(body)}',
+                                        'status': 'fail'})
+            if offset + len(body) < length:
+                self.state.received[upload_id] = offset + len(body)
+                return self._send(200, {'offset': offset + len(body), 'status': 'ok'})
+            self.state.received.pop(upload_id, None)
+            self.state.uploads[upload_id] = time.monotonic() + self.config.transcode_delay
+        self._send(200, {'upload_id': upload_id, 'xsharing_nonces': {}, 'status': 'ok'})
+
+    def rupload_offset(self, url, body):
+        upload_id = _UPLOAD_PATH.match(url.path).group(1)
+        with self.state.lock:
+            if upload_id in self.state.uploads:
+                offset = int(self.headers.get('X-Entity-Length', 0))
+            else:
+                offset = self.state.received.get(upload_id, 0)
+        self._send(200, {'offset': offset, 'status': 'ok'})
+
+    def _publish(self, account, upload_ids, key, caption):
+        """Publish uploads as one post of `account`, the (status, body) to answer"""
+        with self.state.lock:
+            now = time.monotonic()
+            ready_at = [self.state.uploads.get(upload_id) for upload_id in upload_ids]
+            if not upload_ids or None in ready_at:
+                return 400, {'message': 'Upload not found', 'status': 'fail'}
+            if now < max(ready_at):
+                return 202, {'message': 'Transcode not finished yet.', 'status': 'fail'}
+            if key in account.published:
+                self.stats.double_posts += 1
+            account.published.add(key)
+            account.media_count += 1
+            account.published_at.append(now)
+            self.stats.posts += 1
+            self.stats.images += len(upload_ids)
+            media = {'id': f"{key}_{account.user_id}", 'code': f"standin{account.user_id}x{account.media_count}",
+                     'caption': {'text': caption}}
+        if len(upload_ids) > 1:
+            media['carousel_media'] = [{'id': f"{upload_id}_{account.user_id}"} for upload_id in upload_ids]
+        return 200, {'media': media, 'upload_id': key, 'status': 'ok'}
+
+    def configure(self, url, body, send=True):
+        form = parse_qs(body.decode('utf-8'))
+        upload_id = form.get('upload_id', [''])[0]
+        response = self._publish(self._account(), [upload_id] if upload_id else [], upload_id,
+                                 form.get('caption', [''])[0])
+        if send:
+            self._send(*response)
+
+    def configure_sidecar(self, url, body, send=True):
+        form = parse_qs(body.decode('utf-8'))
+        try:
+            children = [child['upload_id'] for child in json.loads(form.get('children_metadata', ['[]'])[0])]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            children = []
+        if not 2 <= len(children) <= MAX_CAROUSEL:
+            response = (400, {'message': f'A carousel needs 2 to {MAX_CAROUSEL} items', 'status': 'fail'})
+        else:
+            # The same children published twice are the same post twice
+            response = self._publish(self._account(), children, ','.join(children), form.get('caption', [''])[0])
+        if send:
+            self._send(*response)
+
+    def graphql(self, url, body):
+        form = parse_qs(body.decode('utf-8'))
+        try:
+            variables = json.loads(form.get('variables', ['{}'])[0])
+        except json.JSONDecodeError:
+            variables = {}
+        account = self.state.by_id.get(variables.get('id'))
+        if account is None:
+            return self._send(200, {'data': {'user': None}, 'status': 'ok'})
+        with self.state.lock:
+            media_count = account.visible_count(self.config.count_lag)
+        self._send(200, {'data': {'user': {'id': account.user_id, 'username': account.username,
+                                           'media_count': media_count}}, 'status': 'ok'})
+
+    def search(self, url, body):
+        query = parse_qs(url.query).get('query', [''])[0]
+        users = [{'position': position, 'user': {'pk': account.user_id, 'username': account.username}}
+                 for position, account in enumerate(a for a in self.state.accounts.values()
+                                                    if query and query in a.username)]
+        self._send(200, {'users': users, 'places': [], 'hashtags': [], 'status': 'ok'})
+
+    def profile(self, url, body):
+        account = self.state.accounts.get(url.path.strip('/'))
+        if account is None:
+            return self._send(404, '<html><body>Sorry, this page isn\'t available.</body></html>', 'text/html')
+        self._send(200, f'<html><script>{{"page":"profilePage_{account.user_id}"}}</script></html>', 'text/html')
+
+    def not_found(self, url, body):
+        self._send(404, {'message': 'Not found', 'status': 'fail'})
+
+
+class StandinServer(ThreadingHTTPServer):
+    """The stand-in on `host`:`port` (0 picks a free port)"""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), StandinHandler)
+        self.config = config or StandinConfig()
+        self.state = StandinState(self.config)
+        self.stats = StandinStats()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name='instagram-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_config_arguments(parser):
+    """Command line options of a StandinConfig, shared with the benchmark"""
+    parser.add_argument('--username', default=USERNAME)
+    parser.add_argument('--accounts', type=int, default=1, help="accounts served, named USERNAME, USERNAME_1, ...")
+    parser.add_argument('--media-count', type=int, default=0, help="posts the account starts with")
+    parser.add_argument('--latency', type=float, default=0.0, help="mean seconds added per request")
+    parser.add_argument('--jitter', type=float, default=0.5, help="latency varies by this fraction")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="chance of a 500 per request")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="chance of a 429 per request")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After of the 429s")
+    parser.add_argument('--transcode-delay', type=float, default=0.0,
+                        help="seconds before an upload can be configured")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="chance that an upload chunk is cut off partway")
+    parser.add_argument('--count-lag', type=float, default=0.0,
+                        help="seconds before a post shows up in media_count")
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_arguments(args):
+    return StandinConfig(username=args.username, media_count=args.media_count, latency=args.latency,
+                         jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                         retry_after=args.retry_after, transcode_delay=args.transcode_delay, seed=args.seed,
+                         accounts=args.accounts, drop_rate=args.drop_rate, count_lag=args.count_lag)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Instagram endpoints")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = StandinServer(config_from_arguments(args), args.host, args.port)
+    print(f"🧪 Instagram stand-in for @{args.username} on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats.to_dict(), indent=2))
+
+
+# ENDOF FILE instagram_standin.py
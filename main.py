@@ -10,12 +10,18 @@ if 1 post -> put index 0
 
 => number of posts - 1 = index of pi digit to post
 '''
+from caption_facts import load_facts
 from get_credentials import get_login_session
-from get_pi_digit import get_pi_digit
 from get_post_count import get_media_count_of_user
-from instagram_poster import post_pi_number
+from instagram_poster import load_session_from_login_details
+from pi_lookahead import LookaheadDetector
+from post_layout import load_layout, save_layout
+from posting_pipeline import PipelineError, PostingPipeline, settle_count
+from rate_governor import get_governor
+from retry_policy import EndpointError
 from dotenv import load_dotenv
 import os
+import time
 
 # load override for testing purposes
 load_dotenv('.env.override', override=True)
@@ -23,66 +29,88 @@ load_dotenv('.env.override', override=True)
 IDX = -1
 TARGET = 10000000
 
-def get_caption_for_index(index, number):
-    """
-    Get the caption for the given index.
-    """
-    if index == -1:
-        return "Hello World!"
-    elif index == 0:
-        return "The only dot in this number."
-    else:
-        return f"The digit at index {index} is {number}."
+# Index of the account's first post, fleet.py gives accounts later slices
+FIRST = -1
+
+# Digits per post, more than one posts carousels (see post_layout.py)
+DIGITS_PER_POST = int(os.getenv('PI_DIGITS_PER_POST', '1'))
+
+# The running PostingPipeline, for the benchmark harness to read its stats
+PIPELINE = None
+
+# Seconds to wait before starting over after Instagram kept failing
+RESTART_DELAY = 300
 
 def main():
 
     # Get global variables IDX
     global IDX
     global TARGET
+    global FIRST
+    global DIGITS_PER_POST
+    global PIPELINE
 
     username = os.getenv("INSTAGRAM_USERNAME")
     encrypted_password = os.getenv("INSTAGRAM_ENCRYPTED_PASSWORD")
 
     # Get login session
     try:
-        last_index_processed = -1
-        IDX = get_media_count_of_user(username) - 1  # Convert to 0-indexed
-        while IDX < TARGET:
-            assert username, "INSTAGRAM_USERNAME is not set in .env file"
-            assert encrypted_password, "INSTAGRAM_ENCRYPTED_PASSWORD is not set in .env file"
-
-            if os.path.exists('login_details.json'):
-                print("login_details.json already exists. Skipping login.")
-            else:
-                # Get the login session
-                get_login_session()
-                
-            # Assert that there is "login_details.json" file manually
-            assert os.path.exists('login_details.json'), "login_details.json not found in current directory"
-
-            # Get the number of posts
-            post_count = get_media_count_of_user(username)
-            print(f"User @{username} has {post_count} posts.")
+        assert username, "INSTAGRAM_USERNAME is not set in .env file"
+        assert encrypted_password, "INSTAGRAM_ENCRYPTED_PASSWORD is not set in .env file"
 
-            pi_index = post_count - 1  # Convert to 0-indexed
+        if os.path.exists('login_details.json'):
+            print("login_details.json already exists. Skipping login.")
+        else:
+            # Get the login session
+            get_login_session()
 
-            if pi_index == last_index_processed:
-                raise Exception("Last post was probably deleted. Exiting...")
+        # Assert that there is "login_details.json" file manually
+        assert os.path.exists('login_details.json'), "login_details.json not found in current directory"
 
-            # Get the digit of pi at the post count index
-            pi_digit = get_pi_digit(pi_index)  # Convert to 0-indexed
-            print(f"The digit of pi at index {post_count} is: {pi_digit}")
+        session, csrf_token = load_session_from_login_details()
+        assert session, "Failed to load the session from login_details.json"
 
-            # Get the caption for the index
-            caption = get_caption_for_index(pi_index, pi_digit)
-            print(f"Caption for index {pi_index}: {caption}")
+        # Post count once the last post of the previous run shows up, the count lags behind
+        expected_count = 0
 
-            # # Post to Instagram
-            status = post_pi_number(int(pi_digit), caption)
+        while IDX <= TARGET:
+            # Get the number of posts
+            post_count = settle_count(lambda: get_media_count_of_user(username), expected_count)
+            if post_count is None:
+                delay = max(RESTART_DELAY, get_governor().blocked_for())
+                print(f"⏸️  Could not get the post count, retrying in {delay:.0f}s")
+                time.sleep(delay)
+                continue
+            print(f"User @{username} has {post_count} posts.")
 
-            assert status == "OK", "Failed to post to Instagram"
-            IDX = pi_index
-            last_index_processed = pi_index
+            # Where the next post starts, carousels hold several digits each
+            layout = load_layout(first_index=FIRST)
+            if layout.plan(post_count, DIGITS_PER_POST, TARGET + 1):
+                save_layout(layout)
+                print(f"🎠 Post layout: {layout}")
+            IDX = layout.next_index(post_count)  # Convert to 0-indexed
+            if IDX > TARGET:
+                return
+
+            # Prepare the next posts while the current one is uploaded and configured
+            pipeline = PIPELINE = PostingPipeline(
+                session, csrf_token, load_facts(), LookaheadDetector(),
+                count_posts=lambda: get_media_count_of_user(username), layout=layout,
+            )
+            try:
+                pipeline.run(IDX, TARGET + 1)
+            except PipelineError as e:
+                # Start over from the post count once Instagram recovers, stop on anything else
+                if not (isinstance(e.__cause__, EndpointError) and e.__cause__.retryable):
+                    raise
+                # Sit out any block the rate governor knows of
+                delay = max(RESTART_DELAY, get_governor().blocked_for())
+                print(f"⏸️  {e}, starting over in {delay:.0f}s")
+                time.sleep(delay)
+            finally:
+                if pipeline.last_posted is not None:
+                    IDX = pipeline.last_posted
+                    expected_count = layout.count_after(IDX)
     except Exception as e:
         # print(f"An error occurred: {e}")
         # return
@@ -0,0 +1,197 @@
+'''
+Chunked SHA-256 checksum index for digit files.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The sidecar "<file>.sha256" holds one SHA-256 per fixed-size chunk of the
+file plus a Merkle root over those hashes. A full verification hashes the
+chunks in a thread pool (hashlib releases the GIL on large buffers, so this
+scales across cores up to the disk bandwidth). Lazy verification checks
+only the chunk holding each position the first time it is read.
+
+SIDECAR LAYOUT:
+0   8  magic b'PISHA\\x00\\x00\\x01'
+8   8  chunk size
+16  8  size of the digit file
+24  32 Merkle root
+56  .. one 32 byte SHA-256 per chunk
+
+EX USAGE:
+python pi_checksum.py build pi.txt
+python pi_checksum.py verify pi.txt
+
+'''
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b'PISHA\x00\x00\x01'
+HEADER = struct.Struct('<8sQQ32s')
+HASH_SIZE = 32
+
+# Bytes hashed per chunk
+CHUNK_SIZE = 4 << 20
+
+SIDECAR_SUFFIX = '.sha256'
+
+
+class ChecksumError(ValueError):
+    """Raised when a digit file does not match its checksum index"""
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def merkle_root(hashes):
+    """Fold a list of chunk hashes pairwise into a single root hash"""
+    if not hashes:
+        return hashlib.sha256(b'').digest()
+    level = list(hashes)
+    while len(level) > 1:
+        paired = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def _hash_chunks(mm, chunk_ids, chunk_size, workers):
+    """Hash the given chunks of a mapping in a thread pool, in order"""
+    view = memoryview(mm)
+    try:
+        def hash_chunk(chunk_id):
+            start = chunk_id * chunk_size
+            return hashlib.sha256(view[start:start + chunk_size]).digest()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(hash_chunk, chunk_ids))
+    finally:
+        view.release()
+
+
+def build_checksum_index(path, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Hash every chunk of `path` and write the sidecar index next to it.
+    Returns the Merkle root as a hex string.
+    """
+    workers = workers or os.cpu_count() or 1
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        chunk_count = (size + chunk_size - 1) // chunk_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hashes = _hash_chunks(mm, range(chunk_count), chunk_size, workers)
+        else:
+            hashes = []
+
+    root = merkle_root(hashes)
+    temporary = sidecar_path(path) + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, chunk_size, size, root))
+        f.write(b''.join(hashes))
+    os.replace(temporary, sidecar_path(path))
+    return root.hex()
+
+
+class ChecksumIndex:
+    """Chunk hashes and root loaded from a sidecar file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ChecksumError(f"{path} is too small to be a checksum index")
+        magic, self.chunk_size, self.file_size, self.root = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ChecksumError(f"{path} is not a checksum index")
+        body = data[HEADER.size:]
+        self.hashes = [body[i:i + HASH_SIZE] for i in range(0, len(body), HASH_SIZE)]
+        if len(self.hashes) != (self.file_size + self.chunk_size - 1) // self.chunk_size:
+            raise ChecksumError(f"{path} has the wrong number of chunk hashes")
+        if merkle_root(self.hashes) != self.root:
+            raise ChecksumError(f"Chunk hashes in {path} do not match their root")
+
+    @property
+    def chunk_count(self):
+        return len(self.hashes)
+
+
+def verify_file(path, workers=None, log=print):
+    """
+    Verify every chunk of `path` against its sidecar in parallel.
+    Returns the list of bad chunk ids (empty when the file is intact).
+    """
+    workers = workers or os.cpu_count() or 1
+    index = ChecksumIndex(sidecar_path(path))
+    started = time.time()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != index.file_size:
+            raise ChecksumError(f"{path} is {size} bytes, expected {index.file_size}")
+        if not size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            hashes = _hash_chunks(mm, range(index.chunk_count), index.chunk_size, workers)
+
+    bad = [i for i, (actual, expected) in enumerate(zip(hashes, index.hashes)) if actual != expected]
+    elapsed = time.time() - started
+    rate = size / elapsed / (1 << 20) if elapsed else float('inf')
+    log(f"🔍 Verified {index.chunk_count} chunks of {path} in {elapsed:.2f}s ({rate:,.0f} MiB/s)")
+    return bad
+
+
+class LazyVerifier:
+    """
+    Verifies the chunks of a mapped file on first access. Only the file size
+    is checked up front, so opening a store stays O(1).
+    """
+
+    def __init__(self, path, mm, verified=False):
+        self.index = ChecksumIndex(sidecar_path(path))
+        if len(mm) != self.index.file_size:
+            raise ChecksumError(f"{path} is {len(mm)} bytes, expected {self.index.file_size}")
+        self.path = path
+        self._mm = mm
+        self._verified = bytearray([1 if verified else 0]) * self.index.chunk_count
+
+    def check_range(self, start, end):
+        """Verify every chunk overlapping the byte range [start, end)"""
+        chunk_size = self.index.chunk_size
+        for chunk_id in range(start // chunk_size, (max(end, start + 1) - 1) // chunk_size + 1):
+            if chunk_id >= len(self._verified) or self._verified[chunk_id]:
+                continue
+            chunk_start = chunk_id * chunk_size
+            digest = hashlib.sha256(self._mm[chunk_start:chunk_start + chunk_size]).digest()
+            if digest != self.index.hashes[chunk_id]:
+                raise ChecksumError(f"Chunk {chunk_id} of {self.path} does not match its checksum")
+            self._verified[chunk_id] = 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ('build', 'verify'):
+        print("Usage: python pi_checksum.py <build|verify> <digit file>")
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'build':
+        root = build_checksum_index(path)
+        print(f"💾 Wrote {sidecar_path(path)} (root {root})")
+    else:
+        try:
+            bad_chunks = verify_file(path)
+        except (ChecksumError, FileNotFoundError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if bad_chunks:
+            print(f"❌ Corrupted chunks: {bad_chunks}")
+            sys.exit(1)
+        print("✅ File matches its checksum index")
+
+
+# ENDOF FILE pi_checksum.py
\ No newline at end of file
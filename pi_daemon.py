@@ -0,0 +1,365 @@
+'''
+Digit server shared by every bot process on a host.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The daemon opens the digit store (and its checksum and k-mer indexes) once
+and answers queries over a Unix socket, so several accounts on one machine
+share one warm mapping instead of each validating and indexing their own.
+get_pi_digit() uses the daemon when its socket exists and falls back to
+reading the file directly otherwise.
+
+PROTOCOL (little-endian, pipelined: responses come back in request order):
+request   1 op, 4 request id, 8 position/start (signed), 4 count/pattern length
+          followed by the pattern for a search
+response  4 request id, 1 status, 4 payload length, then the payload
+
+op 1 DIGIT   payload is one character ("." for the decimal point)
+op 2 RANGE   payload is up to `count` characters (at most MAX_RANGE)
+op 3 SEARCH  payload is the 8 byte position of the first match
+status 0 ok, 1 outside the file / not found, 2 invalid request, 3 error
+
+EX USAGE:
+python pi_daemon.py serve
+python pi_daemon.py bench 200000
+
+'''
+import argparse
+import os
+import random
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+
+from digit_sources import pin_store, unpin_store
+from get_pi_digit import get_store
+
+SOCKET_PATH = os.getenv('PI_DAEMON_SOCKET', 'pi_digits.sock')
+
+REQUEST = struct.Struct('<BIqI')
+RESPONSE = struct.Struct('<IBI')
+POSITION = struct.Struct('<q')
+
+OP_DIGIT = 1
+OP_RANGE = 2
+OP_SEARCH = 3
+
+STATUS_OK = 0
+STATUS_MISSING = 1
+STATUS_INVALID = 2
+STATUS_ERROR = 3
+
+# Largest range answered in one response and longest search pattern accepted
+MAX_RANGE = 1 << 20
+MAX_PATTERN = 1 << 10
+
+RECEIVE_SIZE = 1 << 16
+CLIENT_TIMEOUT = 5
+
+# Seconds before a client retries a daemon that could not be reached
+RECONNECT_INTERVAL = 30
+
+
+class DaemonError(RuntimeError):
+    """Raised when the daemon could not answer a request"""
+
+
+class DigitServer:
+    """Single-threaded selector loop answering requests from many clients"""
+
+    def __init__(self, socket_path=SOCKET_PATH, store=None):
+        self.socket_path = socket_path
+        self.store = store if store is not None else get_store()
+        pin_store(self.store)
+        self.requests = 0
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+
+    def answer(self, op, position, count, pattern):
+        """Return (status, payload) for one request"""
+        try:
+            if op == OP_DIGIT:
+                digit = self.store.get_pi_digit(position)
+                if digit is None:
+                    return STATUS_MISSING, b''
+                return STATUS_OK, b'.' if digit == -1 else digit.encode('ascii')
+            if op == OP_RANGE:
+                if count > MAX_RANGE:
+                    return STATUS_INVALID, f"Ranges are limited to {MAX_RANGE} characters".encode()
+                chunk = bytes(self.store.get_pi_digits(position, count))
+                return (STATUS_OK if chunk else STATUS_MISSING), chunk
+            if op == OP_SEARCH:
+                from pi_search import find_in_pi
+
+                found = find_in_pi(pattern.decode('ascii'), self.store.path)
+                if found is None:
+                    return STATUS_MISSING, b''
+                return STATUS_OK, POSITION.pack(found)
+            return STATUS_INVALID, f"Unknown op {op}".encode()
+        except (ValueError, UnicodeDecodeError) as e:
+            return STATUS_INVALID, str(e).encode()
+        except Exception as e:
+            return STATUS_ERROR, str(e).encode()
+
+    def _handle(self, buffer):
+        """Answer every complete request in `buffer`, return (responses, bytes used)"""
+        responses = []
+        offset = 0
+        while len(buffer) - offset >= REQUEST.size:
+            op, request_id, position, count = REQUEST.unpack_from(buffer, offset)
+            pattern_length = count if op == OP_SEARCH else 0
+            if pattern_length > MAX_PATTERN:
+                raise DaemonError(f"Pattern of {pattern_length} bytes is too long")
+            end = offset + REQUEST.size + pattern_length
+            if end > len(buffer):
+                break
+            status, payload = self.answer(op, position, count, bytes(buffer[offset + REQUEST.size:end]))
+            responses.append(RESPONSE.pack(request_id, status, len(payload)))
+            responses.append(payload)
+            offset = end
+            self.requests += 1
+        return b''.join(responses), offset
+
+    def _accept(self, listener):
+        connection, _ = listener.accept()
+        connection.setblocking(False)
+        self._selector.register(connection, selectors.EVENT_READ,
+                                {'in': bytearray(), 'out': bytearray()})
+
+    def _drop(self, connection):
+        self._selector.unregister(connection)
+        connection.close()
+
+    def _service(self, key, events):
+        connection, state = key.fileobj, key.data
+        if events & selectors.EVENT_READ:
+            try:
+                data = connection.recv(RECEIVE_SIZE)
+            except ConnectionError:
+                data = b''
+            if not data:
+                self._drop(connection)
+                return
+            state['in'] += data
+            try:
+                output, used = self._handle(state['in'])
+            except DaemonError as e:
+                print(f"⚠️  Dropping client: {e}")
+                self._drop(connection)
+                return
+            del state['in'][:used]
+            state['out'] += output
+
+        if state['out']:
+            try:
+                sent = connection.send(state['out'])
+            except BlockingIOError:
+                sent = 0
+            except ConnectionError:
+                self._drop(connection)
+                return
+            del state['out'][:sent]
+        # Only wait for writability while a response is stuck in the buffer
+        wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if state['out'] else 0)
+        if wanted != key.events:
+            self._selector.modify(connection, wanted, state)
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        print(f"🔌 Serving {self.store.path} on {self.socket_path}")
+        try:
+            while True:
+                for key, events in self._selector.select():
+                    if key.fileobj is self._listener:
+                        self._accept(self._listener)
+                    else:
+                        self._service(key, events)
+        finally:
+            self.close()
+
+    def close(self):
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+        if self._listener is not None and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        unpin_store(self.store)
+
+
+class DigitClient:
+    """
+    Blocking client. Single lookups cost one round trip; get_many() and
+    long get_pi_digits() calls pipeline their requests.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._buffer = bytearray()
+        self._next_id = 0
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            data = self._socket.recv(max(RECEIVE_SIZE, size - len(self._buffer)))
+            if not data:
+                raise ConnectionError("Daemon closed the connection")
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def request_many(self, requests):
+        """
+        Send (op, position, count, pattern) requests in one write and return
+        their (status, payload) answers in order.
+        """
+        first_id = self._next_id
+        packed = []
+        for op, position, count, pattern in requests:
+            packed.append(REQUEST.pack(op, self._next_id, position, count))
+            packed.append(pattern)
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        self._socket.sendall(b''.join(packed))
+
+        answers = []
+        for offset in range(len(requests)):
+            request_id, status, length = RESPONSE.unpack(self._read(RESPONSE.size))
+            if request_id != (first_id + offset) & 0xFFFFFFFF:
+                raise DaemonError(f"Out of order response {request_id}")
+            payload = self._read(length)
+            if status == STATUS_INVALID:
+                raise ValueError(payload.decode(errors='replace'))
+            if status == STATUS_ERROR:
+                raise DaemonError(payload.decode(errors='replace'))
+            answers.append((status, payload))
+        return answers
+
+    @staticmethod
+    def _digit(status, payload):
+        if status == STATUS_MISSING:
+            return None
+        return -1 if payload == b'.' else chr(payload[0])
+
+    def get_pi_digit(self, position):
+        """Same result as PiDigitStore.get_pi_digit()"""
+        return self._digit(*self.request_many([(OP_DIGIT, position, 0, b'')])[0])
+
+    def get_many(self, positions):
+        """get_pi_digit() for every position, in one pipelined batch"""
+        answers = self.request_many([(OP_DIGIT, position, 0, b'') for position in positions])
+        return [self._digit(status, payload) for status, payload in answers]
+
+    def get_pi_digits(self, start, count):
+        """Up to `count` characters from `start` as bytes"""
+        if count < 0:
+            raise ValueError("count must not be negative")
+        requests = [(OP_RANGE, offset, min(MAX_RANGE, start + count - offset), b'')
+                    for offset in range(start, start + count, MAX_RANGE)]
+        return b''.join(payload for _, payload in self.request_many(requests))
+
+    def find(self, pattern):
+        """First position of `pattern`, like pi_search.find_in_pi()"""
+        encoded = pattern.encode('ascii')
+        status, payload = self.request_many([(OP_SEARCH, 0, len(encoded), encoded)])[0]
+        return None if status == STATUS_MISSING else POSITION.unpack(payload)[0]
+
+
+# One connection per thread, a DigitClient matches responses to requests in order
+_local = threading.local()
+_retry_at = 0.0
+
+
+def get_client():
+    """
+    Get this thread's connection to the daemon, or None when it is not running.
+    Failed connections are retried at most every RECONNECT_INTERVAL seconds.
+    """
+    global _retry_at
+    client = getattr(_local, 'client', None)
+    if client is not None:
+        return client
+    if SOCKET_PATH in ('', 'off') or time.monotonic() < _retry_at:
+        return None
+    if not os.path.exists(SOCKET_PATH):
+        # No daemon: every lookup until the next check reads the file without a stat
+        _retry_at = time.monotonic() + RECONNECT_INTERVAL
+        return None
+    try:
+        _local.client = DigitClient(SOCKET_PATH)
+    except OSError:
+        _retry_at = time.monotonic() + RECONNECT_INTERVAL
+        return None
+    return _local.client
+
+
+def drop_client():
+    """Forget a broken connection so the next call reads the file directly"""
+    global _retry_at
+    client = getattr(_local, 'client', None)
+    if client is not None:
+        client.close()
+    _local.client = None
+    _retry_at = time.monotonic() + RECONNECT_INTERVAL
+
+
+def benchmark(count, limit, batch=1000, socket_path=SOCKET_PATH):
+    """Time random single lookups in [1, limit], one at a time and pipelined"""
+    with DigitClient(socket_path) as client:
+        positions = [random.randint(1, limit) for _ in range(count)]
+
+        started = time.perf_counter()
+        for position in positions[:count // 10]:
+            client.get_pi_digit(position)
+        single = (count // 10) / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for offset in range(0, count, batch):
+            client.get_many(positions[offset:offset + batch])
+        pipelined = count / (time.perf_counter() - started)
+
+    print(f"⏱️  {single:,.0f} lookups/s one at a time, {pipelined:,.0f} lookups/s pipelined ({batch} per batch)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve digits of pi over a Unix socket")
+    parser.add_argument('command', choices=('serve', 'bench'))
+    parser.add_argument('count', nargs='?', type=int, default=100000, help="lookups for bench")
+    parser.add_argument('--limit', type=int, default=1000000, help="largest position looked up by bench")
+    parser.add_argument('--socket', default=SOCKET_PATH, help=f"socket path (default: {SOCKET_PATH})")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            DigitServer(args.socket).serve_forever()
+        except KeyboardInterrupt:
+            sys.exit(0)
+    else:
+        benchmark(args.count, args.limit, socket_path=args.socket)
+
+
+# ENDOF FILE pi_daemon.py
\ No newline at end of file
@@ -0,0 +1,336 @@
+'''
+Compute decimal digits of pi with the Chudnovsky series and binary splitting.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The series is split into fixed blocks of terms. Each block is reduced to its
+(P, Q, T) triple, optionally in a process pool, and saved as a checkpoint so
+an interrupted run, or a later run asking for more digits, only computes the
+blocks it is missing. The digits are streamed into pi.txt style text or the
+packed format from pi_packed.py.
+
+gmpy2 is used for the big integer arithmetic when it is installed; plain
+Python integers work but are much slower past a few million digits.
+
+EX USAGE:
+python pi_generator.py 1000000 pi.txt
+python pi_generator.py 10000000 pi.bcd --packed --workers 4 --checkpoint-dir .pi_checkpoints
+
+'''
+import argparse
+import math
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pi_checksum import build_checksum_index, sidecar_path
+from pi_packed import PackedDigitWriter
+
+try:
+    import gmpy2
+    mpz = gmpy2.mpz
+    isqrt = gmpy2.isqrt
+except ImportError:
+    mpz = int
+    isqrt = math.isqrt
+
+# 640320^3 / 24
+C3_OVER_24 = 10939058860032000
+
+# Each term of the series adds about this many correct digits
+DIGITS_PER_TERM = math.log10(C3_OVER_24 * 24 / 1728)
+
+# Number of series terms per checkpointed block
+TERMS_PER_BLOCK = 1 << 12
+
+# Extra digits computed and thrown away to absorb rounding in the last place
+GUARD_DIGITS = 20
+
+# Digits converted to text per leaf of the output recursion
+OUTPUT_LEAF_DIGITS = 1 << 12
+
+
+def binary_split(a, b):
+    """
+    Reduce terms [a, b) of the Chudnovsky series to its (P, Q, T) triple.
+    """
+    if b - a == 1:
+        if a == 0:
+            p = q = mpz(1)
+        else:
+            p = mpz((6 * a - 5) * (2 * a - 1) * (6 * a - 1))
+            q = mpz(a) * a * a * C3_OVER_24
+        t = p * (13591409 + 545140134 * a)
+        if a & 1:
+            t = -t
+        return p, q, t
+
+    m = (a + b) // 2
+    p_am, q_am, t_am = binary_split(a, m)
+    p_mb, q_mb, t_mb = binary_split(m, b)
+    return p_am * p_mb, q_am * q_mb, q_mb * t_am + p_am * t_mb
+
+
+def combine(left, right):
+    """Merge the triples of two adjacent term ranges"""
+    p_am, q_am, t_am = left
+    p_mb, q_mb, t_mb = right
+    return p_am * p_mb, q_am * q_mb, q_mb * t_am + p_am * t_mb
+
+
+def _combine_pair(pair):
+    return combine(*pair)
+
+
+def terms_for_digits(digits):
+    """Number of series terms needed for `digits` digits"""
+    return int((digits + GUARD_DIGITS) / DIGITS_PER_TERM) + 2
+
+
+class CheckpointStore:
+    """
+    Directory of finished block triples, one pickle per block, written
+    atomically so a killed run never leaves a half-written checkpoint.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, a, b):
+        return os.path.join(self.directory, f"terms_{a}_{b}.chk")
+
+    def load(self, a, b):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(a, b), 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, a, b, triple):
+        if not self.directory:
+            return
+        path = self._path(a, b)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(triple, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+
+def compute_series(terms, workers=1, checkpoint_dir=None, log=print):
+    """
+    Compute the (P, Q, T) triple of the first `terms` terms, block by block.
+    Blocks found in `checkpoint_dir` are reused instead of recomputed.
+    """
+    checkpoints = CheckpointStore(checkpoint_dir)
+    blocks = [(a, min(a + TERMS_PER_BLOCK, terms)) for a in range(0, terms, TERMS_PER_BLOCK)]
+
+    triples = {}
+    missing = []
+    for a, b in blocks:
+        triple = checkpoints.load(a, b)
+        if triple is None:
+            missing.append((a, b))
+        else:
+            triples[a] = triple
+    log(f"🧮 {len(blocks)} blocks, {len(blocks) - len(missing)} restored from checkpoints")
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if pool and len(missing) > 1:
+            futures = [(pool.submit(binary_split, a, b), a, b) for a, b in missing]
+            for future, a, b in futures:
+                triples[a] = future.result()
+                checkpoints.save(a, b, triples[a])
+        else:
+            for a, b in missing:
+                triples[a] = binary_split(a, b)
+                checkpoints.save(a, b, triples[a])
+
+        # Merge neighbours pairwise so the operands stay balanced
+        level = [triples[a] for a, _ in blocks]
+        while len(level) > 1:
+            pairs = [(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if pool and len(pairs) > 1:
+                merged = list(pool.map(_combine_pair, pairs))
+            else:
+                merged = [combine(*pair) for pair in pairs]
+            if len(level) % 2:
+                merged.append(level[-1])
+            level = merged
+    finally:
+        if pool:
+            pool.shutdown()
+    return level[0]
+
+
+def compute_pi_integer(digits, workers=1, checkpoint_dir=None, log=print):
+    """
+    Compute floor(pi * 10^(digits + GUARD_DIGITS)) as an integer.
+    """
+    terms = terms_for_digits(digits)
+    started = time.time()
+    _, q, t = compute_series(terms, workers, checkpoint_dir, log)
+    log(f"⏱️  Series: {time.time() - started:.2f}s ({terms} terms)")
+
+    started = time.time()
+    scale = mpz(10) ** (digits + GUARD_DIGITS)
+    sqrt_10005 = isqrt(10005 * scale * scale)
+    pi = (q * 426880 * sqrt_10005) // t
+    log(f"⏱️  Square root and division: {time.time() - started:.2f}s")
+    return pi
+
+
+def iter_decimal_chunks(number, length, powers=None):
+    """
+    Yield the decimal digits of `number`, zero padded to `length`, as ASCII
+    chunks from the most significant end. Splitting by powers of ten keeps
+    the conversion subquadratic and the memory bounded by the largest chunk.
+    """
+    if powers is None:
+        powers = {}
+    if length <= OUTPUT_LEAF_DIGITS:
+        yield str(number).zfill(length).encode('ascii')
+        return
+    low_length = length // 2
+    power = powers.get(low_length)
+    if power is None:
+        power = powers[low_length] = mpz(10) ** low_length
+    high, low = divmod(number, power)
+    yield from iter_decimal_chunks(high, length - low_length, powers)
+    yield from iter_decimal_chunks(low, low_length, powers)
+
+
+def _open_existing(path):
+    """
+    Digit store of an existing output file, None if it is missing or not a
+    digit file (pi.txt is a Git LFS pointer in a fresh checkout), which the
+    generator simply replaces
+    """
+    from get_pi_digit import InvalidDigitFileError, open_digit_store
+
+    if not os.path.exists(path):
+        return None
+    try:
+        return open_digit_store(path)
+    except InvalidDigitFileError:
+        return None
+
+
+def existing_digit_count(path):
+    """Number of digits after the decimal point already in `path` (0 if missing or invalid)"""
+    store = _open_existing(path)
+    if store is None:
+        return 0
+    with store:
+        return max(len(store) - 1, 0)
+
+
+class ExistingDigitCheck:
+    """
+    Compares the digits being written with an existing digit file, chunk by
+    chunk, so that extending a file never silently replaces different digits.
+    check() takes the output text ("3.1415...") in the order it is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.store = _open_existing(path)
+        self.position = -1
+
+    def check(self, text):
+        if self.store is not None:
+            existing = bytes(self.store.get_pi_digits(self.position, len(text)))
+            if not text.startswith(existing):
+                raise ValueError(f"Existing digits in {self.path} do not match the computed digits "
+                                 f"from position {self.position} on, remove it to regenerate")
+            if len(existing) < len(text):
+                # Past the end of the existing file, nothing left to compare
+                self.close()
+        self.position += len(text)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def generate_pi_file(digits, output='pi.txt', packed=False, workers=1, checkpoint_dir=None, log=print):
+    """
+    Compute `digits` digits after the decimal point and write them to
+    `output`, either as "3.1415..." text or in the packed format.
+    An existing file is only replaced by a longer one with the same prefix.
+    Returns the number of digits written per second.
+    """
+    existing = existing_digit_count(output)
+    if existing >= digits:
+        log(f"✅ {output} already has {existing} digits")
+        return 0
+
+    started = time.time()
+    pi = compute_pi_integer(digits, workers, checkpoint_dir, log)
+    pi //= mpz(10) ** GUARD_DIGITS
+
+    output_started = time.time()
+    temporary = output + '.tmp'
+    chunks = iter_decimal_chunks(pi, digits + 1)
+    first = next(chunks)
+
+    try:
+        with ExistingDigitCheck(output) as existing_check:
+            existing_check.check(first[:1] + b'.' + first[1:])
+            if packed:
+                with PackedDigitWriter(temporary) as writer:
+                    writer.write(first)
+                    for chunk in chunks:
+                        existing_check.check(chunk)
+                        writer.write(chunk)
+            else:
+                with open(temporary, 'wb') as f:
+                    f.write(first[:1] + b'.' + first[1:])
+                    for chunk in chunks:
+                        existing_check.check(chunk)
+                        f.write(chunk)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, output)
+    if os.path.exists(sidecar_path(output)):
+        build_checksum_index(output)
+    log(f"⏱️  Output: {time.time() - output_started:.2f}s")
+
+    elapsed = time.time() - started
+    rate = digits / elapsed if elapsed else float('inf')
+    log(f"✅ Wrote {digits} digits to {output} in {elapsed:.2f}s ({rate:,.0f} digits/s)")
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute digits of pi with the Chudnovsky series")
+    parser.add_argument('digits', type=int, help="number of digits after the decimal point")
+    parser.add_argument('output', nargs='?', default='pi.txt', help="file to write (default: pi.txt)")
+    parser.add_argument('--packed', action='store_true', help="write the packed 4-bit format")
+    parser.add_argument('--workers', type=int, default=1, help="processes used for the series")
+    parser.add_argument('--checkpoint-dir', default=None, help="directory for resumable block checkpoints")
+    args = parser.parse_args()
+
+    if args.digits <= 0:
+        print("Please provide a positive number of digits.")
+        sys.exit(1)
+
+    generate_pi_file(args.digits, args.output, args.packed, args.workers, args.checkpoint_dir)
+
+
+# ENDOF FILE pi_generator.py
\ No newline at end of file
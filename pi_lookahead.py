@@ -0,0 +1,184 @@
+'''
+Look ahead of the posting cursor for notable digit sequences.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+All registered patterns are compiled into one Aho-Corasick automaton over the
+ten digits (a dense transition table, so each digit is one list lookup no
+matter how many patterns there are). LookaheadDetector feeds the automaton
+the digits ahead of the current index and remembers where it stopped, so
+each post only scans the digits that newly entered the window.
+
+EX USAGE:
+python pi_lookahead.py 750 20
+
+'''
+import sys
+from collections import deque
+
+from digit_sources import pin_store, unpin_store
+from get_pi_digit import get_store
+
+# Posts to look ahead of the current index
+LOOKAHEAD_WINDOW = 10
+
+DEFAULT_PATTERNS = {
+    'the Feynman point': '999999',
+    'a counting sequence': '123456',
+    'a countdown': '987654',
+}
+for _digit in '012345678':
+    DEFAULT_PATTERNS[f'six {_digit}s in a row'] = _digit * 6
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over the alphabet 0-9"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [[0] * 10]
+        self.outputs = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern or not pattern.isdigit():
+                raise ValueError(f"Invalid pattern: {pattern!r}")
+            state = 0
+            for char in pattern:
+                digit = ord(char) - 48
+                if not self.goto[state][digit]:
+                    self.goto.append([0] * 10)
+                    self.outputs.append([])
+                    self.goto[state][digit] = len(self.goto) - 1
+                state = self.goto[state][digit]
+            self.outputs[state].append(pattern_id)
+
+        # Breadth first: fill the missing transitions through the failure links
+        fail = [0] * len(self.goto)
+        queue = deque(state for state in self.goto[0] if state)
+        while queue:
+            state = queue.popleft()
+            self.outputs[state] = self.outputs[state] + self.outputs[fail[state]]
+            for digit in range(10):
+                child = self.goto[state][digit]
+                if child:
+                    fail[child] = self.goto[fail[state]][digit]
+                    queue.append(child)
+                else:
+                    self.goto[state][digit] = self.goto[fail[state]][digit]
+
+    @property
+    def longest(self):
+        return max((len(pattern) for pattern in self.patterns), default=0)
+
+    def feed(self, state, data, start):
+        """
+        Run the automaton over ASCII digits `data`, the first of which is at
+        position `start`. Returns the new state and a list of
+        (start position, pattern id) for every match ending inside `data`.
+        Any non-digit character (the decimal point) resets the state.
+        """
+        goto, outputs = self.goto, self.outputs
+        matches = []
+        for offset, char in enumerate(data):
+            digit = char - 48
+            if not 0 <= digit <= 9:
+                state = 0
+                continue
+            state = goto[state][digit]
+            if outputs[state]:
+                end = start + offset + 1
+                for pattern_id in outputs[state]:
+                    matches.append((end - len(self.patterns[pattern_id]), pattern_id))
+        return state, matches
+
+
+class LookaheadDetector:
+    """
+    Keeps an Aho-Corasick cursor running `window` positions ahead of the
+    posting index and the matches found in that window.
+    """
+
+    def __init__(self, patterns=None, window=LOOKAHEAD_WINDOW, store=None):
+        self.named_patterns = dict(patterns or DEFAULT_PATTERNS)
+        self.names = list(self.named_patterns)
+        self.matcher = AhoCorasick(self.named_patterns.values())
+        self.window = window
+        self.store = store
+        if store is not None:
+            pin_store(store)
+        self._state = 0
+        self._scanned_to = None
+        self._index = None
+        self._matches = deque()
+
+    def close(self):
+        """Release the store given to the detector"""
+        if self.store is not None:
+            unpin_store(self.store)
+            self.store = None
+
+    def _reset(self, index):
+        # Start early enough to see patterns that are already in progress
+        self._state = 0
+        self._scanned_to = max(index - self.matcher.longest + 1, -1)
+        self._matches.clear()
+
+    def advance(self, index):
+        """
+        Move the cursor to `index` and return the matches that overlap it or
+        start within the next `window` positions, as (start, name, pattern).
+        """
+        store = self.store if self.store is not None else get_store()
+        # Going back, or jumping past the scanned digits, starts the cursor over
+        if (self._index is None or index < self._index
+                or index - self.matcher.longest + 1 > self._scanned_to):
+            self._reset(index)
+        self._index = index
+
+        # Scan far enough to see whole matches starting inside the window
+        horizon = index + self.window + self.matcher.longest
+        if horizon > self._scanned_to:
+            data = bytes(store.get_pi_digits(self._scanned_to, horizon - self._scanned_to))
+            self._state, found = self.matcher.feed(self._state, data, self._scanned_to)
+            self._matches.extend(found)
+            self._scanned_to += len(data)
+
+        # Forget matches that ended before the current index
+        while self._matches:
+            start, pattern_id = self._matches[0]
+            if start + len(self.matcher.patterns[pattern_id]) > index:
+                break
+            self._matches.popleft()
+
+        return [(start, self.names[pattern_id], self.matcher.patterns[pattern_id])
+                for start, pattern_id in self._matches if start <= index + self.window]
+
+    def upcoming(self, index):
+        """Matches that start after `index` within the window"""
+        return [match for match in self.advance(index) if match[0] > index]
+
+
+def render_announcement(index, matches, digits_per_post=1):
+    """
+    Caption sentence about the nearest upcoming match, or None. `index` is
+    the first index of the current post.
+    """
+    if not matches:
+        return None
+    start, name, pattern = min(matches)
+    posts = (start - index) // digits_per_post
+    return f"Coming up in {posts} post{'s' if posts != 1 else ''}: {name} ({pattern}) at index {start}!"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python pi_lookahead.py <index> [window]")
+        sys.exit(1)
+
+    detector = LookaheadDetector(window=int(sys.argv[2]) if len(sys.argv) == 3 else LOOKAHEAD_WINDOW)
+    position = int(sys.argv[1])
+    for match_start, name, pattern in detector.advance(position):
+        print(f"{pattern} ({name}) at index {match_start}, {match_start - position} posts away")
+
+
+# ENDOF FILE pi_lookahead.py
\ No newline at end of file
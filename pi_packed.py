@@ -0,0 +1,218 @@
+'''
+Compact 4-bit-per-digit (packed BCD) storage for the digits of pi.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+pi.txt spends one byte per digit. The packed format keeps two digits per
+byte, which halves the file on disk and in the page cache.
+
+FILE LAYOUT:
+0   8  magic b'PIBCD\\x00\\x00\\x01'
+8   4  number of characters before the decimal point (1 for "3.")
+12  4  reserved
+16  8  number of packed digits (the decimal point is not stored)
+24  8  reserved
+32  .. digits, two per byte, high nibble first
+
+EX USAGE:
+python pi_packed.py pi.txt pi.bcd
+
+'''
+import mmap
+import struct
+import sys
+
+from get_pi_digit import PREFIX_LENGTH, InvalidDigitFileError, PiDigitStore
+
+MAGIC = b'PIBCD\x00\x00\x01'
+HEADER = struct.Struct('<8sII Q8x')
+HEADER_SIZE = HEADER.size
+
+# Size of the blocks read from pi.txt while converting
+CONVERT_BLOCK_SIZE = 1 << 24
+
+
+def is_packed_file(path):
+    """Check whether `path` starts with the packed digit magic"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class PackedDigitWriter:
+    """
+    Streaming writer for the packed format. Digits are appended as ASCII
+    bytes; the header is filled in by close().
+    """
+
+    def __init__(self, path, point_position=PREFIX_LENGTH):
+        self.path = path
+        self.point_position = point_position
+        self.digit_count = 0
+        self._pending = b''
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, digits):
+        """Append ASCII digits (no decimal point) to the file"""
+        block = self._pending + digits
+        if block and not block.isdigit():
+            raise ValueError(f"Non-digit character after digit {self.digit_count}")
+        # Two ASCII digits are two hex characters, so fromhex() packs them
+        usable = len(block) - (len(block) % 2)
+        self._file.write(bytes.fromhex(block[:usable].decode('ascii')))
+        self.digit_count += usable
+        self._pending = block[usable:]
+
+    def close(self):
+        """Flush the last odd digit and write the final header"""
+        if self._file.closed:
+            return
+        if self._pending:
+            self._file.write(bytes.fromhex(self._pending.decode('ascii') + '0'))
+            self.digit_count += len(self._pending)
+            self._pending = b''
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, self.point_position, 0, self.digit_count))
+        self._file.close()
+
+
+def convert_text_to_packed(source='pi.txt', destination='pi.bcd', block_size=CONVERT_BLOCK_SIZE):
+    """
+    Stream `source` ("3.1415...") into the packed format at `destination`.
+    Returns the number of digits written.
+    """
+    point_position = None
+    read_count = 0
+
+    with open(source, 'rb') as src, PackedDigitWriter(destination) as writer:
+        while True:
+            block = src.read(block_size)
+            if not block:
+                break
+            block = block.translate(None, b'\r\n')
+            if point_position is None:
+                dot = block.find(b'.')
+                if dot != -1:
+                    point_position = read_count + dot
+                    block = block[:dot] + block[dot + 1:]
+            read_count += len(block)
+            writer.write(block)
+
+        if point_position is None:
+            raise ValueError(f"No decimal point found in {source}")
+        writer.point_position = point_position
+
+    return writer.digit_count
+
+
+class PackedDigitStore(PiDigitStore):
+    """
+    PiDigitStore over a packed digit file. Positions follow get_pi_digit(),
+    including -1 for the decimal point. Range lookups decode into new bytes
+    objects since the packed form cannot be sliced as ASCII.
+    """
+
+    def __init__(self, path='pi.bcd'):
+        super().__init__(path)
+
+    def _validate(self):
+        """Read the header and check that the file is not truncated"""
+        if len(self._mm) < HEADER_SIZE:
+            raise InvalidDigitFileError(f"{self.path} is too small to be a packed digit file")
+        magic, point_position, _, digit_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise InvalidDigitFileError(f"{self.path} is not a packed digit file")
+        if HEADER_SIZE + (digit_count + 1) // 2 > len(self._mm):
+            raise InvalidDigitFileError(f"{self.path} is truncated")
+        # The header knows how many digits come before the point
+        self.point_position = self.prefix_length = point_position
+        self.digit_count = digit_count
+
+    def __len__(self):
+        """Number of positions available from index 0 onwards"""
+        return max(self.digit_count + 1 - self.point_position, 0)
+
+    def _digit_index(self, file_position):
+        """
+        Map a pi.txt character offset to a packed digit index. The decimal
+        point maps to the digit right after it.
+        """
+        if file_position <= self.point_position:
+            return file_position
+        return file_position - 1
+
+    def get_pi_digit(self, position):
+        """
+        Get the digit of pi at the specified position (0-indexed).
+        Returns -1 for the decimal point and None outside the file.
+        """
+        file_position = position + self.point_position
+        if file_position < 0:
+            return None
+        if file_position == self.point_position:
+            return -1
+        index = self._digit_index(file_position)
+        if index >= self.digit_count:
+            return None
+        if self.verifier:
+            self.verifier.check_range(HEADER_SIZE + (index >> 1), HEADER_SIZE + (index >> 1) + 1)
+        byte = self._mm[HEADER_SIZE + (index >> 1)]
+        nibble = byte & 0x0F if index & 1 else byte >> 4
+        return chr(48 + nibble)
+
+    def get_pi_digits(self, start, count):
+        """
+        Get up to `count` characters starting at `start`, decoded to the same
+        ASCII bytes pi.txt would hold for that range.
+        """
+        if count < 0:
+            raise ValueError("count must not be negative")
+        file_start = max(start + self.point_position, 0)
+        file_end = min(start + self.point_position + count, self.digit_count + 1)
+        if file_end <= file_start:
+            return b''
+
+        first = self._digit_index(file_start)
+        last = self._digit_index(file_end)
+        byte_start = HEADER_SIZE + (first >> 1)
+        byte_end = HEADER_SIZE + ((last + 1) >> 1)
+        if self.verifier:
+            self.verifier.check_range(byte_start, byte_end)
+        packed = self._mm[byte_start:byte_end]
+        digits = packed.hex().encode('ascii')[first & 1:(first & 1) + (last - first)]
+        if file_start <= self.point_position < file_end:
+            split = self.point_position - file_start
+            digits = digits[:split] + b'.' + digits[split:]
+        return digits
+
+    def readahead(self, start, count):
+        """Hint the kernel that the packed bytes of the range are needed soon"""
+        if not hasattr(self._mm, 'madvise') or not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        file_start = max(start + self.point_position, 0)
+        file_end = min(start + self.point_position + count, self.digit_count + 1)
+        if file_end <= file_start:
+            return
+        byte_start = HEADER_SIZE + (self._digit_index(file_start) >> 1)
+        byte_end = min(HEADER_SIZE + ((self._digit_index(file_end) + 1) >> 1), len(self._mm))
+        aligned_start = byte_start - (byte_start % mmap.PAGESIZE)
+        self._mm.madvise(mmap.MADV_WILLNEED, aligned_start, byte_end - aligned_start)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python pi_packed.py <pi.txt> <pi.bcd>")
+        sys.exit(1)
+
+    count = convert_text_to_packed(sys.argv[1], sys.argv[2])
+    print(f"Packed {count} digits into {sys.argv[2]}")
+
+
+# ENDOF FILE pi_packed.py
\ No newline at end of file
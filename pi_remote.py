@@ -0,0 +1,202 @@
+'''
+Digit store backed by an HTTP object store, fetched lazily with Range requests.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Instead of pulling the whole 1 GB pi.txt, RemoteDigitStore keeps a sparse
+local copy of the same size and fetches only the chunks that are read. A
+bitmap next to the copy ("<cache>.bitmap") records which chunks are present
+so they survive restarts. Every read also queues the next PREFETCH_CHUNKS
+chunks in a background thread, so the posting loop rarely waits on the
+network.
+
+EX USAGE:
+PI_REMOTE_URL=https://example.com/pi.txt python get_pi_digit.py 1000000
+
+'''
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from get_pi_digit import PREFIX_LENGTH, InvalidDigitFileError, PiDigitStore
+
+# Bytes fetched per chunk (matches the pi_checksum.py chunk size)
+REMOTE_CHUNK_SIZE = 4 << 20
+
+# Chunks fetched in the background past the last one read
+PREFETCH_CHUNKS = 2
+
+REQUEST_TIMEOUT = 30
+
+BITMAP_SUFFIX = '.bitmap'
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def get_remote_size(session, url):
+    """Ask the server for the size of the object with a one byte Range request"""
+    response = session.get(url, headers={'Range': 'bytes=0-0'}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+    if response.status_code == 206 and match and match.group(3) != '*':
+        return int(match.group(3))
+    raise InvalidDigitFileError(f"{url} does not support Range requests")
+
+
+class RemoteDigitStore(PiDigitStore):
+    """
+    PiDigitStore over a sparse local copy of a remote digit file. Chunks are
+    fetched on first read and kept in the copy.
+    """
+
+    def __init__(self, url, cache_path='pi.txt.cache', size=None, chunk_size=REMOTE_CHUNK_SIZE,
+                 prefetch_chunks=PREFETCH_CHUNKS, prefix_length=PREFIX_LENGTH, point_position=None):
+        self.url = url
+        self.cache_path = cache_path
+        self.chunk_size = chunk_size
+        self.prefetch_chunks = prefetch_chunks
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
+
+        if size is None:
+            size = get_remote_size(self._session, url)
+        self.size = size
+        self.chunk_count = (size + chunk_size - 1) // chunk_size
+
+        # A size change means a different object, start the copy over
+        if not os.path.exists(cache_path) or os.path.getsize(cache_path) != size:
+            with open(cache_path, 'wb') as f:
+                f.truncate(size)
+            if os.path.exists(cache_path + BITMAP_SUFFIX):
+                os.remove(cache_path + BITMAP_SUFFIX)
+        self._bitmap = self._load_bitmap()
+        self._fd = os.open(cache_path, os.O_RDWR)
+
+        super().__init__(cache_path, prefix_length, point_position)
+
+    def _load_bitmap(self):
+        try:
+            with open(self.cache_path + BITMAP_SUFFIX, 'rb') as f:
+                bitmap = bytearray(f.read())
+        except FileNotFoundError:
+            bitmap = bytearray()
+        expected = (self.chunk_count + 7) // 8
+        if len(bitmap) != expected:
+            bitmap = bytearray(expected)
+        return bitmap
+
+    def _save_bitmap(self):
+        temporary = self.cache_path + BITMAP_SUFFIX + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self._bitmap)
+        os.replace(temporary, self.cache_path + BITMAP_SUFFIX)
+
+    def has_chunk(self, chunk_id):
+        return bool(self._bitmap[chunk_id >> 3] & (1 << (chunk_id & 7)))
+
+    @property
+    def fetched_chunks(self):
+        return sum(self.has_chunk(chunk_id) for chunk_id in range(self.chunk_count))
+
+    def _fetch(self, first, last):
+        """Download chunks [first, last) with one Range request"""
+        start = first * self.chunk_size
+        end = min(last * self.chunk_size, self.size) - 1
+        response = self._session.get(self.url, headers={'Range': f'bytes={start}-{end}'},
+                                     timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise InvalidDigitFileError(f"{self.url} ignored the Range request")
+        data = response.content
+        if len(data) != end - start + 1:
+            raise InvalidDigitFileError(f"Short read from {self.url}: {len(data)} of {end - start + 1} bytes")
+        os.pwrite(self._fd, data, start)
+
+        with self._lock:
+            for chunk_id in range(first, last):
+                self._bitmap[chunk_id >> 3] |= 1 << (chunk_id & 7)
+            self._save_bitmap()
+
+    def _ensure_chunks(self, first, last):
+        """Make sure chunks [first, last) are present, fetching missing runs"""
+        last = min(last, self.chunk_count)
+        chunk_id = first
+        while chunk_id < last:
+            if self.has_chunk(chunk_id):
+                chunk_id += 1
+                continue
+            with self._lock:
+                pending = self._in_flight.get(chunk_id)
+            if pending is not None:
+                pending.result()
+                continue
+            run_end = chunk_id + 1
+            while run_end < last and not self.has_chunk(run_end):
+                run_end += 1
+            self._fetch(chunk_id, run_end)
+            chunk_id = run_end
+
+    def ensure_range(self, file_start, file_end):
+        """Fetch every chunk overlapping the byte range [file_start, file_end)"""
+        if file_end <= file_start:
+            return
+        first = file_start // self.chunk_size
+        last = (file_end - 1) // self.chunk_size + 1
+        self._ensure_chunks(first, last)
+        self.prefetch(last, self.prefetch_chunks)
+
+    def prefetch(self, first_chunk, count):
+        """Fetch up to `count` chunks from `first_chunk` in the background"""
+        for chunk_id in range(first_chunk, min(first_chunk + count, self.chunk_count)):
+            with self._lock:
+                if self.has_chunk(chunk_id) or chunk_id in self._in_flight:
+                    continue
+                future = self._prefetcher.submit(self._fetch, chunk_id, chunk_id + 1)
+                self._in_flight[chunk_id] = future
+            future.add_done_callback(lambda _, chunk_id=chunk_id: self._done(chunk_id))
+
+    def _done(self, chunk_id):
+        with self._lock:
+            self._in_flight.pop(chunk_id, None)
+
+    def _validate(self):
+        """Fetch the first chunk and check it like a local digit file"""
+        self._ensure_chunks(0, 1)
+        super()._validate()
+
+    def close(self):
+        if self.closed:
+            return
+        self._prefetcher.shutdown(wait=True)
+        super().close()
+        os.close(self._fd)
+        self._session.close()
+
+    def get_pi_digit(self, position):
+        file_position = position + self.point_position
+        if 0 <= file_position < self.size:
+            self.ensure_range(file_position, file_position + 1)
+        return super().get_pi_digit(position)
+
+    def get_pi_digits(self, start, count):
+        file_start = max(start + self.point_position, self._first_offset)
+        file_end = min(start + self.point_position + count, self.size)
+        self.ensure_range(file_start, file_end)
+        return super().get_pi_digits(start, count)
+
+    def readahead(self, start, count):
+        """Fetch the chunks of the range in the background"""
+        file_start = max(start + self.point_position, self._first_offset)
+        file_end = min(start + self.point_position + count, self.size)
+        if file_end > file_start:
+            first = file_start // self.chunk_size
+            self.prefetch(first, (file_end - 1) // self.chunk_size + 1 - first)
+
+
+# ENDOF FILE pi_remote.py
\ No newline at end of file
@@ -0,0 +1,263 @@
+'''
+Parallel map-reduce scans over a digit file.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The file is split into aligned shards. Every worker process opens the digit
+store once and hands each shard to a reducer as a view of the mapping
+(zero-copy for pi.txt). Partial results are merged in shard order, so the
+reducers only have to describe how two neighbouring results combine.
+
+A reducer is an object with:
+    overlap                     extra characters it needs past the shard end
+    map(chunk, start, length)   partial result for positions [start, start + length)
+    merge(left, right)          combine two neighbouring partial results
+    finish(result)              final value (optional)
+
+chunk starts at position `start` (get_pi_digit indexing) and holds up to
+`length + overlap` characters; anything starting at or after `length`
+belongs to the next shard.
+
+EX USAGE:
+python pi_scan.py pi.txt histogram
+python pi_scan.py pi.txt count 999999
+python pi_scan.py pi.txt runs
+python pi_scan.py pi.txt validate
+
+'''
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from get_pi_digit import open_digit_store
+
+# Positions per shard handed to a worker (a multiple of the page size)
+SHARD_SIZE = 64 << 20
+
+# Reducers copy their view in slices of this size for bytes methods
+SLICE_SIZE = 4 << 20
+
+DIGITS = b'0123456789'
+NON_DIGIT = re.compile(rb'[^0-9]')
+
+_worker_store = None
+
+
+def _open_worker_store(path, verify):
+    global _worker_store
+    _worker_store = open_digit_store(path, verify)
+
+
+def _map_shard(task):
+    reducer, start, length = task
+    chunk = _worker_store.get_pi_digits(start, length + reducer.overlap)
+    try:
+        return reducer.map(chunk, start, min(length, len(chunk)))
+    finally:
+        if isinstance(chunk, memoryview):
+            chunk.release()
+
+
+def iter_slices(chunk, length, overlap=0):
+    """
+    Yield (offset, bytes) slices covering [0, length) of a chunk, each with
+    `overlap` extra characters when they are available.
+    """
+    for offset in range(0, length, SLICE_SIZE):
+        end = min(offset + SLICE_SIZE, length)
+        yield offset, end - offset, bytes(chunk[offset:end + overlap])
+
+
+def run_scan(path, reducer, workers=None, shard_size=SHARD_SIZE, start=None, stop=None,
+             verify=None, log=print):
+    """
+    Run `reducer` over positions [start, stop) of `path` in a process pool,
+    from the first integer digit to the end of the file by default.
+    `verify` is passed on to open_digit_store() in every worker.
+    Returns the finished result and logs the throughput.
+    """
+    workers = workers or os.cpu_count() or 1
+    with open_digit_store(path, verify) as store:
+        if start is None:
+            start = -store.prefix_length
+        if stop is None or stop > len(store):
+            stop = len(store)
+    tasks = [(reducer, position, min(shard_size, stop - position))
+             for position in range(start, stop, shard_size)]
+
+    started = time.time()
+    result = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store, initargs=(path, verify)) as pool:
+        for index, partial in enumerate(pool.map(_map_shard, tasks)):
+            result = partial if index == 0 else reducer.merge(result, partial)
+
+    elapsed = time.time() - started
+    scanned = max(stop - start, 0)
+    rate = scanned / elapsed if elapsed else float('inf')
+    log(f"⚙️  Scanned {scanned:,} positions in {len(tasks)} shards with {workers} workers "
+        f"in {elapsed:.2f}s ({rate / (1 << 20):,.1f} MiB/s)")
+    finish = getattr(reducer, 'finish', None)
+    return finish(result) if finish else result
+
+
+class HistogramReducer:
+    """Count of each digit, 0 to 9"""
+
+    overlap = 0
+
+    def map(self, chunk, start, length):
+        counts = [0] * 10
+        for _, _, piece in iter_slices(chunk, length):
+            for digit in range(10):
+                counts[digit] += piece.count(DIGITS[digit:digit + 1])
+        return counts
+
+    def merge(self, left, right):
+        return [a + b for a, b in zip(left, right)]
+
+
+class PatternCountReducer:
+    """
+    Number of (possibly overlapping) occurrences of a digit string and the
+    first position it appears at. Matches that straddle a shard boundary are
+    counted by the shard they start in.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern.encode('ascii')
+        self.overlap = len(self.pattern) - 1
+
+    def map(self, chunk, start, length):
+        count = 0
+        first = None
+        for offset, piece_length, piece in iter_slices(chunk, length, self.overlap):
+            found = piece.find(self.pattern)
+            while found != -1 and found < piece_length:
+                if first is None:
+                    first = start + offset + found
+                count += 1
+                found = piece.find(self.pattern, found + 1)
+        return count, first
+
+    def merge(self, left, right):
+        first = left[1] if left[1] is not None else right[1]
+        return left[0] + right[0], first
+
+    def finish(self, result):
+        return {'count': result[0], 'first': result[1]}
+
+
+class LongestRunReducer:
+    """
+    Longest run of one repeated digit. Each partial result keeps the runs
+    touching both shard edges so runs crossing a boundary are joined.
+    """
+
+    overlap = 0
+
+    def map(self, chunk, start, length):
+        data = bytes(chunk[:length])
+        if not data:
+            return None
+        best = (0, None, None)
+        for digit in DIGITS:
+            needle = bytes([digit])
+            size = best[0] + 1
+            while data.find(needle * size) != -1:
+                size += 1
+            if size - 1 > best[0]:
+                best = (size - 1, chr(digit), start + data.find(needle * (size - 1)))
+        head = len(data) - len(data.lstrip(data[:1]))
+        tail = len(data) - len(data.rstrip(data[-1:]))
+        return {
+            'start': start, 'length': len(data), 'best': best,
+            'head': (chr(data[0]), head), 'tail': (chr(data[-1]), tail),
+        }
+
+    def merge(self, left, right):
+        if left is None or right is None:
+            return left or right
+        best = max(left['best'], right['best'], key=lambda run: run[0])
+        head, tail = left['head'], right['tail']
+        if left['tail'][0] == right['head'][0]:
+            joined = left['tail'][1] + right['head'][1]
+            joined_start = left['start'] + left['length'] - left['tail'][1]
+            if joined > best[0]:
+                best = (joined, left['tail'][0], joined_start)
+            if left['head'][1] == left['length']:
+                head = (head[0], joined)
+            if right['tail'][1] == right['length']:
+                tail = (tail[0], joined)
+        return {
+            'start': left['start'], 'length': left['length'] + right['length'], 'best': best,
+            'head': head, 'tail': tail,
+        }
+
+    def finish(self, result):
+        if result is None:
+            return None
+        length, digit, position = result['best']
+        return {'length': length, 'digit': digit, 'position': position}
+
+
+class ValidationReducer:
+    """
+    Count of characters that are not digits, apart from the single decimal
+    point at position 0, with the first few offending positions.
+    """
+
+    overlap = 0
+    max_reported = 10
+
+    def map(self, chunk, start, length):
+        bad = []
+        count = 0
+        for offset, _, piece in iter_slices(chunk, length):
+            if start + offset <= 0 < start + offset + len(piece):
+                dot = -start - offset
+                if piece[dot:dot + 1] != b'.':
+                    count += 1
+                    bad.append(0)
+                piece = piece[:dot] + b'0' + piece[dot + 1:]
+            if piece.isdigit():
+                continue
+            count += len(piece.translate(None, DIGITS))
+            for match in NON_DIGIT.finditer(piece):
+                if len(bad) >= self.max_reported:
+                    break
+                bad.append(start + offset + match.start())
+        return count, bad
+
+    def merge(self, left, right):
+        return left[0] + right[0], (left[1] + right[1])[:self.max_reported]
+
+    def finish(self, result):
+        return {'invalid': result[0], 'positions': result[1]}
+
+
+if __name__ == "__main__":
+    reducers = {
+        'histogram': HistogramReducer,
+        'runs': LongestRunReducer,
+        'validate': ValidationReducer,
+    }
+    if len(sys.argv) < 3 or (sys.argv[2] not in reducers and sys.argv[2] != 'count'):
+        print("Usage: python pi_scan.py <digit file> <histogram|runs|validate|count <digits>>")
+        sys.exit(1)
+
+    # Validation reports bad characters itself instead of stopping at a checksum
+    verify_mode = 'off' if sys.argv[2] == 'validate' else None
+    if sys.argv[2] == 'count':
+        if len(sys.argv) != 4:
+            print("Usage: python pi_scan.py <digit file> count <digits>")
+            sys.exit(1)
+        selected = PatternCountReducer(sys.argv[3])
+    else:
+        selected = reducers[sys.argv[2]]()
+    print(run_scan(sys.argv[1], selected, verify=verify_mode))
+
+
+# ENDOF FILE pi_scan.py
\ No newline at end of file
@@ -0,0 +1,254 @@
+'''
+K-mer position index for fast substring search in the digits of pi.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+For every k digit string (k = 6 to 8) the index keeps the first SAMPLES
+positions where it starts. Slots have a fixed stride, so a lookup is a
+single read from the memory-mapped index. Shorter patterns expand into the
+k-mers that start with them, longer patterns are checked against the digit
+store at the sampled positions before falling back to a scan.
+
+The index takes 10^k * SAMPLES slots of 4 bytes, in memory while it is
+built and on disk: 16 MB for k = 6 (the default), 160 MB for k = 7 and
+1.6 GB for k = 8. k = 8 (PI_KMER_LENGTH=8) makes 8-digit patterns such as
+YYYYMMDD dates a single lookup; with a shorter k they are checked against
+the sampled positions of their prefix and may need a scan. find_in_pi()
+uses the longest index that has been built.
+
+Positions use get_pi_digit() indexing and only cover the digits after the
+decimal point (the first one is position 1).
+
+INDEX LAYOUT ("<file>.kmer<k>"):
+0   8  magic b'PIKMR\\x00\\x00\\x01'
+8   4  k
+12  4  samples per k-mer
+16  4  bytes per position (4 or 8)
+20  4  reserved
+24  8  number of digits covered
+32  .. 10^k * samples positions, unused slots are all ones
+
+EX USAGE:
+python pi_search.py build pi.txt
+python pi_search.py build pi.txt 8      # 1.6 GB, for fast date lookups
+python pi_search.py find pi.txt 19970415
+
+'''
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from digit_sources import pin_store, unpin_store
+from get_pi_digit import get_store
+
+MAGIC = b'PIKMR\x00\x00\x01'
+HEADER = struct.Struct('<8sIII4xQ')
+
+# Default k-mer length and positions kept per k-mer
+KMER_LENGTH = int(os.getenv('PI_KMER_LENGTH', '6'))
+SAMPLES = 4
+
+# k-mer lengths an index can be built for
+KMER_LENGTHS = (6, 7, 8)
+
+# Expanding a short pattern costs 10^(k - len) lookups; scan instead past this
+MAX_EXPANSION = 100
+
+# A linear search reads chunks growing from the first size to the last one,
+# since short patterns usually turn up within the first few thousand digits
+FIRST_SCAN_CHUNK_SIZE = 1 << 12
+SCAN_CHUNK_SIZE = 1 << 22
+
+
+def index_path(path, k=KMER_LENGTH):
+    return f"{path}.kmer{k}"
+
+
+def scan_for_pattern(store, pattern, start=1):
+    """
+    Linear search of a digit store from `start`, chunk by chunk with enough
+    overlap that matches spanning two chunks are found.
+    """
+    needle = pattern.encode('ascii')
+    overlap = len(needle) - 1
+    position = max(start, 1)
+    chunk_size = FIRST_SCAN_CHUNK_SIZE
+    while position < len(store):
+        chunk = bytes(store.get_pi_digits(position, chunk_size + overlap))
+        found = chunk.find(needle)
+        if found != -1:
+            return position + found
+        if len(chunk) < chunk_size + overlap:
+            return None
+        position += chunk_size
+        chunk_size = min(chunk_size * 2, SCAN_CHUNK_SIZE)
+    return None
+
+
+def build_kmer_index(path, k=KMER_LENGTH, samples=SAMPLES, log=print):
+    """
+    Record the first `samples` start positions of every k-mer in `path`.
+    The scan stops as soon as every k-mer has all of its samples.
+    """
+    if k not in KMER_LENGTHS:
+        raise ValueError("k must be between 6 and 8")
+
+    started = time.time()
+    store = get_store(path)
+    digit_count = len(store) - 1
+    typecode = 'I' if digit_count < 0xFFFFFFFF else 'Q'
+    empty = (1 << (8 * array(typecode).itemsize)) - 1
+    size = 10 ** k
+
+    counts = bytearray(size)
+    slots = array(typecode, [empty]) * (size * samples)
+    full = 0
+    key = 0
+    position = 1
+    for _, chunk in store.iter_chunks(1):
+        for digit in bytes(chunk):
+            key = (key * 10 + digit - 48) % size
+            if position >= k:
+                count = counts[key]
+                if count < samples:
+                    slots[key * samples + count] = position - k + 1
+                    counts[key] = count + 1
+                    if count + 1 == samples:
+                        full += 1
+            position += 1
+        if full == size:
+            break
+
+    temporary = index_path(path, k) + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, k, samples, slots.itemsize, digit_count))
+        slots.tofile(f)
+    os.replace(temporary, index_path(path, k))
+
+    log(f"🔎 Indexed {size} {k}-mers over {position - 1} digits in {time.time() - started:.2f}s")
+
+
+class KmerIndex:
+    """Memory-mapped k-mer index plus the digit store used to verify matches"""
+
+    def __init__(self, path='pi.txt', k=KMER_LENGTH, store=None):
+        self.store = store if store is not None else get_store(path)
+        pin_store(self.store)
+        self._file = open(index_path(path, k), 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.k, self.samples, width, self.digit_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path(path, k)} is not a k-mer index")
+        self._slots = memoryview(self._mm)[HEADER.size:].cast('I' if width == 4 else 'Q')
+        self._empty = (1 << (8 * width)) - 1
+        if len(self._slots) != 10 ** self.k * self.samples:
+            self.close()
+            raise ValueError(f"{index_path(path, k)} is truncated")
+
+    def close(self):
+        if hasattr(self, '_slots'):
+            self._slots.release()
+        self._mm.close()
+        self._file.close()
+        unpin_store(self.store)
+
+    def positions(self, kmer):
+        """Sampled start positions of a k digit string, in increasing order"""
+        base = int(kmer) * self.samples
+        found = []
+        for slot in range(base, base + self.samples):
+            position = self._slots[slot]
+            if position == self._empty:
+                break
+            found.append(position)
+        return found
+
+    def _is_full(self, kmer):
+        return self._slots[int(kmer) * self.samples + self.samples - 1] != self._empty
+
+    def _matches(self, position, pattern):
+        return bytes(self.store.get_pi_digits(position, len(pattern))) == pattern.encode('ascii')
+
+    def find(self, pattern):
+        """
+        First position where `pattern` starts, or None if it does not occur.
+        """
+        if not pattern or not pattern.isdigit():
+            raise ValueError("Pattern must be a non-empty string of digits")
+
+        if len(pattern) == self.k:
+            found = self.positions(pattern)
+            return found[0] if found else None
+
+        if len(pattern) < self.k:
+            suffixes = 10 ** (self.k - len(pattern))
+            if suffixes > MAX_EXPANSION:
+                return scan_for_pattern(self.store, pattern)
+            first = None
+            for suffix in range(suffixes):
+                found = self.positions(pattern + str(suffix).zfill(self.k - len(pattern)))
+                if found and (first is None or found[0] < first):
+                    first = found[0]
+            # Matches in the last k - 1 digits do not start a k-mer of their own
+            if first is None:
+                return scan_for_pattern(self.store, pattern, self.digit_count - self.k + 2)
+            return first
+
+        prefix = pattern[:self.k]
+        candidates = self.positions(prefix)
+        for position in candidates:
+            if self._matches(position, pattern):
+                return position
+        if not candidates or not self._is_full(prefix):
+            return None
+        # Only the first occurrences of the prefix are sampled, scan past them
+        return scan_for_pattern(self.store, pattern, candidates[-1] + 1)
+
+
+_index = None
+
+
+def find_in_pi(pattern, path=None, k=None):
+    """
+    First position of `pattern` in the digits of the current digit store,
+    using its k-mer index when one has been built (the longest one unless
+    `k` is given).
+    """
+    global _index
+    store = get_store(path)
+    if _index is None or _index.store is not store or (k is not None and _index.k != k):
+        built = [length for length in ([k] if k is not None else KMER_LENGTHS)
+                 if os.path.exists(index_path(store.path, length))]
+        if not built:
+            return scan_for_pattern(store, pattern)
+        k = max(built)
+        if _index is not None:
+            _index.close()
+        _index = KmerIndex(store.path, k, store)
+    return _index.find(pattern)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('build', 'find'):
+        print("Usage: python pi_search.py build <digit file> [k] | find <digit file> <digits>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        build_kmer_index(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else KMER_LENGTH)
+    elif len(sys.argv) == 4:
+        started = time.perf_counter()
+        result = find_in_pi(sys.argv[3], sys.argv[2])
+        elapsed = time.perf_counter() - started
+        if result is None:
+            print(f"{sys.argv[3]} was not found.")
+        else:
+            print(f"{sys.argv[3]} first appears at position {result}.")
+        print(f"⏱️  Search took {elapsed * 1e3:.2f}ms")
+
+
+# ENDOF FILE pi_search.py
\ No newline at end of file
@@ -0,0 +1,192 @@
+'''
+Prefix digit counts for O(1) statistics at any position of pi.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+The index stores, for every block of BLOCK_SIZE positions, how many of each
+digit appear from index -1 (the leading "3") up to the start of the block.
+A query adds the counts of at most one partial block, counted with
+bytes.count() straight from the digit store.
+
+INDEX LAYOUT ("<file>.counts"):
+0   8  magic b'PICNT\\x00\\x00\\x01'
+8   8  block size
+16  8  number of positions covered (from index -1)
+24  8  number of block entries
+32  .. per entry ten little-endian uint64 counts, digit 0 to 9
+
+EX USAGE:
+python pi_stats.py build pi.txt
+python pi_stats.py query pi.txt 999999
+
+'''
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from digit_sources import pin_store, unpin_store
+from get_pi_digit import PREFIX_LENGTH, open_digit_store
+
+MAGIC = b'PICNT\x00\x00\x01'
+HEADER = struct.Struct('<8sQQQ')
+ENTRY = struct.Struct('<10Q')
+
+# Positions per block; a query scans at most this many characters
+BLOCK_SIZE = 1 << 12
+
+# Blocks counted per task handed to a worker process
+BLOCKS_PER_TASK = 1 << 10
+
+INDEX_SUFFIX = '.counts'
+
+DIGITS = [str(digit).encode('ascii') for digit in range(10)]
+
+_worker_store = None
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def count_digits(chunk):
+    """Count each digit in a bytes-like chunk (the decimal point is ignored)"""
+    chunk = bytes(chunk)
+    return [chunk.count(digit) for digit in DIGITS]
+
+
+def _open_worker_store(path, prefix_length=PREFIX_LENGTH, point_position=None):
+    global _worker_store
+    _worker_store = open_digit_store(path, prefix_length=prefix_length, point_position=point_position)
+
+
+def _count_blocks(task):
+    """Count every block in [first_block, last_block) of the worker's store"""
+    first_block, last_block, block_size = task
+    results = []
+    for block in range(first_block, last_block):
+        start = block * block_size - _worker_store.prefix_length
+        results.append(count_digits(_worker_store.get_pi_digits(start, block_size)))
+    return results
+
+
+def build_count_index(path, block_size=BLOCK_SIZE, workers=None, log=print, prefix_length=PREFIX_LENGTH,
+                      point_position=None):
+    """
+    Count the digits of every block of `path` in a process pool and write the
+    cumulative counts to "<path>.counts". `prefix_length` and
+    `point_position` describe the layout like for open_digit_store().
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+    with open_digit_store(path, prefix_length=prefix_length, point_position=point_position) as store:
+        positions = len(store) + store.prefix_length
+
+    block_count = (positions + block_size - 1) // block_size
+    tasks = [(first, min(first + BLOCKS_PER_TASK, block_count), block_size)
+             for first in range(0, block_count, BLOCKS_PER_TASK)]
+
+    temporary = index_path(path) + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, block_size, positions, block_count + 1))
+        totals = [0] * 10
+        f.write(ENTRY.pack(*totals))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store,
+                                 initargs=(path, prefix_length, point_position)) as pool:
+            for block_counts in pool.map(_count_blocks, tasks):
+                for counts in block_counts:
+                    totals = [total + count for total, count in zip(totals, counts)]
+                    f.write(ENTRY.pack(*totals))
+    os.replace(temporary, index_path(path))
+
+    elapsed = time.time() - started
+    log(f"📊 Counted {positions} positions in {block_count} blocks in {elapsed:.2f}s")
+    return totals
+
+
+class DigitCountIndex:
+    """
+    Query side of the prefix count index. Holds the index mapped and the
+    digit store open for the partial block scans.
+    """
+
+    def __init__(self, path='pi.txt', store=None):
+        self.path = path
+        self._file = open(index_path(path), 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.block_size, self.positions, self.entries = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path(path)} is not a digit count index")
+        if HEADER.size + self.entries * ENTRY.size > len(self._mm):
+            self.close()
+            raise ValueError(f"{index_path(path)} is truncated")
+        self.store = store if store is not None else open_digit_store(path)
+        pin_store(self.store)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+        if hasattr(self, 'store'):
+            unpin_store(self.store)
+
+    def counts_through(self, index):
+        """
+        Count each digit at positions -1..index inclusive.
+        Returns a list of ten counts, digit 0 to 9.
+        """
+        prefix_length = self.store.prefix_length
+        end = min(index + prefix_length + 1, self.positions)
+        if end <= 0:
+            return [0] * 10
+        block, remainder = divmod(end, self.block_size)
+        counts = list(ENTRY.unpack_from(self._mm, HEADER.size + block * ENTRY.size))
+        if remainder:
+            start = block * self.block_size - prefix_length
+            partial = count_digits(self.store.get_pi_digits(start, remainder))
+            counts = [total + count for total, count in zip(counts, partial)]
+        return counts
+
+    def count_through(self, digit, index):
+        """Number of times `digit` appears at positions -1..index inclusive"""
+        prefix_length = self.store.prefix_length
+        end = min(index + prefix_length + 1, self.positions)
+        if end <= 0:
+            return 0
+        block, remainder = divmod(end, self.block_size)
+        offset = HEADER.size + block * ENTRY.size + digit * 8
+        count = struct.unpack_from('<Q', self._mm, offset)[0]
+        if remainder:
+            start = block * self.block_size - prefix_length
+            count += bytes(self.store.get_pi_digits(start, remainder)).count(DIGITS[digit])
+        return count
+
+    def frequencies_through(self, index):
+        """Share of each digit among positions -1..index inclusive"""
+        counts = self.counts_through(index)
+        total = sum(counts)
+        return [count / total if total else 0.0 for count in counts]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('build', 'query'):
+        print("Usage: python pi_stats.py build <digit file> | query <digit file> <index>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        build_count_index(sys.argv[2])
+    else:
+        stats = DigitCountIndex(sys.argv[2])
+        position = int(sys.argv[3])
+        started = time.perf_counter()
+        result = stats.counts_through(position)
+        elapsed = time.perf_counter() - started
+        for digit, count in enumerate(result):
+            print(f"{digit}: {count}")
+        print(f"⏱️  Query took {elapsed * 1e6:.1f}µs")
+
+
+# ENDOF FILE pi_stats.py
\ No newline at end of file
@@ -0,0 +1,249 @@
+'''
+Reader for y-cruncher .ycd compressed digit archives.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+y-cruncher writes the digits after the decimal point into a directory of
+files named "<constant> - <id>.ycd". Every file starts with a text header
+ending in "EndHeader\\n\\n" and a NUL byte, followed by little-endian 64-bit
+words that each hold 19 decimal digits (most significant digit first).
+File <id> holds digits [id * Blocksize, (id + 1) * Blocksize).
+
+YcdDigitStore builds a block index once (file path, data offset) so any
+position maps to one file and one word in O(1).
+
+EX USAGE:
+python pi_ycd.py "pi_ycd/" 1000000
+
+'''
+import mmap
+import os
+import re
+import sys
+
+from get_pi_digit import PiDigitStore
+
+DIGITS_PER_WORD = 19
+WORD_SIZE = 8
+HEADER_END = b'EndHeader'
+
+# Largest header we are willing to scan for the end marker
+MAX_HEADER_SIZE = 1 << 16
+
+FILENAME_PATTERN = re.compile(r'^(?P<name>.*) - (?P<id>\d+)\.ycd$')
+
+
+def read_ycd_header(path):
+    """
+    Parse the text header of a .ycd file.
+    Returns (fields, data_offset) where fields maps header keys to strings.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(MAX_HEADER_SIZE)
+
+    end = head.find(HEADER_END)
+    if end == -1:
+        raise ValueError(f"No EndHeader found in {path}")
+    terminator = head.find(b'\x00', end)
+    if terminator == -1:
+        raise ValueError(f"Header of {path} is not terminated")
+
+    fields = {}
+    for line in head[:end].decode('ascii', errors='replace').splitlines():
+        if ':' in line:
+            key, value = line.split(':', 1)
+            fields[key.strip()] = value.strip()
+
+    if fields.get('Base', '10') != '10':
+        raise ValueError(f"{path} is not a base 10 digit file")
+    return fields, terminator + 1
+
+
+class YcdDigitStore(PiDigitStore):
+    """
+    Digit store over a directory of .ycd files, with the same indexing as
+    get_pi_digit(). Files are mapped on first access and kept open.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._blocks = []
+        self._maps = {}
+        self._closed = False
+
+        entries = {}
+        for filename in os.listdir(path):
+            match = FILENAME_PATTERN.match(filename)
+            if match:
+                entries[int(match.group('id'))] = os.path.join(path, filename)
+        if 0 not in entries:
+            raise FileNotFoundError(2, "No block 0 .ycd file found", path)
+
+        fields, _ = read_ycd_header(entries[0])
+        self.first_digits = fields.get('FirstDigits', '3.')
+        self.block_size = int(fields['Blocksize'])
+        total_digits = int(fields.get('TotalDigits', '0') or 0)
+
+        # Only the contiguous run of blocks starting at 0 is usable
+        block_id = 0
+        while block_id in entries:
+            block_path = entries[block_id]
+            block_fields, data_offset = read_ycd_header(block_path)
+            if int(block_fields['Blocksize']) != self.block_size:
+                raise ValueError(f"{block_path} has a different Blocksize")
+            self._blocks.append((block_path, data_offset))
+            block_id += 1
+
+        last_path, last_offset = self._blocks[-1]
+        words = (os.path.getsize(last_path) - last_offset) // WORD_SIZE
+        last_digits = min(words * DIGITS_PER_WORD, self.block_size)
+        self.digit_count = (len(self._blocks) - 1) * self.block_size + last_digits
+        if total_digits:
+            self.digit_count = min(self.digit_count, total_digits)
+
+        self.integer_part = self.first_digits.split('.')[0]
+        self.prefix_length = self.point_position = len(self.integer_part)
+
+    def __len__(self):
+        """Number of positions available from index 0 onwards"""
+        return self.digit_count + 1
+
+    def close(self):
+        """Release every mapped block"""
+        for f, mm in self._maps.values():
+            mm.close()
+            f.close()
+        self._maps = {}
+        self._closed = True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def mapped_bytes(self):
+        return sum(len(mm) for _, mm in self._maps.values())
+
+    @property
+    def block_count(self):
+        return len(self._blocks)
+
+    def _map_block(self, block_id):
+        """Get the mapping for a block, opening it on first use"""
+        entry = self._maps.get(block_id)
+        if entry is None:
+            f = open(self._blocks[block_id][0], 'rb')
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception:
+                f.close()
+                raise
+            entry = self._maps[block_id] = (f, mm)
+        return entry[1]
+
+    def _locate(self, digit_index):
+        """Map a digit index (0 = first digit after the point) to (block, byte offset, digit in word)"""
+        block_id, in_block = divmod(digit_index, self.block_size)
+        word, in_word = divmod(in_block, DIGITS_PER_WORD)
+        return block_id, self._blocks[block_id][1] + word * WORD_SIZE, in_word
+
+    def _decode(self, first, last):
+        """Decode digits [first, last) after the decimal point into ASCII bytes"""
+        parts = []
+        while first < last:
+            block_id, byte_offset, in_word = self._locate(first)
+            block_end = min((block_id + 1) * self.block_size, last)
+            words = (in_word + block_end - first + DIGITS_PER_WORD - 1) // DIGITS_PER_WORD
+            mm = self._map_block(block_id)
+            raw = memoryview(mm)[byte_offset:byte_offset + words * WORD_SIZE]
+            try:
+                text = ''.join(f'{word:019d}' for word in raw.cast('Q'))
+            finally:
+                raw.release()
+            parts.append(text[in_word:in_word + block_end - first])
+            first = block_end
+        return ''.join(parts).encode('ascii')
+
+    def get_pi_digit(self, position):
+        """
+        Get the digit of pi at the specified position (0-indexed).
+        Returns -1 for the decimal point and None outside the archive.
+        """
+        if position < 0:
+            file_position = position + self.prefix_length
+            if file_position < 0 or file_position >= len(self.integer_part):
+                return None
+            return self.integer_part[file_position]
+        if position == 0:
+            return -1
+        if position > self.digit_count:
+            return None
+        block_id, byte_offset, in_word = self._locate(position - 1)
+        mm = self._map_block(block_id)
+        word = int.from_bytes(mm[byte_offset:byte_offset + WORD_SIZE], 'little')
+        return chr(48 + (word // 10 ** (DIGITS_PER_WORD - 1 - in_word)) % 10)
+
+    def get_pi_digits(self, start, count):
+        """
+        Get up to `count` characters starting at `start`, decoded to the same
+        ASCII bytes pi.txt would hold for that range.
+        """
+        if count < 0:
+            raise ValueError("count must not be negative")
+        end = min(start + count, self.digit_count + 1)
+        start = max(start, -self.prefix_length)
+        if end <= start:
+            return b''
+
+        prefix = b''
+        if start < 0:
+            prefix = self.integer_part[start + self.prefix_length:end + self.prefix_length].encode('ascii')
+            start = 0
+        if start == 0 and end > 0:
+            prefix += b'.'
+            start = 1
+        if end <= start:
+            return prefix
+        return prefix + self._decode(start - 1, end - 1)
+
+    def readahead(self, start, count):
+        """Hint the kernel that the blocks covering the range are needed soon"""
+        if not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        first = max(start - 1, 0)
+        last = min(start - 1 + count, self.digit_count)
+        while first < last:
+            block_id, byte_offset, _ = self._locate(first)
+            block_end = min((block_id + 1) * self.block_size, last)
+            mm = self._map_block(block_id)
+            if not hasattr(mm, 'madvise'):
+                return
+            length = ((block_end - first) // DIGITS_PER_WORD + 2) * WORD_SIZE
+            aligned = byte_offset - (byte_offset % mmap.PAGESIZE)
+            mm.madvise(mmap.MADV_WILLNEED, aligned, min(byte_offset + length, len(mm)) - aligned)
+            first = block_end
+
+    def advise_sequential(self):
+        """Sequential hints are given per block by readahead()"""
+
+
+def is_ycd_directory(path):
+    """Check whether `path` is a directory holding .ycd files"""
+    if not os.path.isdir(path):
+        return False
+    return any(FILENAME_PATTERN.match(name) for name in os.listdir(path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python pi_ycd.py <ycd directory> <position>")
+        sys.exit(1)
+
+    store = YcdDigitStore(sys.argv[1])
+    position = int(sys.argv[2])
+    print(f"{store.digit_count} digits in {store.block_count} files")
+    print(f"The digit of pi at position {position} is: {store.get_pi_digit(position)}")
+
+
+# ENDOF FILE pi_ycd.py
\ No newline at end of file
@@ -0,0 +1,160 @@
+'''
+Which digit indices each post of the account holds, for carousel posting.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+With one digit per post the next index is simply first index + post count.
+A carousel (sidecar) post holds up to MAX_DIGITS_PER_POST digits, so once
+carousel mode starts the count alone no longer says where the account is.
+PostLayout keeps the history as segments: from post count `posts` on, the
+posts hold `digits` digits each, starting at index `index`. The segments
+are saved to post_layout.json whenever they change, before the posts they
+describe go out, so the mapping survives restarts and switching the number
+of digits per post back and forth.
+
+A last post that would run past the target is made shorter, as a segment
+of its own.
+
+EX USAGE:
+python post_layout.py <post count>    # next index and digits per post
+
+'''
+import json
+import os
+import sys
+
+STATE_FILE = 'post_layout.json'
+
+# Images Instagram accepts in one carousel
+MAX_DIGITS_PER_POST = 10
+
+
+class PostLayout:
+    """Segments of (post count, first index, digits per post), by post count"""
+
+    def __init__(self, first_index=-1, segments=None):
+        self.segments = [list(segment) for segment in segments] if segments else [[0, first_index, 1]]
+
+    @property
+    def first_index(self):
+        return self.segments[0][1]
+
+    def to_dict(self):
+        return {'segments': self.segments}
+
+    @classmethod
+    def from_dict(cls, data):
+        segments = data['segments']
+        if not segments or any(len(segment) != 3 for segment in segments):
+            raise ValueError("Invalid post layout segments")
+        return cls(segments=sorted(segments))
+
+    def _segment_at_count(self, count):
+        found = self.segments[0]
+        for segment in self.segments:
+            if segment[0] > count:
+                break
+            found = segment
+        return found
+
+    def next_index(self, count):
+        """First index of the post made when the account has `count` posts"""
+        posts, index, digits = self._segment_at_count(count)
+        return index + (count - posts) * digits
+
+    def digits_at(self, count):
+        """Digits in the post made when the account has `count` posts"""
+        return self._segment_at_count(count)[2]
+
+    def post_size(self, index):
+        """Digits in the post starting at `index`"""
+        position = self._segment_at_index(index)
+        _, start, digits = self.segments[position]
+        if (index - start) % digits:
+            raise ValueError(f"Index {index} is not the start of a post")
+        if position + 1 < len(self.segments):
+            digits = min(digits, self.segments[position + 1][1] - index)
+        return digits
+
+    def _segment_at_index(self, index):
+        position = 0
+        for candidate, segment in enumerate(self.segments):
+            if segment[1] > index:
+                break
+            position = candidate
+        return position
+
+    def count_after(self, index):
+        """Post count once the post ending at `index` is live"""
+        posts, start, digits = self.segments[self._segment_at_index(index)]
+        return posts + (index - start) // digits + 1
+
+    def plan(self, count, digits, stop=None):
+        """
+        Lay out the posts from `count` on: `digits` per post, and a shorter
+        last post so that nothing from `stop` on is posted. Segments after
+        `count` are replaced. Returns True when the layout changed.
+        """
+        if not 1 <= digits <= MAX_DIGITS_PER_POST:
+            raise ValueError(f"Digits per post must be between 1 and {MAX_DIGITS_PER_POST}, got {digits}")
+        before = [list(segment) for segment in self.segments]
+        index = self.next_index(count)
+        self.segments = [segment for segment in self.segments if segment[0] < count]
+        if not self.segments or self.segments[-1][2] != digits or self.next_index(count) != index:
+            self.segments.append([count, index, digits])
+
+        if stop is not None and stop > index:
+            full, rest = divmod(stop - index, digits)
+            if rest:
+                short_count = count + full
+                self.segments.append([short_count, index + full * digits, rest])
+                self.segments.append([short_count + 1, stop, digits])
+
+        # A segment followed by one starting at the same post count holds no posts
+        segments = []
+        for segment in self.segments:
+            if segments and segments[-1][0] == segment[0]:
+                segments[-1] = segment
+            else:
+                segments.append(segment)
+        self.segments = segments
+        return self.segments != before
+
+    def __str__(self):
+        return " | ".join(f"post {posts}+: {digits} digit{'s' if digits != 1 else ''} from index {index}"
+                          for posts, index, digits in self.segments)
+
+
+def load_layout(filename=STATE_FILE, first_index=-1):
+    """Load the saved layout, or the one digit per post layout if there is none"""
+    try:
+        with open(filename, 'r') as f:
+            layout = PostLayout.from_dict(json.load(f))
+    except FileNotFoundError:
+        return PostLayout(first_index)
+    if layout.first_index != first_index:
+        raise ValueError(f"{filename} starts at index {layout.first_index}, expected {first_index}")
+    return layout
+
+
+def save_layout(layout, filename=STATE_FILE):
+    """Save the layout atomically"""
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(layout.to_dict(), f)
+    os.replace(temporary, filename)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python post_layout.py <post count>")
+        sys.exit(1)
+
+    layout = load_layout()
+    count = int(sys.argv[1])
+    print(layout)
+    print(f"Post {count} starts at index {layout.next_index(count)} with {layout.digits_at(count)} digits")
+
+
+# ENDOF FILE post_layout.py
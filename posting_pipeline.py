@@ -0,0 +1,363 @@
+'''
+Staged posting pipeline: prepare, payload, upload and configure.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Each stage runs in its own thread and hands posts to the next one through a
+small bounded queue, so the digit, caption and image of post N+1 are ready
+(and its image uploaded) while post N is still waiting to be configured.
+
+Ordering: every stage is a single thread reading a FIFO queue, so posts
+reach the configure stage in index order, and the configure stage refuses
+anything but the next index. Only configure publishes a post; when any
+stage fails on index N, posts before N still go out and nothing from N on
+is configured (uploads already made for them are simply never used). The
+caption facts are saved only once the post they describe is live.
+
+The post count lags behind new posts, so it is read again with backoff
+(settle_count) before a check trusts a count that is too low. A configure
+that failed ambiguously is only called posted when the count reaches it;
+a count that stays short leaves it undetermined, and the run stops rather
+than risk posting twice.
+
+Carousels: with a PostLayout of several digits per post, one job carries
+the digits of one post. Its images are uploaded as sidecar children in
+parallel and published with a single configure_sidecar call.
+
+'''
+import collections
+import queue
+import threading
+import time
+
+from caption_facts import CaptionFacts, render_caption, save_facts
+from configure_readiness import get_readiness
+from get_pi_digit import get_pi_digit
+from image_pack import get_pi_image
+from instagram_poster import (configure_sidecar_when_ready, configure_when_ready, new_upload_id,
+                               upload_carousel_images, upload_image_resumable)
+from pi_lookahead import render_announcement
+from post_layout import PostLayout
+from rate_governor import get_governor
+from retry_policy import RetryBudget, get_policy
+
+# Posts waiting between two stages
+QUEUE_SIZE = 2
+
+# Seconds between checks of the stop flag while blocked on a queue
+POLL_INTERVAL = 0.5
+
+STAGES = ('prepare', 'payload', 'upload', 'configure')
+
+# Timings per stage kept for the percentiles
+STATS_WINDOW = 10000
+
+# Reads of a post count that is short of the expected one, and the first wait between them (doubling)
+SETTLE_READS = 5
+SETTLE_BACKOFF = 1.0
+
+_END = object()
+
+
+class PipelineError(Exception):
+    """Raised when a stage fails, the pipeline stops at the last good post"""
+
+
+def settle_count(count_posts, expected, reads=SETTLE_READS, backoff=SETTLE_BACKOFF, sleep=time.sleep):
+    """
+    Read the post count until it reaches `expected` or the reads run out,
+    waiting longer each time. Returns the last count read, None if none
+    could be read.
+    """
+    count = None
+    for read in range(reads):
+        if read:
+            sleep(backoff * 2 ** (read - 1))
+        count = count_posts()
+        if count is not None and count >= expected:
+            break
+    return count
+
+
+class PostJob:
+    """One post travelling through the stages, `size` digits from `index` on"""
+
+    def __init__(self, index, size=1):
+        self.index = index
+        self.size = size
+        self.digits = []
+        self.caption = None
+        self.facts_state = None
+        self.images = []
+        self.upload_ids = []
+        self.uploaded_at = None
+        self.budget = None
+        self.timings = {}
+
+    @property
+    def indices(self):
+        return range(self.index, self.index + self.size)
+
+    @property
+    def last(self):
+        return self.index + self.size - 1
+
+    def describe(self):
+        if self.size == 1:
+            return f"{self.digits[0]} for index {self.index}"
+        return f"{' '.join(str(digit) for digit in self.digits)} for indices {self.index}..{self.last}"
+
+
+class StageStats:
+    """Busy time of one stage, percentiles over the last `window` posts"""
+
+    def __init__(self, name, window=STATS_WINDOW):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = collections.deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Seconds below which a fraction `q` of the samples fall, 0 when empty"""
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def __str__(self):
+        return (f"{self.name} {self.mean * 1e3:.1f}ms avg / {self.percentile(0.5) * 1e3:.1f}ms p50 / "
+                f"{self.percentile(0.99) * 1e3:.1f}ms p99 / {self.max * 1e3:.1f}ms max")
+
+
+class PostingPipeline:
+    """
+    Post digits `start` .. `stop - 1` through the four stages.
+
+    `facts` is the caption state ending right before `start` (it is
+    bootstrapped if it does not), `lookahead` an optional LookaheadDetector
+    and `count_posts` an optional callable returning the current post count,
+    checked every `verify_every` posts to catch deleted or foreign posts.
+    `readiness` decides when to configure after an upload and `policy`
+    retries the upload and configure calls (the shared ReadinessController
+    and RetryPolicy by default). A configure that failed ambiguously is only
+    retried when `count_posts` shows it did not go through.
+
+    `layout` is the PostLayout saying which digits each post holds and so
+    what the post count is after each post; without it every post holds one
+    digit from `first_index`, the index of the account's first post, on.
+    """
+
+    def __init__(self, session, csrf_token, facts=None, lookahead=None, count_posts=None,
+                 verify_every=10, queue_size=QUEUE_SIZE, readiness=None, policy=None, log=print,
+                 first_index=-1, layout=None):
+        self.session = session
+        self.csrf_token = csrf_token
+        self.facts = facts if facts is not None else CaptionFacts()
+        self.lookahead = lookahead
+        self.count_posts = count_posts
+        self.verify_every = verify_every
+        self.queue_size = queue_size
+        self.readiness = readiness or get_readiness()
+        self.policy = policy or get_policy()
+        self.log = log
+        self.layout = layout if layout is not None else PostLayout(first_index)
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.posted = 0
+        self.last_posted = None
+        self._error = None
+        self._stop_index = None
+        self._stopping = threading.Event()
+
+    # Stage work, one job at a time
+
+    def prepare(self, job):
+        captions = []
+        for index in job.indices:
+            digit = get_pi_digit(index)
+            if digit is None:
+                raise PipelineError(f"No digit at index {index}")
+            if self.facts.next_index != index:
+                self.facts.bootstrap(index)
+            captions.append(render_caption(self.facts.facts_for(index, digit)))
+            self.facts.ingest(index, digit)
+            job.digits.append(digit)
+        job.caption = "\n".join(captions)
+        if self.lookahead is not None:
+            announcement = render_announcement(job.index, self.lookahead.upcoming(job.last), job.size)
+            if announcement:
+                job.caption = f"{job.caption} {announcement}"
+        # Snapshot the facts as they will be once this post is live
+        job.facts_state = self.facts.to_dict()
+
+    def payload(self, job):
+        # Views into the image pack, nothing is read or copied per post
+        job.images = [get_pi_image(int(digit)) for digit in job.digits]
+
+    def upload(self, job):
+        # Retries of the uploads and configure of one post share a budget
+        job.budget = RetryBudget()
+        job.upload_ids = [new_upload_id() for _ in job.images]
+        if job.size == 1:
+            upload_image_resumable(self.session, job.images[0], job.upload_ids[0], budget=job.budget,
+                                   policy=self.policy)
+        else:
+            upload_carousel_images(self.session, job.images, job.upload_ids, job.budget, self.policy)
+        job.uploaded_at = time.monotonic()
+
+    def configure(self, job):
+        expected = job.index if self.last_posted is None else self.last_posted + 1
+        if job.index != expected:
+            raise PipelineError(f"Post for index {job.index} arrived, expected {expected}")
+        if job.size == 1:
+            configure, upload = configure_when_ready, job.upload_ids[0]
+        else:
+            configure, upload = configure_sidecar_when_ready, job.upload_ids
+        # Instagram needs a moment between the upload and the configure
+        self.policy.call_result('configure', configure, self.session, upload, job.caption,
+                                self.csrf_token, job.uploaded_at, self.readiness, budget=job.budget,
+                                idempotent=False, verify=lambda: self._is_posted(job.last))
+        self.last_posted = job.last
+        self.posted += 1
+        save_facts(CaptionFacts.from_dict(job.facts_state))
+        self.log(f"✅ Posted {job.describe()}: {job.caption}")
+
+        if self.count_posts is not None and self.verify_every and self.posted % self.verify_every == 0:
+            expected = self.count_after(job.last)
+            count = settle_count(self.count_posts, expected, sleep=self._stopping.wait)
+            if count is None:
+                # The count could not be read this time, the next check catches up
+                self.log(f"⚠️  Could not verify the post count after index {job.last}")
+            elif count != expected:
+                # This post is live, stop with the next one
+                error = PipelineError(f"Expected {expected} posts after index {job.last}, found {count}")
+                self._fail('configure', job.last + 1, error)
+
+    def count_after(self, index):
+        """Post count of the account once the post ending at `index` is live"""
+        return self.layout.count_after(index)
+
+    def _is_posted(self, index):
+        """
+        True when the post for `index` is live, None when the count cannot
+        tell: a post that is missing from the count may still show up later
+        """
+        if self.count_posts is None:
+            return None
+        after = self.count_after(index)
+        return True if settle_count(self.count_posts, after, sleep=self._stopping.wait) == after else None
+
+    # Plumbing
+
+    def _put(self, outbox, item):
+        while True:
+            try:
+                outbox.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if self._stopping.is_set():
+                    return False
+
+    def _get(self, inbox):
+        while True:
+            try:
+                return inbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return _END
+
+    def _cancelled(self, index):
+        return self._stop_index is not None and index >= self._stop_index
+
+    def _fail(self, name, index, error):
+        """Remember the earliest failure, nothing from its index on is posted"""
+        if self._stop_index is None or index < self._stop_index:
+            self._stop_index = index
+            self._error = PipelineError(f"{name} stage failed at index {index}: {error}")
+            self._error.__cause__ = error
+
+    def _timed(self, name, work, job):
+        started = time.perf_counter()
+        work(job)
+        elapsed = time.perf_counter() - started
+        job.timings[name] = elapsed
+        self.stats[name].add(elapsed)
+
+    def _source(self, start, stop, outbox):
+        index = start
+        while index < stop:
+            if self._stopping.is_set() or self._cancelled(index):
+                break
+            try:
+                job = PostJob(index, min(self.layout.post_size(index), stop - index))
+                self._timed('prepare', self.prepare, job)
+            except BaseException as e:
+                # Even SystemExit must not end the thread without stopping the stages after it
+                self._fail('prepare', index, e)
+                break
+            if not self._put(outbox, job):
+                break
+            index += job.size
+        self._put(outbox, _END)
+
+    def _stage(self, name, work, inbox, outbox):
+        while True:
+            job = self._get(inbox)
+            if job is _END:
+                break
+            if self._cancelled(job.index):
+                continue
+            try:
+                self._timed(name, work, job)
+            except BaseException as e:
+                self._fail(name, job.index, e)
+                continue
+            if outbox is not None and not self._put(outbox, job):
+                break
+        if outbox is not None:
+            self._put(outbox, _END)
+
+    def run(self, start, stop):
+        """
+        Post indices start .. stop - 1 and return how many were posted.
+        Raises PipelineError after draining the stages if one of them failed.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        threads = [
+            threading.Thread(target=self._source, args=(start, stop, queues[0]), name='prepare'),
+            threading.Thread(target=self._stage, args=('payload', self.payload, queues[0], queues[1]), name='payload'),
+            threading.Thread(target=self._stage, args=('upload', self.upload, queues[1], queues[2]), name='upload'),
+            threading.Thread(target=self._stage, args=('configure', self.configure, queues[2], None), name='configure'),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            self._stopping.set()
+            for thread in threads:
+                thread.join()
+            raise
+
+        self.log("⏱️  " + " | ".join(str(self.stats[name]) for name in STAGES))
+        self.log(f"⏱️  {self.readiness}")
+        self.log(f"🚦 {get_governor()}")
+        if self._error is not None:
+            raise self._error
+        return self.posted
+
+
+# ENDOF FILE posting_pipeline.py
\ No newline at end of file
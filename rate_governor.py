@@ -0,0 +1,279 @@
+'''
+Token-bucket rate governor for the Instagram endpoint classes.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+Every request to rupload, configure, graphql or the profile page (and the
+search that stands in for it) first takes a token from its class's bucket,
+and its answer is fed back:
+- a 2xx raises the rate additively, by RATE_STEP of the starting rate
+  every INCREASE_EVERY answers, up to the class's maximum;
+- a 429 or feedback_required halves the rate (down to the minimum) and
+  blocks the class for the Retry-After time, or RATE_LIMIT_PENALTY /
+  FEEDBACK_PENALTY when the server does not say.
+
+So the rates climb towards the highest one Instagram tolerates and back off
+when it pushes back. Rates and blocks are saved to STATE_FILE, a restart
+keeps the learned rates and does not walk into a block. PI_RATE_SCALE
+multiplies every limit.
+
+EX USAGE:
+python rate_governor.py            # show the saved state
+python rate_governor.py --reset    # forget it
+
+'''
+import json
+import os
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from retry_policy import RETRYABLE, EndpointError
+
+STATE_FILE = os.getenv('PI_RATE_STATE', 'rate_governor.json')
+
+# Starting, minimum and maximum requests per second of each endpoint class
+LIMITS = {
+    'rupload': (0.1, 1 / 600, 1.0),
+    'configure': (0.05, 1 / 600, 0.5),
+    'graphql': (0.2, 1 / 600, 2.0),
+    'profile': (0.2, 1 / 600, 2.0),
+}
+
+# Every rate of LIMITS is multiplied by this (a large scale runs unthrottled against the stand-in)
+RATE_SCALE = float(os.getenv('PI_RATE_SCALE', '1'))
+
+# Requests that can go out back to back after an idle spell
+BURST = 2
+
+# Additive increase: RATE_STEP of the starting rate every INCREASE_EVERY answers
+RATE_STEP = 0.1
+INCREASE_EVERY = 10
+
+# Multiplicative decrease on a 429 or feedback_required
+DECREASE_FACTOR = 0.5
+
+# Seconds a class is blocked when the server does not send Retry-After
+RATE_LIMIT_PENALTY = 60.0
+FEEDBACK_PENALTY = 3600.0
+
+# Longest wait acquire() sits out, a longer block raises RateLimitedError
+MAX_WAIT = 300.0
+
+# Seconds between saves of the state when nothing was throttled
+SAVE_INTERVAL = 30.0
+
+
+class RateLimitedError(EndpointError):
+    """The endpoint class is blocked for longer than the caller may wait"""
+
+    def __init__(self, endpoint, wait):
+        super().__init__(endpoint, f"rate limited for another {wait:.0f}s", RETRYABLE, 429, retry_after=wait)
+
+
+def parse_retry_after(value, now=None):
+    """Seconds from a Retry-After header (delay or HTTP date), None if absent"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - (now or time.time()), 0.0)
+
+
+def is_feedback_required(response_json):
+    """Check whether an answer is Instagram's "action blocked" response"""
+    if not isinstance(response_json, dict):
+        return False
+    return 'feedback_required' in str(response_json.get('message', '')) or bool(response_json.get('spam'))
+
+
+class TokenBucket:
+    """Bucket of one endpoint class, with its AIMD rate and block"""
+
+    def __init__(self, name, rate, min_rate, max_rate, burst=BURST):
+        self.name = name
+        self.initial_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self.successes = 0
+        self.limited = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token can be taken"""
+        self.refill(now)
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def increase(self):
+        self.successes += 1
+        if self.successes % INCREASE_EVERY == 0:
+            self.rate = min(self.max_rate, self.rate + self.initial_rate * RATE_STEP)
+
+    def decrease(self, now, block):
+        self.limited += 1
+        self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+        self.tokens = min(self.tokens, 0.0)
+        self.blocked_until = max(self.blocked_until, now + block)
+
+    def to_dict(self):
+        return {'rate': self.rate, 'blocked_until': self.blocked_until, 'successes': self.successes,
+                'limited': self.limited}
+
+    def load(self, state):
+        self.rate = min(self.max_rate, max(self.min_rate, state.get('rate', self.rate)))
+        self.blocked_until = state.get('blocked_until', 0.0)
+        self.successes = state.get('successes', 0)
+        self.limited = state.get('limited', 0)
+
+
+class RateGovernor:
+    """
+    One TokenBucket per endpoint class. acquire() before a request,
+    observe() with its answer.
+    """
+
+    def __init__(self, limits=LIMITS, state_file=STATE_FILE, sleep=time.sleep, scale=RATE_SCALE):
+        self.buckets = {name: TokenBucket(name, *(rate * scale for rate in limit)) for name, limit in limits.items()}
+        self.state_file = state_file
+        self.sleep = sleep
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        # Threads observing at once must not share the temporary file
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Ignoring rate state in {self.state_file}: {e}")
+            return
+        for name, bucket_state in state.get('buckets', {}).items():
+            if name in self.buckets:
+                self.buckets[name].load(bucket_state)
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self._save_lock:
+            with self._lock:
+                state = {'saved_at': time.time(), 'buckets': {name: b.to_dict() for name, b in self.buckets.items()}}
+                self._saved_at = time.monotonic()
+            temporary = f"{self.state_file}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(temporary, self.state_file)
+
+    def acquire(self, endpoint, max_wait=MAX_WAIT):
+        """
+        Take a token for `endpoint`, sleeping until there is one. Raises
+        RateLimitedError instead when that is more than `max_wait` away.
+        """
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = bucket.wait_time(now)
+                if not wait:
+                    bucket.tokens -= 1
+                    return
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitedError(endpoint, wait)
+            self.sleep(wait)
+
+    def observe(self, endpoint, status_code, headers=None, response_json=None):
+        """Feed back the answer to a request made with a token of `endpoint`"""
+        bucket = self.buckets.get(endpoint)
+        if bucket is None or status_code is None:
+            return
+        retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+        feedback = is_feedback_required(response_json)
+        limited = status_code == 429 or feedback or (retry_after is not None and status_code == 503)
+
+        with self._lock:
+            if limited:
+                block = retry_after if retry_after is not None else (
+                    FEEDBACK_PENALTY if feedback else RATE_LIMIT_PENALTY)
+                bucket.decrease(time.time(), block)
+                print(f"🚦 {endpoint} rate limited ({'feedback_required' if feedback else status_code}), "
+                      f"pausing {block:.0f}s at {bucket.rate * 86400:.0f}/day")
+            elif status_code < 400:
+                bucket.increase()
+            due = limited or time.monotonic() - self._saved_at > SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def observe_response(self, endpoint, response):
+        """observe() for a requests Response"""
+        try:
+            response_json = response.json() if response.status_code >= 400 else None
+        except ValueError:
+            response_json = None
+        self.observe(endpoint, response.status_code, response.headers, response_json)
+
+    def blocked_for(self, endpoint=None):
+        """Seconds until `endpoint` (or every class) is unblocked"""
+        names = [endpoint] if endpoint else list(self.buckets)
+        with self._lock:
+            blocked_until = max(self.buckets[name].blocked_until for name in names)
+        return max(blocked_until - time.time(), 0.0)
+
+    def __str__(self):
+        now = time.time()
+        parts = []
+        for name, bucket in self.buckets.items():
+            part = f"{name} {bucket.rate * 86400:.0f}/day"
+            if bucket.blocked_until > now:
+                part += f" (blocked {bucket.blocked_until - now:.0f}s)"
+            parts.append(part)
+        return "rates: " + " | ".join(parts)
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Get the RateGovernor shared by every caller in the process"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = RateGovernor()
+    return _governor
+
+
+if __name__ == "__main__":
+    if '--reset' in sys.argv[1:]:
+        if os.path.exists(STATE_FILE):
+            os.remove(STATE_FILE)
+        print(f"🗑️  Removed {STATE_FILE}")
+    else:
+        print(get_governor())
+
+
+# ENDOF FILE rate_governor.py
@@ -0,0 +1,338 @@
+'''
+Retries, exponential backoff and circuit breakers for the Instagram endpoints.
+
+Author: Efe Sirin
+Date: 2025-06-06
+
+RetryPolicy.call() runs one endpoint call and sorts its failure into:
+- retryable: connection problems, timeouts, 408/429/5xx, feedback_required
+  and answers that are not JSON. Retried after an exponential backoff with
+  full jitter, or the error's retry_after when that is longer.
+- fatal: the server refused the request (login_required, checkpoint,
+  other 4xx) or the code failed. Raised at once.
+- ambiguous: a retryable failure after the request may have been acted on
+  (a timeout or 5xx on configure). Calls with side effects are marked
+  idempotent=False and are only retried when `verify` proves that the
+  first try did not go through, so a retried configure never double-posts.
+
+Retries stop when the call runs out of attempts or time, or when the
+RetryBudget shared by the calls of one post is spent. Each endpoint has a
+CircuitBreaker: after FAILURE_THRESHOLD retryable failures in a row it opens
+and calls wait (within their budget) until it lets a probe through; every
+further trip doubles the wait up to MAX_RESET_TIMEOUT.
+
+EX USAGE:
+from retry_policy import get_policy
+result = get_policy().call_result('configure', configure_instagram_post, session, upload_id, caption)
+
+'''
+import random
+import threading
+import time
+
+import requests
+
+# Tries of one call
+MAX_ATTEMPTS = 5
+
+# Backoff before retry n is uniform in [0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** n)]
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# Seconds one call may spend retrying
+CALL_BUDGET = 300.0
+
+# Retries and seconds shared by the calls of one post
+ITERATION_RETRIES = 12
+ITERATION_SECONDS = 900.0
+
+# Retryable failures in a row that open a circuit, and how long it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+MAX_RESET_TIMEOUT = 900.0
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+FATAL_MESSAGES = ('login_required', 'checkpoint_required', 'challenge_required', 'consent_required')
+
+RETRYABLE, FATAL, AMBIGUOUS = 'retryable', 'fatal', 'ambiguous'
+
+
+class EndpointError(Exception):
+    """
+    A failed endpoint call. `kind` is RETRYABLE, FATAL or AMBIGUOUS,
+    `response` the decoded JSON answer, if there was one, and `retry_after`
+    the seconds to wait before trying again, if known.
+    """
+
+    def __init__(self, endpoint, message, kind=FATAL, status_code=None, response=None, retry_after=None):
+        super().__init__(f"{endpoint}: {message}")
+        self.endpoint = endpoint
+        self.kind = kind
+        self.status_code = status_code
+        self.response = response
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.kind != FATAL
+
+
+class RetriesExhaustedError(EndpointError):
+    """A retryable failure that ran out of attempts or budget"""
+
+
+class CircuitOpenError(EndpointError):
+    """The endpoint's circuit stayed open for the whole call budget"""
+
+
+def _fatal_message(response):
+    if not isinstance(response, dict):
+        return None
+    if response.get('require_login'):
+        return 'login_required'
+    text = f"{response.get('message', '')} {response.get('error_type', '')}".lower()
+    return next((message for message in FATAL_MESSAGES if message in text), None)
+
+
+def classify_response(status_code, response, sent=True):
+    """Kind of a failed answer from its HTTP status and JSON body"""
+    if _fatal_message(response):
+        return FATAL
+    if status_code in (408, 429) or (isinstance(response, dict) and 'feedback_required' in str(response.get('message'))):
+        # Refused before being acted on, the rate governor holds off the next try
+        return RETRYABLE
+    if status_code is None or status_code in RETRYABLE_STATUS or status_code >= 500:
+        return AMBIGUOUS if sent else RETRYABLE
+    if status_code >= 400:
+        return FATAL
+    # A 2xx/3xx that did not succeed, usually a page instead of JSON
+    return AMBIGUOUS
+
+
+def classify_exception(endpoint, error):
+    """Turn any exception raised by an endpoint call into an EndpointError"""
+    if isinstance(error, EndpointError):
+        return error
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        try:
+            response = error.response.json()
+        except ValueError:
+            response = None
+        return EndpointError(endpoint, str(error), classify_response(status_code, response), status_code, response)
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        # Nothing was sent
+        return EndpointError(endpoint, str(error), RETRYABLE)
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError)):
+        return EndpointError(endpoint, str(error), AMBIGUOUS)
+    return EndpointError(endpoint, f"{type(error).__name__}: {error}", FATAL)
+
+
+def raise_for_result(endpoint, result):
+    """
+    Raise an EndpointError for a failed result dict of instagram_poster
+    ('success', 'status_code', 'response', 'error', 'sent'), return it
+    otherwise
+    """
+    if result.get('success'):
+        return result
+    response = result.get('response')
+    if result.get('not_ready'):
+        kind = RETRYABLE
+    else:
+        kind = classify_response(result.get('status_code'), response, result.get('sent', True))
+    message = result.get('error') or (response.get('message') if isinstance(response, dict) else None)
+    raise EndpointError(endpoint, message or 'request failed', kind, result.get('status_code'), response)
+
+
+class RetryBudget:
+    """Retries and time shared by the calls of one post, which may run at once"""
+
+    def __init__(self, max_retries=ITERATION_RETRIES, max_seconds=ITERATION_SECONDS):
+        self.max_retries = max_retries
+        self.deadline = time.monotonic() + max_seconds
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def allows(self, delay):
+        return self.retries < self.max_retries and delay < self.remaining()
+
+    def spend(self):
+        with self._lock:
+            self.retries += 1
+
+
+class CircuitBreaker:
+    """Closed, open or half-open state of one endpoint"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_reset_timeout=MAX_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.trips = 0
+        self._open_until = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._open_until is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() >= self._open_until else 'open'
+
+    def wait_time(self):
+        """
+        0 when a call may go ahead, otherwise seconds until it may. Once open,
+        a single probe is let through when the timeout ends.
+        """
+        with self._lock:
+            if self._open_until is None:
+                return 0.0
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._probing:
+                return min(self.base_reset_timeout, 1.0)
+            self._probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._open_until = None
+            self._probing = False
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing:
+                # The probe failed, stay open for longer
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold:
+                return
+            self._probing = False
+            self._open_until = time.monotonic() + self.reset_timeout
+            self.trips += 1
+            print(f"⚡ Circuit for {self.name} open for {self.reset_timeout:.0f}s after {self.failures} failures")
+
+    def release_probe(self):
+        """Give the probe slot back after a call that said nothing about health"""
+        with self._lock:
+            self._probing = False
+
+
+class RetryPolicy:
+    """Retry loop with one CircuitBreaker per endpoint"""
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF,
+                 call_budget=CALL_BUDGET, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.call_budget = call_budget
+        self.sleep = sleep
+        self.breakers = {}
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(endpoint)
+            return self.breakers[endpoint]
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _wait_for_circuit(self, endpoint, breaker, deadline, budget):
+        while True:
+            wait = breaker.wait_time()
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline or (budget is not None and wait >= budget.remaining()):
+                raise CircuitOpenError(endpoint, f"circuit open for another {wait:.0f}s", RETRYABLE)
+            self.sleep(wait)
+
+    def call(self, endpoint, fn, *args, budget=None, idempotent=True, verify=None, **kwargs):
+        """
+        Call fn(*args, **kwargs) for `endpoint` and return its value,
+        retrying retryable failures. Raises an EndpointError otherwise.
+
+        With idempotent=False an ambiguous failure is retried only when
+        verify() returns False (the call did not take effect). When it
+        returns True, the call did go through and {'success': True,
+        'verified': True} is returned; when there is no verify or it cannot
+        tell (None), the failure is raised.
+        """
+        breaker = self.breaker(endpoint)
+        deadline = time.monotonic() + self.call_budget
+        attempt = 0
+        while True:
+            self._wait_for_circuit(endpoint, breaker, deadline, budget)
+            try:
+                value = fn(*args, **kwargs)
+            except Exception as e:
+                error = classify_exception(endpoint, e)
+                if error is not e:
+                    error.__cause__ = e
+            else:
+                breaker.record_success()
+                return value
+
+            if error.kind == FATAL:
+                # The endpoint answered, its health is fine
+                breaker.release_probe()
+                raise error
+            breaker.record_failure()
+
+            if error.kind == AMBIGUOUS and not idempotent:
+                done = verify() if verify is not None else None
+                if done:
+                    print(f"🔎 {endpoint} failed ({error}) but went through, not retrying")
+                    return {'success': True, 'verified': True}
+                if done is None:
+                    raise error
+
+            attempt += 1
+            delay = max(self.backoff(attempt), error.retry_after or 0)
+            if (attempt >= self.max_attempts or time.monotonic() + delay > deadline
+                    or (budget is not None and not budget.allows(delay))):
+                exhausted = RetriesExhaustedError(endpoint, f"gave up after {attempt} tries: {error}", error.kind,
+                                                  error.status_code, error.response, error.retry_after)
+                raise exhausted from error
+            if budget is not None:
+                budget.spend()
+            with self._lock:
+                self.retries += 1
+            print(f"🔁 {endpoint} failed ({error}), retry {attempt} in {delay:.1f}s")
+            self.sleep(delay)
+
+    def call_result(self, endpoint, fn, *args, **kwargs):
+        """call() for functions that return a result dict with 'success'"""
+        return self.call(endpoint, lambda: raise_for_result(endpoint, fn(*args)), **kwargs)
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_policy():
+    """Get the RetryPolicy shared by every caller in the process"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = RetryPolicy()
+    return _policy
+
+
+# ENDOF FILE retry_policy.py